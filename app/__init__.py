@@ -1,8 +1,8 @@
 import os
 from flask import Flask, render_template
-from app.models import User
+from werkzeug.middleware.proxy_fix import ProxyFix
 from .config import Config, BASE_DIR
-from .extensions import db
+from .extensions import instrumentation
 from flask_login import LoginManager, login_required, current_user
 
 login_manager = LoginManager()
@@ -14,25 +14,52 @@ def create_app(config_class: type = Config):
     # Create necessary directories
     os.makedirs(app.instance_path, exist_ok=True)
     os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+
+    hops = app.config['PROXY_FIX_HOPS']
+    if hops:
+        # request.remote_addr becomes the client's address, as seen by the outermost trusted proxy
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=hops, x_proto=hops, x_host=hops)
     
-    db.init_app(app)
+    from . import database, storage
+    database.init_app(app)
+    storage.init_app(app)
+    instrumentation.init_app(app)
     @app.get("/health")
     def health():
         return "ok", 200
     
+    from . import hashing, throttle
+    hashing.init_app(app)
+    throttle.init_app(app)
+
     login_manager.init_app(app)
     login_manager.login_view = "auth.login"
 
-    @login_manager.user_loader
-    def load_user(user_id):
-        return User.query.get(int(user_id))
+    from . import principal
+    principal.init_app(app)
+    login_manager.user_loader(principal.load_principal)
     
+    from . import topic_tree
+    topic_tree.init_app(app)
+
+    from . import rendering
+    rendering.init_app(app)
+
+    # Register the events that keep the topic closure table and dashboard counters current
+    from . import topic_closure, topic_stats
+    app.jinja_env.globals['topic_counts'] = topic_stats.for_user
+
+    from . import quota
+    quota.init_app(app)
+
+    from . import fragment_cache
+    fragment_cache.init_app(app)
+
     @app.route("/dashboard")
     @login_required
     def dashboard():
-        from .models import Topic
-        all_topic = Topic.query.filter_by(user_id=current_user.id, parent_topic_id=None).order_by(Topic.created_at.desc()).all()
-        return render_template("dashboard.html", all_topic=all_topic, current_topic=None, active_panel='topic')
+        from .topic import get_all_user_topic
+        return render_template("dashboard.html", all_topic=get_all_user_topic(), current_topic=None, active_panel='topic')
         
     from .routes import bp
     app.register_blueprint(bp)
@@ -49,4 +76,30 @@ def create_app(config_class: type = Config):
     from .resource import bp as resource
     app.register_blueprint(resource)
 
+    from .search import bp as search
+    app.register_blueprint(search)
+
+    from .review import bp as review
+    app.register_blueprint(review)
+
+    from .api import bp as api
+    app.register_blueprint(api)
+
+    from .transfer import bp as transfer
+    app.register_blueprint(transfer)
+
+    from . import generation
+    generation.init_app(app)
+    app.register_blueprint(generation.bp)
+
+    from .metrics import bp as metrics
+    app.register_blueprint(metrics)
+
+    # Background jobs (PDF processing and link fetch handlers register on import)
+    from . import jobs, links, processing
+    jobs.init_app(app)
+
+    if app.config['TEMPLATE_PRECOMPILE']:
+        fragment_cache.precompile_templates(app)
+
     return app
\ No newline at end of file
@@ -0,0 +1,152 @@
+import base64
+import json
+from datetime import datetime
+from flask import Blueprint, jsonify, request
+from flask_login import current_user, login_required
+from sqlalchemy import select, tuple_
+from . import topic_closure
+from .extensions import db
+from .models import Flashcard, Note, Resource, Topic
+
+bp = Blueprint('api', __name__, url_prefix='/api/v1')
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+# Fields each listing can return, and the ones returned when ?fields= is absent
+FIELDS = {
+    Topic: (
+        ('id', 'name', 'description', 'parent_topic_id', 'created_at', 'updated_at'),
+        ('id', 'name', 'parent_topic_id', 'created_at'),
+    ),
+    Resource: (
+        ('id', 'topic_id', 'title', 'resource_type', 'url', 'original_filename', 'file_size',
+         'page_count', 'status', 'created_at', 'updated_at'),
+        ('id', 'topic_id', 'title', 'resource_type', 'status', 'created_at'),
+    ),
+    Note: (
+        ('id', 'topic_id', 'title', 'content', 'is_ai_generated', 'revision', 'created_at', 'updated_at'),
+        ('id', 'topic_id', 'title', 'created_at', 'updated_at'),
+    ),
+    Flashcard: (
+        ('id', 'topic_id', 'question', 'answer', 'difficulty', 'next_review_at', 'created_at'),
+        ('id', 'topic_id', 'question', 'created_at'),
+    ),
+}
+
+
+class BadRequest(ValueError):
+    pass
+
+
+def encode_cursor(created_at, item_id):
+    raw = json.dumps([created_at.isoformat() if created_at else None, item_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        created_at, item_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return datetime.fromisoformat(created_at), int(item_id)
+    except (ValueError, TypeError):
+        raise BadRequest("invalid cursor")
+
+
+def _fields(model):
+    allowed, default = FIELDS[model]
+    requested = request.args.get('fields')
+    if not requested:
+        return default
+    fields = tuple(dict.fromkeys(f.strip() for f in requested.split(",") if f.strip()))
+    unknown = [f for f in fields if f not in allowed]
+    if unknown:
+        raise BadRequest(f"unknown fields: {', '.join(unknown)}")
+    return fields
+
+
+def _limit():
+    try:
+        limit = int(request.args.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        raise BadRequest("limit must be an integer")
+    return max(1, min(limit, MAX_LIMIT))
+
+
+def _serialise(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def page(model, *criteria):
+    """One page of a model's rows, newest first, keyed on (created_at, id)"""
+    fields = _fields(model)
+    limit = _limit()
+    # The cursor columns are always read, whether or not they are returned
+    columns = list(dict.fromkeys(fields + ('created_at', 'id')))
+
+    statement = (
+        select(*(getattr(model, name) for name in columns))
+        .where(model.user_id == current_user.id, *criteria)
+        .order_by(model.created_at.desc(), model.id.desc())
+        .limit(limit + 1)
+    )
+    cursor = request.args.get('cursor')
+    if cursor:
+        statement = statement.where(tuple_(model.created_at, model.id) < decode_cursor(cursor))
+
+    rows = db.session.execute(statement).all()
+    more = len(rows) > limit
+    rows = rows[:limit]
+    return {
+        'items': [{name: _serialise(getattr(row, name)) for name in fields} for row in rows],
+        'next_cursor': encode_cursor(rows[-1].created_at, rows[-1].id) if more else None,
+    }
+
+
+def _in_topic(model, topic_id):
+    """Rows filed directly under a topic, or anywhere in its subtree with ?subtree=1"""
+    if request.args.get('subtree') in ('1', 'true'):
+        return topic_closure.under(model, topic_id)
+    return model.topic_id == topic_id
+
+
+def _respond(model, *criteria):
+    try:
+        response = jsonify(page(model, *criteria))
+    except BadRequest as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    # Clients revalidate every time and get a 304 when the page is unchanged
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.add_etag()
+    return response.make_conditional(request)
+
+
+@bp.route("/topics")
+@login_required
+def list_topics():
+    """Root topics, or the children of ?parent_id="""
+    parent_id = request.args.get('parent_id', type=int)
+    return _respond(Topic, Topic.parent_topic_id == parent_id if parent_id else Topic.parent_topic_id.is_(None))
+
+
+@bp.route("/topics/<int:topic_id>/subtopics")
+@login_required
+def list_subtopics(topic_id):
+    return _respond(Topic, Topic.parent_topic_id == topic_id)
+
+
+@bp.route("/topics/<int:topic_id>/resources")
+@login_required
+def list_resources(topic_id):
+    return _respond(Resource, _in_topic(Resource, topic_id))
+
+
+@bp.route("/topics/<int:topic_id>/notes")
+@login_required
+def list_notes(topic_id):
+    return _respond(Note, _in_topic(Note, topic_id))
+
+
+@bp.route("/topics/<int:topic_id>/flashcards")
+@login_required
+def list_flashcards(topic_id):
+    return _respond(Flashcard, _in_topic(Flashcard, topic_id))
@@ -1,10 +1,12 @@
 import functools
+import math
 import re
 from flask import (
     Blueprint, flash, g, redirect, render_template, request, session, url_for
 )
-from werkzeug.security import check_password_hash, generate_password_hash
 from app.models import User
+from .hashing import HashingBusy, hash_password, needs_rehash, verify_password
+from .throttle import login_retry_after
 from sqlalchemy.exc import IntegrityError
 from .extensions import db
 from sqlalchemy import text
@@ -40,11 +42,14 @@ def register():
 
     if not errors:
         try:
-            hashed_password = generate_password_hash(password)
+            hashed_password = hash_password(password)
             new_user = User(username=username, email=email, password=hashed_password)
             db.session.add(new_user)
             db.session.commit()
             return redirect(url_for('main.home'))
+        except HashingBusy:
+            errors.append("The server is busy, please try again in a moment")
+            return render_template("register.html", errors=errors), 503, {'Retry-After': '5'}
         except IntegrityError:
             db.session.rollback()
             errors.append("That username or email is already registered")
@@ -66,9 +71,31 @@ def login():
             errors.append("Password is required")
         if not re.match(r"^[^@\s]+@[^@\s]+\.[^@\s]+$", email):
             errors.append("Enter a valid email address")      
-        if not errors:
-            user = User.query.filter_by(email=email).first()
-        if not user or not check_password_hash(user.password, password):
+        if errors:
+            return render_template("index.html", errors=errors)
+
+        # Throttle before touching the database or the (expensive) hash
+        retry_after = login_retry_after(request.remote_addr, email)
+        if retry_after:
+            errors.append("Too many login attempts, please wait and try again")
+            return render_template("index.html", errors=errors), 429, {'Retry-After': str(math.ceil(retry_after))}
+
+        user = User.query.filter_by(email=email).first()
+        try:
+            valid = user is not None and verify_password(user.password, password)
+        except HashingBusy:
+            errors.append("The server is busy, please try again in a moment")
+            return render_template("index.html", errors=errors), 503, {'Retry-After': '5'}
+
+        if valid and needs_rehash(user.password):
+            # Upgrade hashes made with an older method or cost; retried next login if busy
+            try:
+                user.password = hash_password(password)
+                db.session.commit()
+            except HashingBusy:
+                pass
+
+        if not valid:
             errors.append("Invalid email or password")
         else:
             login_user(user)
@@ -0,0 +1,293 @@
+import hashlib
+import os
+import tempfile
+import time
+from flask import current_app
+from sqlalchemy import bindparam, delete, event, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from . import jobs
+from .extensions import db
+from .models import Blob, Resource
+from .storage import get_storage, staging_dir
+
+CHUNK_SIZE = 64 * 1024
+
+# session.info key holding files to unlink once the transaction commits
+_PENDING_KEY = "blobstore_pending"
+
+# Files derived from a blob and stored next to it (e.g. the PDF thumbnail)
+DERIVED_SUFFIXES = (".png",)
+
+
+def blob_path(sha256):
+    """Storage key of a blob: blobs/ab/cd/<sha256>"""
+    return os.path.join("blobs", sha256[:2], sha256[2:4], sha256)
+
+
+def _hash_stream(stream):
+    digest = hashlib.sha256()
+    size = 0
+    while True:
+        chunk = stream.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        digest.update(chunk)
+        size += len(chunk)
+    return digest.hexdigest(), size
+
+
+def _copy_to_temp(stream, tmp_dir):
+    """Stream into a temp file in fixed-size chunks, hashing as we go"""
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=tmp_dir, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                size += len(chunk)
+                out.write(chunk)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+    return tmp_path, digest.hexdigest(), size
+
+
+def store_upload(file):
+    """Store an uploaded file in the blob store and take a reference to it.
+
+    Returns (relative_path, sha256, size).
+    """
+    return store_stream(file.stream)
+
+
+def store_stream(stream):
+    """Store the contents of a binary stream and take a reference to it.
+
+    The stream is hashed first, so content that is already stored is
+    never written a second time, and a remote backend reads it straight
+    from the stream. Streams that cannot seek are staged under
+    UPLOAD_FOLDER/tmp first.
+
+    A Blob row is only deleted together with its file (see
+    _remove_files()), so an existing row means the file is there. If
+    taking the reference creates the row instead, a removal may have run
+    since the file was written, and the file is checked and rewritten.
+    """
+    if not getattr(stream, "seekable", lambda: False)():
+        tmp_path, _, _ = _copy_to_temp(stream, staging_dir())
+        try:
+            with open(tmp_path, "rb") as staged:
+                return store_stream(staged)
+        finally:
+            os.remove(tmp_path)
+
+    storage = get_storage()
+    sha256, size = _hash_stream(stream)
+    key = blob_path(sha256)
+    if not _has_row(sha256):
+        _write(storage, key, stream)
+    if add_reference(sha256, size) and not storage.exists(key):
+        _write(storage, key, stream)
+    return key, sha256, size
+
+
+def _has_row(sha256):
+    return db.session.execute(select(Blob.sha256).where(Blob.sha256 == sha256)).first() is not None
+
+
+def _write(storage, key, stream):
+    stream.seek(0)
+    if storage.local_path(key) is None:
+        storage.save_stream(key, stream)
+    else:
+        tmp_path, _, _ = _copy_to_temp(stream, staging_dir())
+        storage.save_file(key, tmp_path)
+
+
+def add_reference(sha256, size):
+    """Increment a blob's reference count, creating its row if needed.
+
+    Returns True if the row was created.
+    """
+    bump = update(Blob).where(Blob.sha256 == sha256).values(ref_count=Blob.ref_count + 1)
+    if db.session.execute(bump).rowcount:
+        return False
+
+    db.session.flush()
+    try:
+        with db.session.begin_nested():
+            db.session.add(Blob(sha256=sha256, size=size, ref_count=1))
+    except IntegrityError:
+        # Another request created the row first
+        db.session.execute(bump)
+        return False
+    return True
+
+
+def release(sha256):
+    """Drop one reference to a blob; the file and its row go once nothing points at it.
+
+    The row stays, at zero references, until _remove_files() deletes it
+    along with the file after the transaction commits.
+    """
+    db.session.execute(
+        update(Blob).where(Blob.sha256 == sha256).values(ref_count=Blob.ref_count - 1)
+    )
+    db.session.info.setdefault(_PENDING_KEY, set()).add(blob_path(sha256))
+
+
+def release_many(hash_counts):
+    """Drop several references at once: {sha256: number of references released}.
+
+    Returns the blob paths to remove; pass them to queue_removal() so the
+    files go in the background once the transaction commits.
+    """
+    if not hash_counts:
+        return []
+    blob = Blob.__table__
+    db.session.execute(
+        update(blob).where(blob.c.sha256 == bindparam("sha")).values(ref_count=blob.c.ref_count - bindparam("n")),
+        [{"sha": sha256, "n": n} for sha256, n in hash_counts.items()],
+    )
+    return [blob_path(sha256) for sha256 in hash_counts]
+
+
+def queue_removal(relative_paths):
+    """Queue a background job that removes these files after the transaction commits"""
+    if relative_paths:
+        jobs.enqueue("blobstore.remove_files", payload={'paths': sorted(relative_paths)})
+
+
+@jobs.job_handler("blobstore.remove_files")
+def _remove_files_job(payload):
+    _remove_files(payload['paths'])
+
+
+def release_resource_file(resource):
+    """Release the file behind a PDF resource"""
+    if resource.content_hash:
+        release(resource.content_hash)
+    elif resource.file_path:
+        # Saved before the blob store existed: owned by this resource alone
+        db.session.info.setdefault(_PENDING_KEY, set()).add(resource.file_path)
+
+
+def _delete_files(storage, relative_path):
+    for suffix in ("",) + DERIVED_SUFFIXES:
+        try:
+            storage.delete(relative_path + suffix)
+        except Exception as e:
+            current_app.logger.warning("Error deleting file %s: %s", relative_path, e)
+
+
+def _remove_files(relative_paths):
+    """Remove released files (and their derived files) that nothing references any more.
+
+    A blob's file goes in the same transaction that deletes its row, and
+    only if the row is still at zero references. An upload that takes a
+    new reference meanwhile either bumps the row first, so nothing is
+    removed, or waits for this transaction and then finds no row, so it
+    writes the file again.
+    """
+    storage = get_storage()
+    blob = Blob.__table__
+    for relative_path in relative_paths:
+        sha256 = os.path.basename(relative_path)
+        if relative_path != blob_path(sha256):
+            # Saved before the blob store existed: owned by one resource alone
+            _delete_files(storage, relative_path)
+            continue
+        with db.engine.begin() as connection:
+            claimed = connection.execute(
+                delete(blob).where(blob.c.sha256 == sha256, blob.c.ref_count <= 0)
+            ).rowcount
+            if claimed:
+                _delete_files(storage, relative_path)
+
+
+@event.listens_for(Session, "after_commit")
+def _remove_released_files(session):
+    # Savepoints fire this too; the outer transaction still holds the changes
+    if session.in_nested_transaction():
+        return
+    pending = session.info.pop(_PENDING_KEY, None)
+    if pending:
+        _remove_files(pending)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_released_files(session):
+    if session.in_nested_transaction():
+        return
+    session.info.pop(_PENDING_KEY, None)
+
+
+def collect_garbage(min_age, dry_run=False):
+    """Reconcile stored files and blob reference counts against the resource table.
+
+    Reference counts are recomputed from the resources that point at each
+    blob, missing blob rows are created, and files that no resource
+    references are removed. Files younger than min_age seconds are left
+    alone: they may belong to an upload whose transaction has not committed
+    yet. Returns (fixed blob rows, removed paths).
+    """
+    counts, sizes = {}, {}
+    for sha256, count, size in db.session.execute(
+        select(Resource.content_hash, func.count(), func.max(Resource.file_size))
+        .where(Resource.content_hash.is_not(None))
+        .group_by(Resource.content_hash)
+    ):
+        counts[sha256], sizes[sha256] = count, size
+    fixed = 0
+    known = set()
+    for sha256, ref_count in db.session.execute(select(Blob.sha256, Blob.ref_count)).all():
+        known.add(sha256)
+        actual = counts.get(sha256, 0)
+        if actual != ref_count:
+            fixed += 1
+            if not dry_run:
+                if actual:
+                    db.session.execute(update(Blob).where(Blob.sha256 == sha256).values(ref_count=actual))
+                else:
+                    db.session.execute(delete(Blob).where(Blob.sha256 == sha256))
+
+    # Without a row, the next upload of the same content would count one
+    # reference and releasing it would remove a file other resources use
+    missing = [sha256 for sha256 in counts if sha256 not in known]
+    fixed += len(missing)
+    if missing and not dry_run:
+        db.session.execute(insert(Blob), [
+            {'sha256': sha256, 'size': sizes[sha256] or 0, 'ref_count': counts[sha256]}
+            for sha256 in missing
+        ])
+
+    referenced = set()
+    for file_path, thumbnail_path in db.session.execute(
+        select(Resource.file_path, Resource.thumbnail_path)
+        .where(Resource.file_path.is_not(None))
+    ):
+        referenced.add(os.path.normpath(file_path))
+        referenced.update(os.path.normpath(file_path + suffix) for suffix in DERIVED_SUFFIXES)
+        if thumbnail_path:
+            referenced.add(os.path.normpath(thumbnail_path))
+
+    storage = get_storage()
+    cutoff = time.time() - min_age
+    removed = []
+    for relative_path, mtime in storage.keys():
+        if relative_path in referenced or mtime > cutoff:
+            continue
+        removed.append(relative_path)
+        if not dry_run:
+            storage.delete(relative_path)
+
+    if dry_run:
+        db.session.rollback()
+    else:
+        db.session.commit()
+    return fixed, removed
@@ -0,0 +1,123 @@
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """Bounded in-process cache with per-entry TTL"""
+
+    def __init__(self, max_entries=1024, default_ttl=None):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = ttl if ttl is not None else self.default_ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def incr(self, key):
+        with self._lock:
+            value, expires_at = self._data.get(key, (0, None))
+            self._data[key] = (value + 1, expires_at)
+            self._data.move_to_end(key)
+            return value + 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class RedisCache:
+    """Cache backend for any client speaking the Redis get/set/delete/incr API.
+
+    Values are pickled, so only use it with a Redis instance you trust.
+    Share one between workers to keep invalidation consistent across processes.
+    """
+
+    def __init__(self, client, prefix="studymate:", default_ttl=None):
+        self.client = client
+        self.prefix = prefix
+        self.default_ttl = default_ttl
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        return pickle.loads(raw) if raw is not None else None
+
+    def set(self, key, value, ttl=None):
+        ttl = ttl if ttl is not None else self.default_ttl
+        self.client.set(self.prefix + key, pickle.dumps(value), ex=int(ttl) if ttl else None)
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def incr(self, key):
+        return int(self.client.incr(self.prefix + key))
+
+
+class CacheStats:
+    """Hit/miss counters for one named cache"""
+
+    def __init__(self, name):
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+
+    def hit(self):
+        with self._lock:
+            self.hits += 1
+
+    def miss(self):
+        with self._lock:
+            self.misses += 1
+
+    def invalidated(self):
+        with self._lock:
+            self.invalidations += 1
+
+
+# Every CacheStats by name, for the /metrics endpoint
+stats = {}
+
+
+def cache_stats(name):
+    if name not in stats:
+        stats[name] = CacheStats(name)
+    return stats[name]
+
+
+def make_backend(app, max_entries, ttl):
+    """Build the backend selected by CACHE_BACKEND ("lru" or "redis")"""
+    if app.config.get('CACHE_BACKEND') == 'redis':
+        import redis
+
+        client = redis.Redis.from_url(app.config['CACHE_REDIS_URL'])
+        return RedisCache(client, default_ttl=ttl)
+    return LRUCache(max_entries=max_entries, default_ttl=ttl)
@@ -11,9 +11,144 @@ class Config:
     )
 
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # SQLite: applied on every connect. WAL lets readers run next to a writer and
+    # busy_timeout (ms) makes writers wait for the lock instead of failing
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", 5000)),
+        'mmap_size': 256 * 1024 * 1024,
+        'cache_size': -64000,  # negative means KiB, so 64MB
+        'foreign_keys': 'ON',
+    }
+
+    # PostgreSQL connection pool (per process) and server-side statement timeout
+    DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 10))
+    DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", 20))
+    DB_POOL_TIMEOUT = 30  # seconds to wait for a free connection
+    DB_POOL_RECYCLE = 1800  # seconds
+    DB_STATEMENT_TIMEOUT_MS = int(os.environ.get("DB_STATEMENT_TIMEOUT_MS", 30000))
     
+    # Password hashing runs in a process pool ("process") or inline ("inline", tests).
+    # The method must be werkzeug's full method string; other stored hashes are
+    # upgraded on the next successful login
+    PASSWORD_HASH_METHOD = os.environ.get("PASSWORD_HASH_METHOD", "scrypt:32768:8:1")
+    HASH_MODE = os.environ.get("HASH_MODE", "process")
+    HASH_WORKERS = int(os.environ.get("HASH_WORKERS", 2))
+    HASH_QUEUE_LIMIT = 16  # hashes queued or running before logins get a 503
+    HASH_TIMEOUT = 10  # seconds
+    HASH_NICE = 10  # lower CPU priority of the hash workers
+
+    # Login throttling: token buckets per client IP and per email (0 burst disables one)
+    LOGIN_IP_BURST = 20
+    LOGIN_IP_PER_MINUTE = 10
+    LOGIN_EMAIL_BURST = 5
+    LOGIN_EMAIL_PER_MINUTE = 2
+    LOGIN_THROTTLE_CACHE_SIZE = 100000  # tracked keys per process
+    # Reverse proxies in front of the app whose X-Forwarded-For/-Proto/-Host are
+    # trusted (0: none, when the app is reached directly). Behind a proxy every
+    # request otherwise comes from the proxy's address and shares one IP bucket
+    PROXY_FIX_HOPS = int(os.environ.get("PROXY_FIX_HOPS", 0))
+
+    # Notes: every Nth revision is stored as a full snapshot and older patches are compacted
+    NOTE_SNAPSHOT_EVERY = 50
+    NOTE_HISTORY_SNAPSHOTS = 20  # history older than the newest N snapshots is dropped
+    # Markdown: rendered HTML is stored on the note when its content changes and
+    # memoised per process by content hash
+    NOTE_PERSIST_RENDERED = True
+    MARKDOWN_CACHE_SIZE = 2000  # rendered documents and previews
+
     # File Upload Settings
     UPLOAD_FOLDER = os.path.join(BASE_DIR, 'instance', 'uploads')
     MAX_CONTENT_LENGTH = 50 * 1024 * 1024  # 50MB max file size
     ALLOWED_EXTENSIONS = {'pdf'}
-    
\ No newline at end of file
+    # Total bytes of PDFs each user may store (see quota.py); 0 for no limit
+    STORAGE_QUOTA_BYTES = int(os.environ.get("STORAGE_QUOTA_BYTES", 500 * 1024 * 1024))
+    # Room left in an upload's Content-Length for the form fields around the file
+    STORAGE_QUOTA_FORM_OVERHEAD = 64 * 1024
+
+    # Where uploaded files are stored: "local" (UPLOAD_FOLDER) or "s3" (any
+    # S3-compatible bucket, needs the boto3 package). UPLOAD_FOLDER/tmp is
+    # still used to stage uploads while they are hashed.
+    STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "local")
+    S3_BUCKET = os.environ.get("S3_BUCKET")
+    S3_PREFIX = os.environ.get("S3_PREFIX", "")
+    S3_ENDPOINT_URL = os.environ.get("S3_ENDPOINT_URL")  # e.g. http://minio:9000; None for AWS
+    S3_REGION = os.environ.get("S3_REGION")
+    S3_ACCESS_KEY_ID = os.environ.get("S3_ACCESS_KEY_ID")  # None falls back to the usual AWS credential chain
+    S3_SECRET_ACCESS_KEY = os.environ.get("S3_SECRET_ACCESS_KEY")
+    S3_ADDRESSING_STYLE = os.environ.get("S3_ADDRESSING_STYLE", "auto")  # "path" for most MinIO setups
+    S3_MULTIPART_THRESHOLD = 8 * 1024 * 1024  # bytes; larger uploads go up in parts
+    S3_MULTIPART_CHUNKSIZE = 8 * 1024 * 1024  # bytes per part
+    S3_MAX_CONCURRENCY = 4  # parts in flight per upload
+    S3_PRESIGN_EXPIRES = 300  # seconds a download link stays valid
+
+    # PDF downloads with local storage: "direct" (served by the app), "x-accel" (nginx) or "x-sendfile"
+    DOWNLOAD_MODE = os.environ.get("DOWNLOAD_MODE", "direct")
+    DOWNLOAD_ACCEL_PREFIX = os.environ.get("DOWNLOAD_ACCEL_PREFIX", "/protected-uploads/")
+
+    # Background jobs: "thread" runs a worker pool in-process, "sync" runs jobs inline (tests)
+    JOBS_MODE = os.environ.get("JOBS_MODE", "thread")
+    JOBS_WORKERS = int(os.environ.get("JOBS_WORKERS", 2))
+    JOBS_POLL_INTERVAL = 2.0  # seconds
+    JOBS_MAX_ATTEMPTS = 5
+    JOBS_BACKOFF_SECONDS = 5  # doubled after every failed attempt
+    JOBS_LEASE_SECONDS = 600  # running jobs older than this are re-queued
+
+    # Search: "auto" uses the SQLite FTS5 index when present, "like" forces the plain fallback
+    SEARCH_ENGINE = os.environ.get("SEARCH_ENGINE", "auto")
+
+    # Caches: "lru" (per process) or "redis" (shared, needs the redis package)
+    CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "lru")
+    CACHE_REDIS_URL = os.environ.get("CACHE_REDIS_URL", "redis://localhost:6379/0")
+    TOPIC_TREE_CACHE_SIZE = 10000  # users
+    TOPIC_TREE_CACHE_TTL = 300  # seconds, a safety net behind event invalidation
+    PRINCIPAL_CACHE_SIZE = 10000  # signed-in users whose identity skips the user_table lookup
+    PRINCIPAL_CACHE_TTL = 60  # seconds
+
+    # {% cache %} template fragments (see fragment_cache.py)
+    FRAGMENT_CACHE_ENABLED = True
+    FRAGMENT_CACHE_SIZE = 5000  # fragments
+    FRAGMENT_CACHE_TTL = 600  # seconds, a safety net behind event invalidation
+    # Compiled templates are written here and reused across restarts; None keeps them in memory only
+    TEMPLATE_BYTECODE_CACHE_DIR = os.path.join(BASE_DIR, 'instance', 'jinja_cache')
+    TEMPLATE_PRECOMPILE = True  # compile every template at startup
+
+    # Levels of subtopics below a root topic
+    TOPIC_MAX_DEPTH = 32
+
+    # Topic ids per DELETE ... IN (...) when removing a subtree (see subtree.py)
+    TOPIC_DELETE_BATCH_SIZE = 500
+    # The orphan file collector leaves files younger than this alone, since
+    # they may belong to an upload that has not committed yet
+    ORPHAN_FILE_MIN_AGE = 3600  # seconds
+
+    # Link previews (see links.py)
+    LINK_FETCH_CONCURRENCY = 20  # open connections per fetch run
+    LINK_FETCH_PER_HOST = 2  # requests in flight to any one host
+    LINK_FETCH_TIMEOUT = 10  # seconds, per request
+    LINK_FETCH_MAX_BYTES = 256 * 1024  # of a page read while looking for its <head>
+    LINK_FETCH_BATCH_SIZE = 100  # URLs claimed per run
+    LINK_METADATA_TTL = 7 * 24 * 3600  # seconds before a page is revalidated
+    # Off so user-supplied URLs cannot reach loopback or internal addresses
+    LINK_FETCH_ALLOW_PRIVATE = False
+    LINK_FETCH_USER_AGENT = "StudyMate link preview"
+
+    # Exercise generation (see generation.py)
+    GENERATION_PROVIDER = os.environ.get("GENERATION_PROVIDER", "stub")
+    GENERATION_BATCH_SIZE = 16  # requests per provider call
+    GENERATION_BATCH_WINDOW = 0.05  # seconds the batcher waits for more requests to join a call
+    GENERATION_TIMEOUT = 120  # seconds a request waits for its answer
+    GENERATION_CACHE_TTL = 30 * 24 * 3600  # seconds an answer is reused
+    GENERATION_MAX_EXERCISES = 20
+    GENERATION_MAX_INPUT_CHARS = 20000  # of note text sent with the prompt
+    GENERATION_STUB_LATENCY = 0.5  # seconds per simulated model call
+
+    # Per-endpoint latency/SQL metrics on /metrics; set SLOW_QUERY_MS to log slow statements
+    INSTRUMENTATION_ENABLED = True
+    SLOW_QUERY_MS = float(os.environ["SLOW_QUERY_MS"]) if os.environ.get("SLOW_QUERY_MS") else None
+    
+    # Bulk import: rows per insert/commit, and the request body limit for /api/import
+    IMPORT_BATCH_SIZE = 1000
+    IMPORT_MAX_CONTENT_LENGTH = 500 * 1024 * 1024
@@ -0,0 +1,70 @@
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from .extensions import db
+
+
+def normalise_url(uri):
+    """Accept the legacy postgres:// scheme that some hosts still hand out"""
+    if uri.startswith("postgres://"):
+        return "postgresql://" + uri[len("postgres://"):]
+    return uri
+
+
+def engine_options(app):
+    """SQLALCHEMY_ENGINE_OPTIONS for the configured backend"""
+    options = dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    url = make_url(app.config['SQLALCHEMY_DATABASE_URI'])
+
+    if url.get_backend_name() == 'postgresql':
+        options.setdefault('pool_size', app.config['DB_POOL_SIZE'])
+        options.setdefault('max_overflow', app.config['DB_MAX_OVERFLOW'])
+        options.setdefault('pool_timeout', app.config['DB_POOL_TIMEOUT'])
+        options.setdefault('pool_recycle', app.config['DB_POOL_RECYCLE'])
+        # Drop connections the server closed while they sat in the pool
+        options.setdefault('pool_pre_ping', True)
+        timeout = app.config.get('DB_STATEMENT_TIMEOUT_MS')
+        if timeout:
+            connect_args = dict(options.get('connect_args') or {})
+            connect_args.setdefault('options', f"-c statement_timeout={int(timeout)}")
+            options['connect_args'] = connect_args
+    return options
+
+
+def _sqlite_pragmas(pragmas):
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
+    return on_connect
+
+
+def init_app(app):
+    """Configure the engine profile for the app's database and bind db to it"""
+    app.config['SQLALCHEMY_DATABASE_URI'] = normalise_url(app.config['SQLALCHEMY_DATABASE_URI'])
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app)
+    db.init_app(app)
+
+    pragmas = app.config.get('SQLITE_PRAGMAS') or {}
+    if not pragmas:
+        return
+    with app.app_context():
+        for engine in db.engines.values():
+            if engine.dialect.name == 'sqlite':
+                event.listen(engine, "connect", _sqlite_pragmas(pragmas))
+
+
+def describe(engine):
+    """The settings actually in effect on a connection, for diagnostics"""
+    with engine.connect() as connection:
+        if engine.dialect.name == 'sqlite':
+            names = ('journal_mode', 'synchronous', 'busy_timeout', 'mmap_size', 'cache_size')
+            return {name: connection.exec_driver_sql(f"PRAGMA {name}").scalar() for name in names}
+        if engine.dialect.name == 'postgresql':
+            return {
+                'statement_timeout': connection.exec_driver_sql("SHOW statement_timeout").scalar(),
+                'pool': engine.pool.status(),
+            }
+    return {}
@@ -0,0 +1,68 @@
+import os
+from urllib.parse import quote
+from flask import current_app, redirect, send_file
+from werkzeug.http import http_date
+from .storage import content_disposition, get_storage
+
+
+def send_resource_file(resource):
+    """Build the response for a PDF resource download.
+
+    Must only be called after the ownership check. DOWNLOAD_MODE picks how
+    the bytes are delivered:
+
+    - "direct": served by the worker with Range, If-Range, If-None-Match and
+      If-Modified-Since support. Full-file responses go through the server's
+      wsgi.file_wrapper, which uses os.sendfile under gunicorn.
+    - "x-accel": nginx X-Accel-Redirect to DOWNLOAD_ACCEL_PREFIX + file path.
+    - "x-sendfile": X-Sendfile with the absolute path (Apache, lighttpd).
+
+    With a remote storage backend the mode does not apply: the client is
+    redirected to a short-lived presigned URL and fetches the file from
+    the bucket itself.
+    """
+    storage = get_storage()
+    download_name = resource.original_filename or os.path.basename(resource.file_path)
+    url = storage.url(resource.file_path, mimetype='application/pdf', download_name=download_name)
+    if url is not None:
+        response = redirect(url)
+        response.cache_control.private = True
+        response.cache_control.no_store = True
+        return response
+
+    mode = current_app.config.get('DOWNLOAD_MODE', 'direct')
+    full_path = storage.local_path(resource.file_path)
+
+    # Blob paths are content addressed, so their hash is a strong validator
+    etag = resource.content_hash or True
+
+    if mode == 'direct':
+        response = send_file(
+            full_path,
+            mimetype='application/pdf',
+            as_attachment=True,
+            download_name=download_name,
+            conditional=True,
+            etag=etag,
+            max_age=0,
+        )
+        response.headers['Accept-Ranges'] = 'bytes'
+        response.cache_control.private = True
+        return response
+
+    response = current_app.response_class(mimetype='application/pdf')
+    response.headers['Content-Disposition'] = content_disposition(download_name)
+    response.headers['Last-Modified'] = http_date(os.path.getmtime(full_path))
+    if resource.content_hash:
+        response.set_etag(resource.content_hash)
+    response.cache_control.private = True
+
+    if mode == 'x-accel':
+        prefix = current_app.config.get('DOWNLOAD_ACCEL_PREFIX', '/protected-uploads/')
+        response.headers['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + quote(resource.file_path)
+    elif mode == 'x-sendfile':
+        response.headers['X-Sendfile'] = full_path
+    else:
+        raise ValueError(f"Unknown DOWNLOAD_MODE: {mode}")
+
+    return response
@@ -1,3 +1,5 @@
 from flask_sqlalchemy import SQLAlchemy
+from .instrumentation import Instrumentation
 
-db = SQLAlchemy()
\ No newline at end of file
+db = SQLAlchemy()
+instrumentation = Instrumentation()
\ No newline at end of file
@@ -0,0 +1,163 @@
+"""Template fragment caching: {% cache key, ..., ttl=seconds %} ... {% endcache %}.
+
+A fragment is stored under the key parts joined together. Parts built with
+fragment_scope("user", id) or fragment_scope("topic", id) carry that
+scope's current generation, so invalidating a scope only replaces its
+generation token: every fragment keyed on the old token stops being
+found and ages out of the cache, without anyone enumerating keys.
+Generations change when the rows a scope shows change (see the events
+below); bulk statements call invalidate_on_commit() themselves.
+"""
+import os
+import uuid
+from flask import current_app, has_app_context
+from jinja2 import FileSystemBytecodeCache, nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, object_session
+from .cache import cache_stats, make_backend
+from .models import Flashcard, Note, Resource, Topic
+
+stats = cache_stats("fragments")
+
+# session.info key: scopes to invalidate again once the transaction commits
+_PENDING_KEY = "fragment_cache_pending"
+
+
+def _cache():
+    return current_app.extensions['fragment_cache']
+
+
+def _generation_key(kind, ident):
+    return f"fragment-gen:{kind}:{ident}"
+
+
+def fragment_scope(kind, ident):
+    """Key part for fragments that show rows of a user or a topic"""
+    cache = _cache()
+    generation = cache.get(_generation_key(kind, ident))
+    if generation is None:
+        # A fresh token rather than a counter, so a generation evicted from
+        # the cache can never come back as one that was used before
+        generation = uuid.uuid4().hex[:12]
+        # ttl=0: kept until invalidated or evicted
+        cache.set(_generation_key(kind, ident), generation, ttl=0)
+    return f"{kind}{ident}.{generation}"
+
+
+def invalidate_fragments(kind, ident):
+    if ident is not None and has_app_context() and 'fragment_cache' in current_app.extensions:
+        _cache().delete(_generation_key(kind, ident))
+        stats.invalidated()
+
+
+def invalidate_on_commit(session, kind, ident):
+    """Invalidate a scope now and again once the session's transaction commits"""
+    invalidate_fragments(kind, ident)
+    # Again after commit, in case a concurrent request re-cached the old rows
+    session.info.setdefault(_PENDING_KEY, set()).add((kind, ident))
+
+
+class FragmentCacheExtension(Extension):
+    tags = {"cache"}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        parts = [parser.parse_expression()]
+        ttl = nodes.Const(None)
+        while parser.stream.skip_if("comma"):
+            if parser.stream.current.test("name:ttl") and parser.stream.look().test("assign"):
+                parser.stream.skip(2)
+                ttl = parser.parse_expression()
+                break
+            parts.append(parser.parse_expression())
+        body = parser.parse_statements(("name:endcache",), drop_needle=True)
+        return nodes.CallBlock(
+            self.call_method("_render", [nodes.List(parts), ttl]), [], [], body
+        ).set_lineno(lineno)
+
+    def _render(self, parts, ttl, caller):
+        if not current_app.config['FRAGMENT_CACHE_ENABLED']:
+            return caller()
+
+        key = "fragment:" + ":".join(str(part) for part in parts)
+        cache = _cache()
+        html = cache.get(key)
+        if html is not None:
+            stats.hit()
+            return Markup(html)
+        stats.miss()
+        html = caller()
+        cache.set(key, str(html), ttl=ttl)
+        return Markup(html)
+
+
+def _scopes(target):
+    """The (kind, id) scopes whose fragments show this row"""
+    if isinstance(target, Topic):
+        scopes = {("user", target.user_id), ("topic", target.id), ("topic", target.parent_topic_id)}
+        history = inspect(target).attrs.parent_topic_id.history
+    else:
+        # Topic pages list the row; dashboard cards count it
+        scopes = {("user", target.user_id), ("topic", target.topic_id)}
+        history = inspect(target).attrs.topic_id.history
+    # A row moved between topics changes the page it left as well
+    scopes.update(("topic", ident) for ident in history.deleted)
+    return scopes
+
+
+def _row_changed(mapper, connection, target):
+    session = object_session(target)
+    for kind, ident in _scopes(target):
+        if session is not None:
+            invalidate_on_commit(session, kind, ident)
+        else:
+            invalidate_fragments(kind, ident)
+
+
+for _model in (Topic, Resource, Note, Flashcard):
+    for _event in ("after_insert", "after_update", "after_delete"):
+        event.listen(_model, _event, _row_changed)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed(session):
+    # Savepoints fire this too; wait for the outer transaction
+    if session.in_nested_transaction():
+        return
+    for kind, ident in session.info.pop(_PENDING_KEY, ()):
+        invalidate_fragments(kind, ident)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_pending(session):
+    if session.in_nested_transaction():
+        return
+    session.info.pop(_PENDING_KEY, None)
+
+
+def precompile_templates(app):
+    """Compile every template now, so no request pays for it.
+
+    With TEMPLATE_BYTECODE_CACHE_DIR set, the compiled code is also written
+    to disk and the next worker or restart loads it instead of compiling.
+    """
+    env = app.jinja_env
+    for name in env.list_templates(filter_func=lambda name: name.endswith(".html")):
+        env.get_template(name)
+
+
+def init_app(app):
+    app.extensions['fragment_cache'] = make_backend(
+        app,
+        max_entries=app.config['FRAGMENT_CACHE_SIZE'],
+        ttl=app.config['FRAGMENT_CACHE_TTL'],
+    )
+    app.jinja_env.add_extension(FragmentCacheExtension)
+    app.jinja_env.globals['fragment_scope'] = fragment_scope
+
+    bytecode_dir = app.config.get('TEMPLATE_BYTECODE_CACHE_DIR')
+    if bytecode_dir:
+        os.makedirs(bytecode_dir, exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(bytecode_dir)
@@ -0,0 +1,395 @@
+"""Exercises generated from a topic's notes by a pluggable model provider.
+
+Providers register by name with @provider and GENERATION_PROVIDER picks
+one; "stub" is a deterministic local stand-in that needs no model. Model
+calls are slow and paid for, so a request passes three layers first:
+
+1. generation_cache: answers keyed by a hash of the provider, the prompt
+   and the normalised note content, shared by every user;
+2. single-flight: an identical request already in flight in this process
+   is waited on instead of sent again;
+3. batching: one thread collects requests from all users for up to
+   GENERATION_BATCH_WINDOW and sends them to the provider as one call.
+
+Results stream to the browser as server-sent events, and every request
+adds to its topic's generation_usage counters (calls, tokens, cost,
+latency). A streaming request holds its worker thread until it is answered.
+"""
+import hashlib
+import json
+import math
+import queue
+import re
+import threading
+import time
+from collections import namedtuple
+from functools import partial
+from concurrent.futures import Future, TimeoutError
+from datetime import datetime, timedelta
+from flask import Blueprint, Response, current_app, jsonify, request, stream_with_context
+from flask_login import current_user, login_required
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from . import metrics
+from .cache import cache_stats
+from .extensions import db
+from .models import GenerationCache, GenerationUsage, Note, Topic
+
+bp = Blueprint('generation', __name__, url_prefix='/generation')
+
+stats = cache_stats("generation")
+
+# Part of every cache key: bump it when the prompt wording changes
+PROMPT_VERSION = 1
+PROMPT = ('Write {count} short study exercises about "{topic}" using only the notes below. '
+          'Each exercise is a question and its answer.')
+
+GenerationRequest = namedtuple("GenerationRequest", "prompt context count")
+# One provider answer: exercises is a list of {"question", "answer"} dicts
+Generation = namedtuple("Generation", "exercises input_tokens output_tokens cost_micros")
+
+_providers = {}
+
+
+def provider(name):
+    """Register a provider class; it is built with the app config"""
+    def register(cls):
+        cls.name = name
+        _providers[name] = cls
+        return cls
+    return register
+
+
+class Provider:
+    """Turns a batch of GenerationRequests into one Generation each, in order"""
+    name = None
+    model = None
+
+    def __init__(self, config):
+        self.config = config
+
+    def generate(self, requests):
+        raise NotImplementedError
+
+
+def _tokens(text):
+    # Roughly four characters per token for English text
+    return math.ceil(len(text) / 4)
+
+
+@provider("stub")
+class StubProvider(Provider):
+    """Deterministic exercises made from the notes' own sentences, after a simulated model delay"""
+    model = "stub-1"
+    # Nominal prices in millionths of a dollar per 1000 tokens, so the cost counters move
+    input_price = 150
+    output_price = 600
+
+    def generate(self, requests):
+        # One delay per call, as for a real batched model call
+        time.sleep(self.config['GENERATION_STUB_LATENCY'])
+        return [self._generate(r) for r in requests]
+
+    def _generate(self, generation_request):
+        sentences = {
+            sentence.strip() for sentence in re.split(r"(?<=[.!?])\s+|\n+", generation_request.context)
+            if len(sentence.split()) >= 4
+        }
+        # Ordered by hash: the same notes always give the same exercises
+        chosen = sorted(sentences, key=lambda s: hashlib.sha256(s.encode()).digest())[:generation_request.count]
+        exercises = [{'question': f"Explain in your own words: {sentence}", 'answer': sentence}
+                     for sentence in chosen]
+        if not exercises:
+            exercises = [{'question': "Summarise what you know about this topic.",
+                          'answer': "There are no notes to draw an answer from yet."}]
+
+        input_tokens = _tokens(generation_request.prompt + generation_request.context)
+        output_tokens = _tokens(json.dumps(exercises))
+        cost = (input_tokens * self.input_price + output_tokens * self.output_price) // 1000
+        return Generation(exercises, input_tokens, output_tokens, cost)
+
+
+class Batcher:
+    """Sends generation requests from every user to the provider in batches.
+
+    Requests with the same cache key share one Future while in flight
+    (single-flight), so only the first of them reaches the provider.
+    on_result(key, generation, latency_ms) is called in the batcher thread
+    for every answer before it is handed out, so it is kept (see
+    _store_answer()) even if no request is still waiting for it.
+    """
+
+    def __init__(self, provider, max_batch, window, on_result=None):
+        self.provider = provider
+        self.max_batch = max_batch
+        self.window = window
+        self.on_result = on_result
+        self.batches = 0
+        self.batched_requests = 0
+        self.shared = 0
+        self._queue = queue.Queue()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def submit(self, key, generation_request):
+        """Returns (future, leader); leader is False when an identical request was already in flight.
+
+        The future resolves to (Generation, latency_ms) for the provider call.
+        """
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                self.shared += 1
+                return future, False
+            future = Future()
+            self._inflight[key] = future
+            self._queue.put((key, generation_request, future))
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="generation-batcher", daemon=True)
+                self._thread.start()
+        return future, True
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                self._send(batch)
+            except Exception as e:
+                # Whatever went wrong, no request is left waiting
+                self._release(batch)
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def _send(self, batch):
+        began = time.perf_counter()
+        try:
+            results = list(self.provider.generate([generation_request for _, generation_request, _ in batch]))
+            error = None
+        except Exception as e:
+            # Logged by each waiting request
+            results, error = [], e
+        latency_ms = round((time.perf_counter() - began) * 1000)
+        if error is None and len(results) != len(batch):
+            error = RuntimeError(f"{self.provider.name} returned {len(results)} answers for {len(batch)} requests")
+
+        answered = list(zip(batch, results))
+        if self.on_result is not None:
+            for (key, _, _), result in answered:
+                self.on_result(key, result, latency_ms)
+
+        with self._lock:
+            self.batches += 1
+            self.batched_requests += len(batch)
+        self._release(batch)
+        for (_, _, future), result in answered:
+            future.set_result((result, latency_ms))
+        for _, _, future in batch[len(answered):]:
+            future.set_exception(error)
+
+    def _release(self, batch):
+        with self._lock:
+            for key, _, _ in batch:
+                self._inflight.pop(key, None)
+
+
+def _batcher():
+    return current_app.extensions['generation']
+
+
+def build_request(topic, count):
+    """The request for a topic: its notes, normalised so cosmetic edits keep the same cache key"""
+    notes = db.session.execute(
+        select(Note.title, Note.content).where(Note.topic_id == topic.id).order_by(Note.id)
+    ).all()
+    context = "\n\n".join(f"{' '.join(title.split())}\n{' '.join(content.split())}" for title, content in notes)
+    context = context[:current_app.config['GENERATION_MAX_INPUT_CHARS']]
+    prompt = PROMPT.format(count=count, topic=" ".join(topic.name.split()))
+    return GenerationRequest(prompt, context, count)
+
+
+def cache_key(generation_provider, generation_request):
+    material = json.dumps([PROMPT_VERSION, generation_provider.name, generation_provider.model,
+                           generation_request.prompt, generation_request.context, generation_request.count])
+    return hashlib.sha256(material.encode()).hexdigest()
+
+
+def _cached(key):
+    oldest = datetime.utcnow() - timedelta(seconds=current_app.config['GENERATION_CACHE_TTL'])
+    row = db.session.execute(
+        select(GenerationCache.exercises)
+        .where(GenerationCache.key == key, GenerationCache.created_at >= oldest)
+    ).first()
+    if row is None:
+        return None
+    db.session.execute(update(GenerationCache).where(GenerationCache.key == key)
+                       .values(hit_count=GenerationCache.hit_count + 1))
+    return json.loads(row.exercises)
+
+
+def _store(key, generation_provider, generation, latency_ms):
+    db.session.flush()
+    try:
+        with db.session.begin_nested():
+            # Replaces an expired answer under the same key
+            db.session.execute(delete(GenerationCache).where(GenerationCache.key == key))
+            db.session.execute(insert(GenerationCache).values(
+                key=key, provider=generation_provider.name, model=generation_provider.model,
+                exercises=json.dumps(generation.exercises), input_tokens=generation.input_tokens,
+                output_tokens=generation.output_tokens, cost_micros=generation.cost_micros,
+                latency_ms=latency_ms, created_at=datetime.utcnow(),
+            ))
+    except IntegrityError:
+        # Stored concurrently by another process
+        pass
+
+
+def _store_answer(app, key, generation, latency_ms):
+    """Batcher on_result: cache an answer, in the batcher thread"""
+    with app.app_context():
+        try:
+            _store(key, _batcher().provider, generation, latency_ms)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            app.logger.exception("storing a generated answer failed")
+
+
+def record_usage(topic_id, user_id, **counts):
+    """Add to a topic's generation counters, creating its row on first use"""
+    table = GenerationUsage.__table__
+    increments = {name: table.c[name] + amount for name, amount in counts.items()}
+    if db.session.execute(update(table).where(table.c.topic_id == topic_id).values(increments)).rowcount:
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.execute(insert(table).values(topic_id=topic_id, user_id=user_id, **counts))
+    except IntegrityError:
+        # Created concurrently by another request
+        db.session.execute(update(table).where(table.c.topic_id == topic_id).values(increments))
+
+
+def _event(kind, data):
+    return f"event: {kind}\ndata: {json.dumps(data)}\n\n"
+
+
+def generate_events(topic, count):
+    """Server-sent events for one generation: status, one per exercise, then done (or error)"""
+    generation_provider = _batcher().provider
+    generation_request = build_request(topic, count)
+    key = cache_key(generation_provider, generation_request)
+
+    exercises = _cached(key)
+    if exercises is not None:
+        stats.hit()
+        record_usage(topic.id, topic.user_id, requests=1, cache_hits=1)
+        db.session.commit()
+        yield _event("status", {'state': 'cached'})
+        for exercise in exercises:
+            yield _event("exercise", exercise)
+        yield _event("done", {'cached': True, 'count': len(exercises)})
+        return
+
+    stats.miss()
+    future, leader = _batcher().submit(key, generation_request)
+    yield _event("status", {'state': 'generating' if leader else 'shared'})
+    deadline = time.monotonic() + current_app.config['GENERATION_TIMEOUT']
+    while True:
+        try:
+            generation, latency_ms = future.result(timeout=min(15, max(0, deadline - time.monotonic())))
+            break
+        except TimeoutError:
+            if time.monotonic() >= deadline:
+                yield _event("error", {'error': 'Generation timed out'})
+                return
+            # Comment line: keeps proxies from closing an idle stream
+            yield ": waiting\n\n"
+        except Exception:
+            current_app.logger.exception("exercise generation failed")
+            yield _event("error", {'error': 'Generation failed'})
+            return
+
+    if leader:
+        # The batcher has cached the answer already
+        record_usage(topic.id, topic.user_id, requests=1, provider_calls=1,
+                     input_tokens=generation.input_tokens, output_tokens=generation.output_tokens,
+                     cost_micros=generation.cost_micros, latency_ms=latency_ms)
+    else:
+        record_usage(topic.id, topic.user_id, requests=1, shared=1)
+    db.session.commit()
+
+    for exercise in generation.exercises:
+        yield _event("exercise", exercise)
+    yield _event("done", {'cached': False, 'count': len(generation.exercises), 'latency_ms': latency_ms})
+
+
+@bp.get("/topic/<int:topic_id>/exercises")
+@login_required
+def stream_exercises(topic_id):
+    """Generate exercises for a topic, streamed as text/event-stream"""
+    topic = Topic.query.filter_by(id=topic_id, user_id=current_user.id).first()
+    if not topic:
+        return jsonify({'success': False, 'error': 'Topic not found'}), 404
+    limit = current_app.config['GENERATION_MAX_EXERCISES']
+    count = min(max(request.args.get('count', 5, type=int), 1), limit)
+
+    response = Response(stream_with_context(generate_events(topic, count)), mimetype="text/event-stream")
+    response.headers['Cache-Control'] = "no-cache"
+    # Tell nginx not to buffer the stream
+    response.headers['X-Accel-Buffering'] = "no"
+    return response
+
+
+@bp.get("/topic/<int:topic_id>/usage")
+@login_required
+def topic_usage(topic_id):
+    """A topic's generation counters"""
+    topic = Topic.query.filter_by(id=topic_id, user_id=current_user.id).first()
+    if not topic:
+        return jsonify({'success': False, 'error': 'Topic not found'}), 404
+    usage = db.session.get(GenerationUsage, topic_id)
+    names = ('requests', 'cache_hits', 'shared', 'provider_calls', 'input_tokens', 'output_tokens',
+             'cost_micros', 'latency_ms')
+    return jsonify({'success': True, 'usage': {name: getattr(usage, name) if usage else 0 for name in names}})
+
+
+@metrics.collector
+def _generation_metrics():
+    batcher = current_app.extensions.get('generation')
+    if batcher is None:
+        return []
+    return [
+        "# HELP studymate_generation_batches_total Provider calls made by the generation batcher.",
+        "# TYPE studymate_generation_batches_total counter",
+        f"studymate_generation_batches_total {batcher.batches}",
+        "# HELP studymate_generation_batched_requests_total Requests sent to the provider in those calls.",
+        "# TYPE studymate_generation_batched_requests_total counter",
+        f"studymate_generation_batched_requests_total {batcher.batched_requests}",
+        "# HELP studymate_generation_shared_total Requests answered by an identical request in flight.",
+        "# TYPE studymate_generation_shared_total counter",
+        f"studymate_generation_shared_total {batcher.shared}",
+    ]
+
+
+def init_app(app):
+    provider_class = _providers[app.config['GENERATION_PROVIDER']]
+    app.extensions['generation'] = Batcher(
+        provider_class(app.config),
+        max_batch=app.config['GENERATION_BATCH_SIZE'],
+        window=app.config['GENERATION_BATCH_WINDOW'],
+        on_result=partial(_store_answer, app),
+    )
@@ -0,0 +1,121 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from flask import current_app
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+class HashingBusy(Exception):
+    """Too many password hashes are already queued; the caller should retry later"""
+
+
+def _lower_priority(niceness):
+    # Hash workers yield the CPU to request handling when both want it
+    if niceness and hasattr(os, "nice"):
+        os.nice(niceness)
+
+
+def _hash(password, method):
+    return generate_password_hash(password, method=method)
+
+
+def _check(stored, password):
+    return check_password_hash(stored, password)
+
+
+class HashingService:
+    """Runs password hashes in a bounded process pool.
+
+    Hashing is deliberately CPU-heavy. Doing it in separate processes keeps
+    the GIL free for other requests, and the queue limit makes a login burst
+    fail fast with HashingBusy instead of piling up behind the pool.
+    """
+
+    def __init__(self, method, workers, queue_limit, timeout, mode="process", niceness=0):
+        self.method = method
+        self.workers = workers
+        self.niceness = niceness
+        self.timeout = timeout
+        self.mode = mode
+        self._slots = threading.BoundedSemaphore(queue_limit)
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None:
+                # Forking a process that runs job threads is unsafe; spawn instead
+                self._pool = ProcessPoolExecutor(
+                    self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_lower_priority,
+                    initargs=(self.niceness,),
+                )
+            return self._pool
+
+    def _run(self, func, *args):
+        if self.mode != "process":
+            return func(*args)
+        if not self._slots.acquire(blocking=False):
+            raise HashingBusy()
+        try:
+            future = self._executor().submit(func, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            raise HashingBusy()
+
+    def hash_password(self, password):
+        return self._run(_hash, password, self.method)
+
+    def verify_password(self, stored, password):
+        return self._run(_check, stored, password)
+
+    def needs_rehash(self, stored):
+        """True when a stored hash was made with a different method or cost"""
+        return stored.split("$", 1)[0] != self.method
+
+    def warm(self):
+        """Start every pool process now rather than on the first logins"""
+        if self.mode == "process":
+            pool = self._executor()
+            for future in [pool.submit(_lower_priority, 0) for _ in range(self.workers)]:
+                future.result()
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+
+def _service():
+    return current_app.extensions['hashing']
+
+
+def hash_password(password):
+    return _service().hash_password(password)
+
+
+def verify_password(stored, password):
+    return _service().verify_password(stored, password)
+
+
+def needs_rehash(stored):
+    return _service().needs_rehash(stored)
+
+
+def init_app(app):
+    app.extensions['hashing'] = HashingService(
+        method=app.config['PASSWORD_HASH_METHOD'],
+        workers=app.config['HASH_WORKERS'],
+        queue_limit=app.config['HASH_QUEUE_LIMIT'],
+        timeout=app.config['HASH_TIMEOUT'],
+        mode=app.config['HASH_MODE'],
+        niceness=app.config['HASH_NICE'],
+    )
@@ -0,0 +1,213 @@
+import os
+import threading
+import time
+import traceback
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from .metrics import collector, label_value
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+_APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class Histogram:
+    """Log-linear histogram of non-negative integers (HDR style).
+
+    Every power of two is split into SUB_BUCKETS linear buckets, so memory
+    stays fixed while quantiles keep about 1/SUB_BUCKETS relative precision.
+    """
+
+    SUB_BITS = 5
+    SUB_BUCKETS = 1 << SUB_BITS
+
+    def __init__(self):
+        self.counts = {}
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def _index(self, value):
+        if value < 2 * self.SUB_BUCKETS:
+            return value
+        shift = value.bit_length() - self.SUB_BITS - 1
+        return (shift + 1) * self.SUB_BUCKETS + (value >> shift) - self.SUB_BUCKETS
+
+    def _upper_bound(self, index):
+        if index < 2 * self.SUB_BUCKETS:
+            return index
+        shift = index // self.SUB_BUCKETS - 1
+        mantissa = index % self.SUB_BUCKETS + self.SUB_BUCKETS
+        return ((mantissa + 1) << shift) - 1
+
+    def record(self, value):
+        value = max(int(value), 0)
+        index = self._index(value)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        if not self.count:
+            return 0
+        rank = q * self.count
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(self._upper_bound(index), self.max)
+        return self.max
+
+
+class EndpointStats:
+    """Per-endpoint histograms; times in microseconds, sizes in bytes"""
+
+    def __init__(self):
+        self.duration = Histogram()
+        self.sql_count = Histogram()
+        self.sql_time = Histogram()
+        self.response_size = Histogram()
+        self.exceptions = 0
+
+
+class Instrumentation:
+    """Records wall time, SQL statements, SQL time and response size per endpoint.
+
+    Requests are recorded when they are torn down, which happens even when
+    an unhandled exception skips the after_request hooks; those requests
+    are also counted as exceptions.
+    """
+
+    def __init__(self, app=None):
+        self.endpoints = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['instrumentation'] = self
+        if not app.config.get('INSTRUMENTATION_ENABLED', True):
+            return
+        _listen_to_sql()
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+
+    def _before_request(self):
+        g.perf_start = time.perf_counter()
+        g.perf_sql_count = 0
+        g.perf_sql_time = 0.0
+
+    def _after_request(self, response):
+        if 'perf_start' in g:
+            g.perf_response_size = response.content_length
+        return response
+
+    def _teardown_request(self, exc):
+        start = g.pop('perf_start', None)
+        if start is None:
+            return
+
+        endpoint = request.endpoint or "unmatched"
+        response_size = g.pop('perf_response_size', None)
+        with self._lock:
+            stats = self.endpoints.get(endpoint)
+            if stats is None:
+                stats = self.endpoints[endpoint] = EndpointStats()
+            stats.duration.record((time.perf_counter() - start) * 1e6)
+            stats.sql_count.record(g.get('perf_sql_count', 0))
+            stats.sql_time.record(g.get('perf_sql_time', 0.0) * 1e6)
+            if response_size is not None:
+                stats.response_size.record(response_size)
+            if exc is not None:
+                stats.exceptions += 1
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.endpoints)
+
+    def reset(self):
+        with self._lock:
+            self.endpoints.clear()
+
+
+def _app_stack():
+    """The application frames that led to the current statement"""
+    frames = traceback.extract_stack()[:-3]
+    return [
+        f"{os.path.relpath(f.filename, os.path.dirname(_APP_DIR))}:{f.lineno} in {f.name}"
+        for f in frames
+        if f.filename.startswith(_APP_DIR) and not f.filename.endswith("instrumentation.py")
+    ]
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('perf_query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('perf_query_start')
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+
+    if not has_request_context() or 'perf_start' not in g:
+        return
+    g.perf_sql_count += 1
+    g.perf_sql_time += elapsed
+
+    threshold = current_app.config.get('SLOW_QUERY_MS')
+    if threshold is not None and elapsed * 1000 >= threshold:
+        current_app.logger.warning(
+            "Slow query (%.1f ms) in %s: %s\n  %s",
+            elapsed * 1000,
+            request.endpoint,
+            " ".join(statement.split())[:1000],
+            "\n  ".join(_app_stack()) or "(no application frames)",
+        )
+
+
+_listening = False
+
+
+def _listen_to_sql():
+    global _listening
+    if not _listening:
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+        _listening = True
+
+
+_SERIES = (
+    ("studymate_request_duration_seconds", "duration", 1e-6, "Wall time per request."),
+    ("studymate_request_sql_queries", "sql_count", 1, "SQL statements per request."),
+    ("studymate_request_sql_duration_seconds", "sql_time", 1e-6, "Time spent in SQL per request."),
+    ("studymate_response_size_bytes", "response_size", 1, "Response body size."),
+)
+
+
+@collector
+def _request_metrics():
+    instrumentation = current_app.extensions.get('instrumentation')
+    if instrumentation is None:
+        return []
+
+    endpoints = sorted(instrumentation.snapshot().items())
+    lines = []
+    for name, attr, scale, help_text in _SERIES:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} summary")
+        for endpoint, stats in endpoints:
+            histogram = getattr(stats, attr)
+            label = f'endpoint="{label_value(endpoint)}"'
+            for q in QUANTILES:
+                lines.append(f'{name}{{{label},quantile="{q}"}} {histogram.quantile(q) * scale:g}')
+            lines.append(f"{name}_sum{{{label}}} {histogram.total * scale:g}")
+            lines.append(f"{name}_count{{{label}}} {histogram.count}")
+    lines.append("# HELP studymate_request_exceptions_total Requests that ended in an unhandled exception.")
+    lines.append("# TYPE studymate_request_exceptions_total counter")
+    for endpoint, stats in endpoints:
+        lines.append(f'studymate_request_exceptions_total{{endpoint="{label_value(endpoint)}"}} {stats.exceptions}')
+    return lines
@@ -0,0 +1,202 @@
+import json
+import threading
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+from .extensions import db
+from .models import Job
+
+_handlers = {}
+_finished_callbacks = []
+
+
+def job_handler(kind):
+    """Register a function as the handler for a job kind"""
+    def decorator(func):
+        _handlers[kind] = func
+        return func
+    return decorator
+
+
+def on_job_finished(func):
+    """Register a callback run after a job succeeds or fails for good"""
+    _finished_callbacks.append(func)
+    return func
+
+
+def enqueue(kind, payload=None, key=None, subject=None, rerun=False):
+    """Queue a job in the current transaction.
+
+    Jobs with a key are idempotent: if a job with the same key already
+    exists it is returned instead, and a failed one is queued again. With
+    rerun, a job that already finished is queued again too.
+    Call kick() after committing so workers pick the job up.
+    """
+    if key:
+        existing = Job.query.filter_by(key=key).first()
+        if existing:
+            if existing.status == 'failed' or (rerun and existing.status == 'done'):
+                existing.status = 'queued'
+                existing.attempts = 0
+                existing.run_at = datetime.utcnow()
+            return existing
+
+    job = Job(
+        kind=kind,
+        key=key,
+        subject=subject,
+        payload=json.dumps(payload or {}),
+        max_attempts=current_app.config['JOBS_MAX_ATTEMPTS'],
+    )
+    db.session.flush()
+    try:
+        with db.session.begin_nested():
+            db.session.add(job)
+    except IntegrityError:
+        # Queued concurrently by another request
+        return Job.query.filter_by(key=key).first()
+    return job
+
+
+def kick():
+    """Start committed jobs: inline in "sync" mode, otherwise wake the workers"""
+    if current_app.config['JOBS_MODE'] == 'sync':
+        run_pending()
+    else:
+        pool = current_app.extensions.get('jobs')
+        if pool:
+            pool.wake()
+
+
+def _requeue_stale():
+    """Put back jobs whose worker died while running them"""
+    lease = timedelta(seconds=current_app.config['JOBS_LEASE_SECONDS'])
+    db.session.execute(
+        update(Job)
+        .where(Job.status == 'running', Job.updated_at < datetime.utcnow() - lease)
+        .values(status='queued')
+    )
+    db.session.commit()
+
+
+def claim_next():
+    """Atomically move the next due job from queued to running"""
+    while True:
+        now = datetime.utcnow()
+        job_id = db.session.execute(
+            select(Job.id)
+            .where(Job.status == 'queued', Job.run_at <= now)
+            .order_by(Job.run_at, Job.id)
+            .limit(1)
+        ).scalar()
+        if job_id is None:
+            db.session.commit()
+            return None
+
+        claimed = db.session.execute(
+            update(Job)
+            .where(Job.id == job_id, Job.status == 'queued')
+            .values(status='running', attempts=Job.attempts + 1, updated_at=now)
+        ).rowcount
+        db.session.commit()
+        if claimed:
+            return db.session.get(Job, job_id)
+        # Another worker got there first; try the next one
+
+
+def run_job(job):
+    """Run a claimed job, scheduling a retry with exponential backoff on error"""
+    job_id = job.id
+    handler = _handlers.get(job.kind)
+
+    try:
+        if handler is None:
+            raise LookupError(f"No handler registered for job kind {job.kind!r}")
+        handler(json.loads(job.payload or "{}"))
+        job = db.session.get(Job, job_id)
+        job.status = 'done'
+        job.last_error = None
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.warning("Job %s (%s) failed: %r", job_id, job.kind, e)
+        job = db.session.get(Job, job_id)
+        job.last_error = repr(e)[:2000]
+        if job.attempts >= job.max_attempts:
+            job.status = 'failed'
+        else:
+            backoff = current_app.config['JOBS_BACKOFF_SECONDS'] * 2 ** (job.attempts - 1)
+            job.status = 'queued'
+            job.run_at = datetime.utcnow() + timedelta(seconds=backoff)
+    db.session.commit()
+
+    if job.status in ('done', 'failed'):
+        for callback in _finished_callbacks:
+            callback(job)
+            db.session.commit()
+
+
+def run_pending(limit=None):
+    """Run due jobs in the calling thread until the queue is empty"""
+    ran = 0
+    while limit is None or ran < limit:
+        job = claim_next()
+        if job is None:
+            break
+        run_job(job)
+        ran += 1
+    return ran
+
+
+class WorkerPool:
+    """Daemon threads that poll the job table and run due jobs"""
+
+    def __init__(self, app, size):
+        self.app = app
+        self.size = size
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.size):
+                thread = threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def wake(self):
+        self._wakeup.set()
+
+    def _work(self):
+        interval = self.app.config['JOBS_POLL_INTERVAL']
+        while True:
+            try:
+                with self.app.app_context():
+                    _requeue_stale()
+                    ran = run_pending(limit=50)
+            except Exception:
+                self.app.logger.exception("Job worker error")
+                ran = 0
+            if not ran:
+                self._wakeup.wait(interval)
+                self._wakeup.clear()
+
+
+def init_app(app):
+    """Set up the worker pool unless jobs run synchronously.
+
+    Workers start with the first request, so CLI commands such as
+    manage.py never spawn them.
+    """
+    if app.config['JOBS_MODE'] != 'thread' or app.config['JOBS_WORKERS'] <= 0:
+        return
+
+    pool = WorkerPool(app, app.config['JOBS_WORKERS'])
+    app.extensions['jobs'] = pool
+
+    @app.before_request
+    def _start_job_workers():
+        pool.start()
@@ -0,0 +1,369 @@
+"""Titles, favicons and content types for link resources, fetched in the background.
+
+Metadata lives in link_metadata, one row per normalised URL shared by every
+user, so a popular URL is fetched once for everyone. Rows are fetched by
+the "links.fetch" job: each run claims the rows that are due and fetches
+them concurrently with asyncio over one pooled httpx client, a few at a
+time per host. Rows are revalidated after LINK_METADATA_TTL with
+If-None-Match / If-Modified-Since, so an unchanged page costs a 304.
+"""
+import asyncio
+import hashlib
+import ipaddress
+import socket
+from collections import defaultdict, namedtuple
+from datetime import datetime, timedelta
+from html.parser import HTMLParser
+from urllib.parse import parse_qsl, urlencode, urljoin, urlsplit, urlunsplit
+import httpcore
+import httpx
+from flask import current_app
+from sqlalchemy import insert, select, update
+from sqlalchemy.exc import IntegrityError
+from . import fragment_cache, jobs
+from .extensions import db
+from .models import LinkMetadata, Resource
+
+# Query parameters that only track the visitor and never change the page
+_TRACKING_PARAMS = {"fbclid", "gclid", "mc_cid", "mc_eid"}
+
+MAX_REDIRECTS = 5
+
+FetchSettings = namedtuple("FetchSettings", "concurrency per_host timeout max_bytes allow_private user_agent")
+
+# Outcome of one fetch. not_modified means the server answered 304 to a revalidation.
+FetchResult = namedtuple(
+    "FetchResult",
+    "url_hash status_code final_url title description favicon_url content_type etag last_modified "
+    "not_modified error",
+)
+
+
+class BlockedURL(ValueError):
+    """A URL that resolves to an address the server must not fetch from"""
+
+
+def normalize_url(url):
+    """Canonical form of an http(s) URL for the shared cache, or None if it is not one.
+
+    Lowercases scheme and host, drops credentials, default ports, the
+    fragment and tracking parameters, and sorts the query.
+    """
+    try:
+        parts = urlsplit((url or "").strip())
+        port = parts.port
+    except ValueError:
+        return None
+    scheme = parts.scheme.lower()
+    if scheme not in ("http", "https") or not parts.hostname:
+        return None
+
+    host = parts.hostname.rstrip(".")
+    try:
+        host = host.encode("idna").decode("ascii")
+    except UnicodeError:
+        return None
+    if ":" in host:
+        host = f"[{host}]"
+    if port is not None and (scheme, port) not in (("http", 80), ("https", 443)):
+        host = f"{host}:{port}"
+
+    query = sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not key.startswith("utm_") and key not in _TRACKING_PARAMS
+    )
+    return urlunsplit((scheme, host, parts.path or "/", urlencode(query), ""))
+
+
+def url_key(url):
+    """SHA-256 of the normalised URL: the link_metadata key, stored on Resource.url_hash"""
+    normalized = normalize_url(url)
+    return hashlib.sha256(normalized.encode()).hexdigest() if normalized else None
+
+
+class _HeadParser(HTMLParser):
+    """Pulls the title, description and icon out of the start of an HTML page"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.title = None
+        self.og_title = None
+        self.description = None
+        self.icon = None
+        self._in_title = False
+        self._title_parts = []
+
+    def handle_starttag(self, tag, attrs):
+        attrs = {name: value or "" for name, value in attrs}
+        if tag == "title" and self.title is None:
+            self._in_title = True
+        elif tag == "meta":
+            key = (attrs.get("property") or attrs.get("name") or "").lower()
+            if key == "og:title" and not self.og_title:
+                self.og_title = attrs.get("content")
+            elif key in ("description", "og:description") and not self.description:
+                self.description = attrs.get("content")
+        elif tag == "link" and not self.icon:
+            if "icon" in attrs.get("rel", "").lower().split() and attrs.get("href"):
+                self.icon = attrs["href"]
+
+    def handle_endtag(self, tag):
+        if tag == "title" and self._in_title:
+            self._in_title = False
+            self.title = "".join(self._title_parts)
+
+    def handle_data(self, data):
+        if self._in_title:
+            self._title_parts.append(data)
+
+
+def _clean(text, length):
+    return " ".join(text.split())[:length] or None if text else None
+
+
+async def _vetted_address(host, settings):
+    """The address to connect to for host, after checking that it is public"""
+    if settings.allow_private:
+        return host
+    try:
+        infos = await asyncio.get_running_loop().getaddrinfo(host, None, type=socket.SOCK_STREAM)
+    except socket.gaierror as e:
+        raise BlockedURL(f"cannot resolve {host}: {e}")
+    for info in infos:
+        address = ipaddress.ip_address(info[4][0].split("%")[0])
+        if not address.is_global:
+            raise BlockedURL(f"{host} resolves to a non-public address")
+    return infos[0][4][0]
+
+
+class _PinnedBackend(httpcore.AsyncNetworkBackend):
+    """Opens each connection to the address _vetted_address() checked, not a second lookup.
+
+    Resolving once keeps a DNS answer that changes between the check and
+    the connect (DNS rebinding) from reaching a private address.
+    """
+
+    def __init__(self, settings):
+        self.settings = settings
+        self._backend = httpcore.AnyIOBackend()
+
+    async def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+        address = await _vetted_address(host, self.settings)
+        return await self._backend.connect_tcp(address, port, timeout, local_address, socket_options)
+
+    async def connect_unix_socket(self, path, timeout=None, socket_options=None):
+        raise BlockedURL("unix sockets are not fetched")
+
+    async def sleep(self, seconds):
+        await self._backend.sleep(seconds)
+
+
+class _PinnedTransport(httpx.AsyncHTTPTransport):
+    """HTTP transport whose connections go through _PinnedBackend.
+
+    Requests keep the host name in the URL, so the Host header, TLS SNI,
+    the certificate check and connection reuse all go by name; only the
+    TCP connection is made to the vetted address. Every new connection is
+    checked, including those for redirect hops.
+    """
+
+    def __init__(self, settings, limits):
+        super().__init__(limits=limits)
+        self._pool = httpcore.AsyncConnectionPool(
+            ssl_context=httpx.create_ssl_context(),
+            max_connections=limits.max_connections,
+            max_keepalive_connections=limits.max_keepalive_connections,
+            keepalive_expiry=limits.keepalive_expiry,
+            network_backend=_PinnedBackend(settings),
+        )
+
+
+async def _fetch_one(client, host_limits, entry, settings):
+    url_hash, url, etag, last_modified = entry
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+
+    empty = FetchResult(url_hash, None, url, None, None, None, None, etag, last_modified, False, None)
+    try:
+        # Redirects are followed by hand so every hop gets the host limit; the
+        # transport checks the address of each connection it opens
+        for _ in range(MAX_REDIRECTS + 1):
+            host = urlsplit(url).hostname
+            async with host_limits[host]:
+                async with client.stream("GET", url, headers=headers) as response:
+                    if response.is_redirect and "location" in response.headers:
+                        url = urljoin(url, response.headers["location"])
+                        continue
+                    if response.status_code == 304:
+                        return empty._replace(status_code=304, not_modified=True)
+                    if response.status_code >= 400:
+                        return empty._replace(status_code=response.status_code,
+                                              error=f"HTTP {response.status_code}")
+
+                    content_type = response.headers.get("content-type", "").split(";")[0].strip().lower()
+                    result = empty._replace(
+                        status_code=response.status_code, final_url=str(response.url),
+                        content_type=content_type or None,
+                        etag=response.headers.get("etag"), last_modified=response.headers.get("last-modified"),
+                    )
+                    if content_type not in ("text/html", "application/xhtml+xml"):
+                        return result
+
+                    body = bytearray()
+                    async for chunk in response.aiter_bytes():
+                        body += chunk
+                        if len(body) >= settings.max_bytes:
+                            break
+                    parser = _HeadParser()
+                    parser.feed(bytes(body[:settings.max_bytes]).decode(response.encoding or "utf-8", "replace"))
+                    return result._replace(
+                        title=_clean(parser.og_title or parser.title, 300),
+                        description=_clean(parser.description, 1000),
+                        favicon_url=urljoin(result.final_url, parser.icon or "/favicon.ico")[:2000],
+                    )
+        return empty._replace(error="too many redirects")
+    except (httpx.HTTPError, BlockedURL, UnicodeError, ValueError) as e:
+        return empty._replace(error=f"{type(e).__name__}: {e}"[:500])
+
+
+async def fetch_all(entries, settings):
+    """Fetch [(url_hash, url, etag, last_modified)] concurrently; returns a FetchResult per entry"""
+    limits = httpx.Limits(max_connections=settings.concurrency,
+                          max_keepalive_connections=settings.concurrency)
+    host_limits = defaultdict(lambda: asyncio.Semaphore(settings.per_host))
+    async with httpx.AsyncClient(transport=_PinnedTransport(settings, limits), timeout=settings.timeout,
+                                 follow_redirects=False, headers={"User-Agent": settings.user_agent}) as client:
+        return await asyncio.gather(*(_fetch_one(client, host_limits, entry, settings) for entry in entries))
+
+
+def _settings():
+    config = current_app.config
+    return FetchSettings(
+        concurrency=config['LINK_FETCH_CONCURRENCY'],
+        per_host=config['LINK_FETCH_PER_HOST'],
+        timeout=config['LINK_FETCH_TIMEOUT'],
+        max_bytes=config['LINK_FETCH_MAX_BYTES'],
+        allow_private=config['LINK_FETCH_ALLOW_PRIVATE'],
+        user_agent=config['LINK_FETCH_USER_AGENT'],
+    )
+
+
+def ensure_metadata(urls):
+    """Create the (not yet fetched) link_metadata rows missing for these URLs.
+
+    Returns True if any of them is due for a fetch, in which case a
+    "links.fetch" job has been queued; call kick() after committing.
+    """
+    wanted = {}
+    for url in urls:
+        normalized = normalize_url(url)
+        if normalized:
+            wanted[hashlib.sha256(normalized.encode()).hexdigest()] = normalized
+    if not wanted:
+        return False
+
+    now = datetime.utcnow()
+    known = dict(db.session.execute(
+        select(LinkMetadata.url_hash, LinkMetadata.next_fetch_at).where(LinkMetadata.url_hash.in_(wanted))
+    ).all())
+    missing = [{'url_hash': url_hash, 'url': url, 'next_fetch_at': now}
+               for url_hash, url in wanted.items() if url_hash not in known]
+    if missing:
+        db.session.flush()
+        try:
+            with db.session.begin_nested():
+                db.session.execute(insert(LinkMetadata), missing)
+        except IntegrityError:
+            # Another request created some of them first
+            for row in missing:
+                try:
+                    with db.session.begin_nested():
+                        db.session.execute(insert(LinkMetadata), [row])
+                except IntegrityError:
+                    pass
+
+    due = bool(missing) or any(next_fetch_at <= now for next_fetch_at in known.values())
+    if due:
+        jobs.enqueue("links.fetch")
+    return due
+
+
+def attach(resource):
+    """Point a link resource at its shared metadata, queueing a fetch if it is due"""
+    resource.url_hash = url_key(resource.url) if resource.url else None
+    if resource.url_hash:
+        ensure_metadata([resource.url])
+
+
+def _claim_due(limit):
+    """Lease up to limit due rows to this worker; returns their fetch entries"""
+    now = datetime.utcnow()
+    table = LinkMetadata.__table__
+    due = select(table.c.id).where(table.c.next_fetch_at <= now).order_by(table.c.next_fetch_at).limit(limit)
+    ids = db.session.execute(due).scalars().all()
+    if not ids:
+        return []
+    # Concurrent workers race for the same rows; only the one whose UPDATE matches fetches them
+    lease = now + timedelta(seconds=current_app.config['LINK_FETCH_TIMEOUT'] * (MAX_REDIRECTS + 2))
+    claimed = db.session.execute(
+        update(table).where(table.c.id.in_(ids), table.c.next_fetch_at <= now)
+        .values(next_fetch_at=lease)
+        .returning(table.c.url_hash, table.c.url, table.c.etag, table.c.last_modified)
+    ).all()
+    db.session.commit()
+    return [tuple(row) for row in claimed]
+
+
+def _store(results):
+    now = datetime.utcnow()
+    ttl = timedelta(seconds=current_app.config['LINK_METADATA_TTL'])
+    table = LinkMetadata.__table__
+    changed = []
+    for result in results:
+        where = table.c.url_hash == result.url_hash
+        if result.not_modified:
+            values = {'fetched_at': now, 'next_fetch_at': now + ttl, 'fail_count': 0, 'error': None}
+        elif result.error:
+            fail_count = (db.session.execute(select(table.c.fail_count).where(where)).scalar() or 0) + 1
+            # Back off from a broken link, but look again at least every TTL
+            retry = min(ttl, timedelta(minutes=5) * 2 ** fail_count)
+            values = {'fetched_at': now, 'next_fetch_at': now + retry, 'fail_count': fail_count,
+                      'error': result.error, 'status_code': result.status_code}
+        else:
+            values = {name: getattr(result, name) for name in (
+                'status_code', 'final_url', 'title', 'description', 'favicon_url', 'content_type',
+                'etag', 'last_modified')}
+            values.update(fetched_at=now, next_fetch_at=now + ttl, fail_count=0, error=None)
+            changed.append(result.url_hash)
+        db.session.execute(update(table).where(where).values(values))
+    db.session.commit()
+
+    # Topic pages cache their resource cards
+    if changed:
+        topic_ids = db.session.execute(
+            select(Resource.topic_id).where(Resource.url_hash.in_(changed)).distinct()
+        ).scalars().all()
+        for topic_id in topic_ids:
+            fragment_cache.invalidate_fragments("topic", topic_id)
+
+
+def expire_all():
+    """Make every link due for revalidation"""
+    db.session.execute(update(LinkMetadata.__table__).values(next_fetch_at=datetime.utcnow()))
+    db.session.commit()
+
+
+@jobs.job_handler("links.fetch")
+def fetch_due(payload=None):
+    """Fetch every link_metadata row that is due, a batch at a time; returns how many were fetched"""
+    fetched = 0
+    settings = _settings()
+    while True:
+        entries = _claim_due(current_app.config['LINK_FETCH_BATCH_SIZE'])
+        if not entries:
+            return fetched
+        _store(asyncio.run(fetch_all(entries, settings)))
+        fetched += len(entries)
@@ -0,0 +1,46 @@
+from flask import Blueprint, Response
+from . import cache
+
+bp = Blueprint('metrics', __name__)
+
+# Functions returning lines of Prometheus text exposition format
+_collectors = []
+
+
+def collector(func):
+    """Register a function that contributes lines to /metrics"""
+    _collectors.append(func)
+    return func
+
+
+def label_value(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+@collector
+def _cache_metrics():
+    lines = [
+        "# HELP studymate_cache_hits_total Cache lookups served from the cache.",
+        "# TYPE studymate_cache_hits_total counter",
+    ]
+    lines += [f'studymate_cache_hits_total{{cache="{label_value(s.name)}"}} {s.hits}' for s in cache.stats.values()]
+    lines += [
+        "# HELP studymate_cache_misses_total Cache lookups that had to be recomputed.",
+        "# TYPE studymate_cache_misses_total counter",
+    ]
+    lines += [f'studymate_cache_misses_total{{cache="{label_value(s.name)}"}} {s.misses}' for s in cache.stats.values()]
+    lines += [
+        "# HELP studymate_cache_invalidations_total Entries dropped because the data changed.",
+        "# TYPE studymate_cache_invalidations_total counter",
+    ]
+    lines += [f'studymate_cache_invalidations_total{{cache="{label_value(s.name)}"}} {s.invalidations}' for s in cache.stats.values()]
+    return lines
+
+
+@bp.get("/metrics")
+def metrics():
+    """Prometheus scrape endpoint"""
+    lines = []
+    for func in _collectors:
+        lines.extend(func())
+    return Response("\n".join(lines) + "\n", mimetype="text/plain; version=0.0.4")
@@ -0,0 +1,228 @@
+"""Versioned, idempotent schema migrations.
+
+db.create_all() only creates missing tables, so anything added to an
+existing table (columns, indexes, backfills) is a numbered migration here.
+upgrade() creates missing tables first and then runs every migration newer
+than the version recorded in the schema_version table. Each migration
+checks before it changes anything, so it is safe on a database that
+create_all() has just built from the current models.
+"""
+from collections import namedtuple
+from datetime import datetime
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, bindparam, func, inspect, select, text
+from . import links, quota, topic_closure, topic_stats
+from .extensions import db
+from .models import Flashcard, LinkMetadata, Note, Resource, Topic, User
+
+Migration = namedtuple("Migration", "version description upgrade transactional")
+
+MIGRATIONS = []
+
+_meta = MetaData()
+schema_version = Table(
+    "schema_version", _meta,
+    Column("version", Integer, primary_key=True),
+    Column("description", String(200), nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+def migration(version, description, transactional=True):
+    """Register an upgrade function; non-transactional ones run in autocommit mode"""
+    def register(func):
+        MIGRATIONS.append(Migration(version, description, func, transactional))
+        MIGRATIONS.sort(key=lambda m: m.version)
+        return func
+    return register
+
+
+def applied_versions(connection):
+    return set(connection.execute(select(schema_version.c.version)).scalars())
+
+
+def pending(engine):
+    with engine.connect() as connection:
+        if not inspect(connection).has_table("schema_version"):
+            return list(MIGRATIONS)
+        done = applied_versions(connection)
+    return [m for m in MIGRATIONS if m.version not in done]
+
+
+def upgrade(engine):
+    """Bring the database up to date; returns the migrations that ran"""
+    db.metadata.create_all(engine)
+    _meta.create_all(engine)
+
+    ran = []
+    for m in pending(engine):
+        if m.transactional:
+            with engine.begin() as connection:
+                m.upgrade(connection)
+                _record(connection, m)
+        else:
+            with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+                m.upgrade(connection)
+            with engine.begin() as connection:
+                _record(connection, m)
+        ran.append(m)
+    return ran
+
+
+def _record(connection, m):
+    connection.execute(schema_version.insert().values(
+        version=m.version, description=m.description, applied_at=datetime.utcnow()
+    ))
+
+
+def add_column(connection, column):
+    """ALTER TABLE ... ADD COLUMN for a model column, unless it is already there"""
+    table = column.table.name
+    if column.name in {c['name'] for c in inspect(connection).get_columns(table)}:
+        return
+    ddl = f"ALTER TABLE {table} ADD COLUMN {column.name} {column.type.compile(connection.dialect)}"
+    default = column.default.arg if column.default is not None and column.default.is_scalar else None
+    if default is not None:
+        # Fills existing rows with the model default
+        ddl += f" DEFAULT {default!r}"
+    connection.exec_driver_sql(ddl)
+
+
+def create_index(connection, name, table, columns):
+    """Create an index if it is missing, without blocking writes where the backend allows.
+
+    PostgreSQL builds it CONCURRENTLY (the migration must be non-transactional)
+    and first drops an invalid index left behind by an interrupted build.
+    SQLite has no online index build; CREATE INDEX holds the write lock for
+    the duration, which is short at this application's table sizes.
+    """
+    column_list = ", ".join(columns)
+    if connection.dialect.name == "postgresql":
+        invalid = connection.execute(text(
+            "SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+            "WHERE c.relname = :name AND NOT i.indisvalid"
+        ), {'name': name}).first()
+        if invalid:
+            drop_index(connection, name)
+        connection.exec_driver_sql(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} ({column_list})")
+    else:
+        connection.exec_driver_sql(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({column_list})")
+
+
+def drop_index(connection, name):
+    """Drop an index if it exists, CONCURRENTLY on PostgreSQL (non-transactional migrations only)"""
+    if connection.dialect.name == "postgresql":
+        connection.exec_driver_sql(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+    else:
+        connection.exec_driver_sql(f"DROP INDEX IF EXISTS {name}")
+
+
+@migration(1, "Blob store, PDF processing and spaced repetition columns")
+def _columns_since_baseline(connection):
+    for column in (Resource.__table__.c.content_hash, Resource.__table__.c.page_count,
+                   Resource.__table__.c.thumbnail_path, Flashcard.__table__.c.ease_factor,
+                   Flashcard.__table__.c.interval_days, Flashcard.__table__.c.repetitions):
+        add_column(connection, column)
+    connection.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_resource_content_hash ON resource (content_hash)")
+    connection.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_flashcard_user_next_review ON flashcard (user_id, next_review_at)"
+    )
+    # Cards created before scheduling existed were never due
+    connection.execute(
+        Flashcard.__table__.update()
+        .where(Flashcard.__table__.c.next_review_at.is_(None))
+        .values(next_review_at=datetime.utcnow())
+    )
+
+
+@migration(2, "Indexes for topic tree and subtopic lookups", transactional=False)
+def _topic_indexes(connection):
+    create_index(connection, "ix_topic_user_parent", "topic", ("user_id", "parent_topic_id"))
+    create_index(connection, "ix_topic_parent_topic_id", "topic", ("parent_topic_id",))
+
+
+@migration(3, "Session version counter on users")
+def _user_auth_version(connection):
+    add_column(connection, User.__table__.c.auth_version)
+
+
+@migration(4, "Note revision counter")
+def _note_revision(connection):
+    add_column(connection, Note.__table__.c.revision)
+
+
+@migration(5, "Persisted markdown rendering for notes")
+def _note_rendering(connection):
+    add_column(connection, Note.__table__.c.content_hash)
+    add_column(connection, Note.__table__.c.rendered_html)
+
+
+@migration(6, "Keyset pagination indexes on (created_at, id)", transactional=False)
+def _pagination_indexes(connection):
+    create_index(connection, "ix_topic_user_parent_created", "topic",
+                 ("user_id", "parent_topic_id", "created_at", "id"))
+    # Superseded by the index above
+    drop_index(connection, "ix_topic_user_parent")
+    create_index(connection, "ix_resource_topic_created", "resource", ("topic_id", "created_at", "id"))
+    create_index(connection, "ix_note_topic_created", "note", ("topic_id", "created_at", "id"))
+    create_index(connection, "ix_flashcard_topic_created", "flashcard", ("topic_id", "created_at", "id"))
+
+
+@migration(7, "Per-topic dashboard counters")
+def _topic_stats(connection):
+    # The table itself comes from create_all(); fill it for existing topics
+    topic_stats.rebuild(connection)
+
+
+@migration(8, "Shared link metadata keyed by normalised URL", transactional=False)
+def _link_metadata(connection):
+    # link_metadata itself comes from create_all()
+    add_column(connection, Resource.__table__.c.url_hash)
+    create_index(connection, "ix_resource_url_hash", "resource", ("url_hash",))
+
+    resource = Resource.__table__
+    rows = connection.execute(
+        select(resource.c.id, resource.c.url)
+        .where(resource.c.resource_type == "link", resource.c.url.is_not(None), resource.c.url_hash.is_(None))
+    ).all()
+    hashes = {row.id: links.url_key(row.url) for row in rows}
+    updates = [{'rid': rid, 'url_hash': url_hash} for rid, url_hash in hashes.items() if url_hash]
+    if updates:
+        connection.execute(
+            resource.update().where(resource.c.id == bindparam('rid')).values(url_hash=bindparam('url_hash')),
+            updates,
+        )
+
+    # Existing links are due straight away; run `manage.py refresh-links` to fetch them
+    metadata = LinkMetadata.__table__
+    known = set(connection.execute(select(metadata.c.url_hash)).scalars())
+    missing = {}
+    for row in rows:
+        url_hash = hashes[row.id]
+        if url_hash and url_hash not in known:
+            missing[url_hash] = {'url_hash': url_hash, 'url': links.normalize_url(row.url),
+                                 'next_fetch_at': datetime.utcnow(), 'fail_count': 0}
+    if missing:
+        connection.execute(metadata.insert(), list(missing.values()))
+
+
+@migration(9, "Closure table for the topic tree")
+def _topic_closure(connection):
+    # The table itself comes from create_all(); fill it from parent_topic_id
+    topic_closure.rebuild(connection)
+
+
+@migration(10, "Per-user storage usage counters")
+def _storage_usage(connection):
+    # The table itself comes from create_all(); fill it from the resource table
+    quota.rebuild(connection)
+
+
+@migration(11, "Backfill topic creation times for keyset pagination")
+def _topic_created_at(connection):
+    # (created_at, id) < cursor never matches NULL, so those topics fell out of
+    # /api/v1 listings; unknown creation times sort as the oldest
+    topic = Topic.__table__
+    connection.execute(
+        topic.update().where(topic.c.created_at.is_(None))
+        .values(created_at=func.coalesce(topic.c.updated_at, datetime(1970, 1, 1)))
+    )
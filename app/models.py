@@ -10,15 +10,28 @@ class User(db.Model, UserMixin):
     username = db.Column(db.String(120), nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
     password = db.Column(db.String(200), nullable=False)
+
+    # Part of the session id: increment it when the password changes to sign
+    # out every existing session (see principal.py)
+    auth_version = db.Column(db.Integer, nullable=False, default=1)
     
     # Relationships
     topics = relationship("Topic", back_populates="user", cascade="all, delete-orphan")
 
     def __repr__(self) -> str:
         return f"<User {self.id} {self.username}>"
+
+    def get_id(self):
+        return f"{self.id}.{self.auth_version or 1}"
        
 class Topic(db.Model):
     __tablename__ = "topic"
+    __table_args__ = (
+        # Sidebar tree and paged listings: a user's topics by parent, newest first
+        db.Index("ix_topic_user_parent_created", "user_id", "parent_topic_id", "created_at", "id"),
+        # Subtopic lookups, including loading Topic.subtopics
+        db.Index("ix_topic_parent_topic_id", "parent_topic_id"),
+    )
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(120), nullable=False)
     description = db.Column(db.Text, nullable=True)
@@ -42,8 +55,100 @@ class Topic(db.Model):
         """Check if this topic is a subtopic"""
         return self.parent_topic_id is not None
     
+class TopicClosure(db.Model):
+    """An ancestor/descendant pair of the topic tree, maintained by topic_closure.py.
+
+    Every topic is also paired with itself at depth 0.
+    """
+    __tablename__ = "topic_closure"
+    __table_args__ = (
+        # Ancestors of a topic (breadcrumbs), nearest first
+        db.Index("ix_topic_closure_descendant_depth", "descendant_id", "depth"),
+    )
+
+    ancestor_id: Mapped[int] = mapped_column(ForeignKey("topic.id", ondelete="CASCADE"), primary_key=True)
+    descendant_id: Mapped[int] = mapped_column(ForeignKey("topic.id", ondelete="CASCADE"), primary_key=True)
+    # Levels between the two: 1 for a direct subtopic
+    depth: Mapped[int] = mapped_column(nullable=False)
+
+    def __repr__(self) -> str:
+        return f"<TopicClosure {self.ancestor_id}->{self.descendant_id} {self.depth}>"
+
+class TopicStats(db.Model):
+    """Counters for a topic's dashboard card, maintained by topic_stats.py"""
+    __tablename__ = "topic_stats"
+
+    topic_id: Mapped[int] = mapped_column(ForeignKey("topic.id", ondelete="CASCADE"), primary_key=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("user_table.id"), nullable=False, index=True)
+
+    resource_count: Mapped[int] = mapped_column(default=0)
+    note_count: Mapped[int] = mapped_column(default=0)
+    flashcard_count: Mapped[int] = mapped_column(default=0)
+    subtopic_count: Mapped[int] = mapped_column(default=0)
+    # Sum of the file sizes of the topic's PDF resources
+    bytes_uploaded: Mapped[int] = mapped_column(db.BigInteger, default=0)
+
+    def __repr__(self) -> str:
+        return f"<TopicStats {self.topic_id}>"
+
+class StorageUsage(db.Model):
+    """Bytes of PDF files a user has stored, maintained by quota.py"""
+    __tablename__ = "storage_usage"
+
+    user_id: Mapped[int] = mapped_column(ForeignKey("user_table.id", ondelete="CASCADE"), primary_key=True)
+    bytes_used: Mapped[int] = mapped_column(db.BigInteger, default=0)
+    # Resources with a stored file
+    file_count: Mapped[int] = mapped_column(default=0)
+
+    def __repr__(self) -> str:
+        return f"<StorageUsage {self.user_id}>"
+
+class GenerationUsage(db.Model):
+    """Exercise generation counters for a topic, maintained by generation.py"""
+    __tablename__ = "generation_usage"
+
+    topic_id: Mapped[int] = mapped_column(ForeignKey("topic.id", ondelete="CASCADE"), primary_key=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("user_table.id"), nullable=False, index=True)
+
+    requests: Mapped[int] = mapped_column(default=0)
+    # Answered from generation_cache, or by waiting on an identical request in flight
+    cache_hits: Mapped[int] = mapped_column(default=0)
+    shared: Mapped[int] = mapped_column(default=0)
+    provider_calls: Mapped[int] = mapped_column(default=0)
+    input_tokens: Mapped[int] = mapped_column(db.BigInteger, default=0)
+    output_tokens: Mapped[int] = mapped_column(db.BigInteger, default=0)
+    cost_micros: Mapped[int] = mapped_column(db.BigInteger, default=0)  # millionths of a dollar
+    latency_ms: Mapped[int] = mapped_column(db.BigInteger, default=0)  # summed over provider calls
+
+    def __repr__(self) -> str:
+        return f"<GenerationUsage {self.topic_id}>"
+
+class GenerationCache(db.Model):
+    """A provider's answer, keyed by the hash of everything that went into the prompt"""
+    __tablename__ = "generation_cache"
+
+    key: Mapped[str] = mapped_column(db.String(64), primary_key=True)
+    provider: Mapped[str] = mapped_column(db.String(50), nullable=False)
+    model: Mapped[str] = mapped_column(db.String(100), nullable=False)
+    exercises: Mapped[str] = mapped_column(db.Text, nullable=False)  # JSON list of {question, answer}
+
+    input_tokens: Mapped[int] = mapped_column(default=0)
+    output_tokens: Mapped[int] = mapped_column(default=0)
+    cost_micros: Mapped[int] = mapped_column(db.BigInteger, default=0)
+    latency_ms: Mapped[int] = mapped_column(default=0)
+    hit_count: Mapped[int] = mapped_column(default=0)
+
+    created_at: Mapped[datetime] = mapped_column(default=datetime.utcnow, index=True)
+
+    def __repr__(self) -> str:
+        return f"<GenerationCache {self.key[:12]} {self.provider}>"
+
 class Resource(db.Model):
     __tablename__ = "resource"
+    __table_args__ = (
+        # Paged listings of a topic's resources (see api.py)
+        db.Index("ix_resource_topic_created", "topic_id", "created_at", "id"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
 
@@ -55,14 +160,22 @@ class Resource(db.Model):
         # "pdf" or "link"
     )
 
-    # For links
+    # For links; url_hash keys the shared LinkMetadata row (see links.py)
     url: Mapped[str | None] = mapped_column(db.Text)
-    
+    url_hash: Mapped[str | None] = mapped_column(db.String(64), index=True)
+
     # For PDF files
     file_path: Mapped[str | None] = mapped_column(db.Text)
     file_size: Mapped[int | None] = mapped_column(db.Integer)
     original_filename: Mapped[str | None] = mapped_column(db.String(255))
+    # SHA-256 of the stored blob (see Blob); None for files saved before the blob store
+    content_hash: Mapped[str | None] = mapped_column(db.String(64), index=True)
+
+    # Derived from the PDF by background jobs (see processing.py)
+    page_count: Mapped[int | None] = mapped_column(db.Integer)
+    thumbnail_path: Mapped[str | None] = mapped_column(db.Text)
 
+    # "pending" -> "processing" -> "active" / "failed" while PDF jobs run
     status: Mapped[str] = mapped_column(db.String(20), default="active")
 
     created_at: Mapped[datetime] = mapped_column(default=datetime.utcnow)
@@ -86,6 +199,12 @@ class Resource(db.Model):
 
     user = relationship("User")
     topic = relationship("Topic", backref="resources")
+    link_metadata = relationship(
+        "LinkMetadata",
+        primaryjoin="foreign(Resource.url_hash) == LinkMetadata.url_hash",
+        viewonly=True,
+        lazy="selectin",
+    )
 
     def is_pdf(self) -> bool:
         """Check if resource is a PDF file"""
@@ -95,14 +214,106 @@ class Resource(db.Model):
         """Check if resource is a URL link"""
         return self.resource_type == "link" and self.url is not None
 
+class Blob(db.Model):
+    """A content-addressed upload stored once under UPLOAD_FOLDER/blobs"""
+    __tablename__ = "blob"
+
+    sha256: Mapped[str] = mapped_column(db.String(64), primary_key=True)
+    size: Mapped[int] = mapped_column(db.BigInteger, nullable=False)
+
+    # Number of Resource rows pointing at this blob
+    ref_count: Mapped[int] = mapped_column(default=0)
+
+    created_at: Mapped[datetime] = mapped_column(default=datetime.utcnow)
+
+    def __repr__(self) -> str:
+        return f"<Blob {self.sha256[:12]} refs={self.ref_count}>"
+
+class LinkMetadata(db.Model):
+    """What a link points at, fetched once per normalised URL for every user (see links.py)"""
+    __tablename__ = "link_metadata"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    # SHA-256 of the normalised URL
+    url_hash: Mapped[str] = mapped_column(db.String(64), unique=True, nullable=False)
+    url: Mapped[str] = mapped_column(db.Text, nullable=False)
+    # Where the URL ended up after redirects
+    final_url: Mapped[str | None] = mapped_column(db.Text)
+
+    title: Mapped[str | None] = mapped_column(db.String(300))
+    description: Mapped[str | None] = mapped_column(db.Text)
+    favicon_url: Mapped[str | None] = mapped_column(db.Text)
+    content_type: Mapped[str | None] = mapped_column(db.String(100))
+    status_code: Mapped[int | None]
+
+    # Validators sent back on revalidation
+    etag: Mapped[str | None] = mapped_column(db.String(255))
+    last_modified: Mapped[str | None] = mapped_column(db.String(64))
+
+    fetched_at: Mapped[datetime | None]
+    # Due for a (re)fetch from then on; pushed ahead while a worker fetches it
+    next_fetch_at: Mapped[datetime] = mapped_column(default=datetime.utcnow, index=True)
+    error: Mapped[str | None] = mapped_column(db.Text)
+    fail_count: Mapped[int] = mapped_column(default=0)
+
+    def __repr__(self) -> str:
+        return f"<LinkMetadata {self.url}>"
+
+class Job(db.Model):
+    """A unit of background work, persisted so it survives restarts"""
+    __tablename__ = "job"
+    __table_args__ = (
+        db.Index("ix_job_status_run_at", "status", "run_at"),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    kind: Mapped[str] = mapped_column(db.String(50), nullable=False)
+
+    # Idempotency key: a job with the same key is only ever queued once
+    key: Mapped[str | None] = mapped_column(db.String(255), unique=True)
+
+    # What the job works on, e.g. "resource:42"
+    subject: Mapped[str | None] = mapped_column(db.String(100), index=True)
+
+    payload: Mapped[str] = mapped_column(db.Text, default="{}")
+
+    # "queued", "running", "done" or "failed"
+    status: Mapped[str] = mapped_column(db.String(20), default="queued")
+    attempts: Mapped[int] = mapped_column(default=0)
+    max_attempts: Mapped[int] = mapped_column(default=5)
+    last_error: Mapped[str | None] = mapped_column(db.Text)
+
+    run_at: Mapped[datetime] = mapped_column(default=datetime.utcnow)
+    created_at: Mapped[datetime] = mapped_column(default=datetime.utcnow)
+    updated_at: Mapped[datetime] = mapped_column(
+        default=datetime.utcnow,
+        onupdate=datetime.utcnow
+    )
+
+    def __repr__(self) -> str:
+        return f"<Job {self.id} {self.kind} {self.status}>"
+
 class Note(db.Model):
     __tablename__ = "note"
+    __table_args__ = (
+        # Paged listings of a topic's notes (see api.py)
+        db.Index("ix_note_topic_created", "topic_id", "created_at", "id"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
 
     title: Mapped[str] = mapped_column(db.String(200), nullable=False)
     content: Mapped[str] = mapped_column(db.Text, nullable=False)
 
+    # Bumped when the title or content changes (see revisions.py); any UPDATE
+    # made against an older revision fails
+    revision: Mapped[int] = mapped_column(default=1)
+
+    # Markdown rendered when the content changes (see rendering.py); content_hash
+    # is the SHA-256 of the content it was rendered from
+    content_hash: Mapped[str | None] = mapped_column(db.String(64))
+    rendered_html: Mapped[str | None] = mapped_column(db.Text)
+
     is_ai_generated: Mapped[bool] = mapped_column(default=False)
 
     created_at: Mapped[datetime] = mapped_column(default=datetime.now)
@@ -127,8 +338,38 @@ class Note(db.Model):
     user = relationship("User")
     topic = relationship("Topic", backref="notes")
 
+    __mapper_args__ = {"version_id_col": revision, "version_id_generator": False}
+
+class NoteRevision(db.Model):
+    """One step of a note's history: a full snapshot or a patch on the revision before it"""
+    __tablename__ = "note_revision"
+    __table_args__ = (
+        db.UniqueConstraint("note_id", "revision", name="uq_note_revision_note_revision"),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    note_id: Mapped[int] = mapped_column(ForeignKey("note.id", ondelete="CASCADE"), nullable=False)
+    revision: Mapped[int] = mapped_column(nullable=False)
+
+    # "snapshot" (title and content) or "patch" (ops, and title if it changed)
+    kind: Mapped[str] = mapped_column(db.String(10), nullable=False)
+    title: Mapped[str | None] = mapped_column(db.String(200))
+    content: Mapped[str | None] = mapped_column(db.Text)
+    ops: Mapped[str | None] = mapped_column(db.Text)  # JSON list of {pos, del, ins}
+
+    created_at: Mapped[datetime] = mapped_column(default=datetime.utcnow)
+
+    def __repr__(self) -> str:
+        return f"<NoteRevision {self.note_id}@{self.revision} {self.kind}>"
+
 class Flashcard(db.Model):
     __tablename__ = "flashcard"
+    __table_args__ = (
+        # Due queue: the next cards to review for a user, in order
+        db.Index("ix_flashcard_user_next_review", "user_id", "next_review_at"),
+        # Paged listings of a topic's cards (see api.py)
+        db.Index("ix_flashcard_topic_created", "topic_id", "created_at", "id"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
 
@@ -138,8 +379,14 @@ class Flashcard(db.Model):
     difficulty: Mapped[int] = mapped_column(default=1)
     # 1 = easy, 5 = hard
 
+    # SM-2 scheduling state (see review.py)
+    ease_factor: Mapped[float] = mapped_column(default=2.5)
+    interval_days: Mapped[float] = mapped_column(default=0.0)
+    repetitions: Mapped[int] = mapped_column(default=0)
+
     last_reviewed_at: Mapped[datetime | None]
-    next_review_at: Mapped[datetime | None]
+    # New cards are due straight away
+    next_review_at: Mapped[datetime | None] = mapped_column(default=datetime.utcnow)
 
     created_at: Mapped[datetime] = mapped_column(default=datetime.utcnow)
 
@@ -1,8 +1,12 @@
-import datetime
 from flask import Blueprint, flash, jsonify, redirect, render_template, request, url_for
 from flask_login import current_user, login_required
+from sqlalchemy.orm.exc import StaleDataError
 from .models import Topic, Note
 from .extensions import db
+from .rendering import render_note
+from .revisions import (
+    InvalidPatch, apply_patch, list_revisions, note_at_revision, record_snapshot, replace_content,
+)
 
 bp = Blueprint('note', __name__, url_prefix='/note')
 
@@ -50,6 +54,8 @@ def save_note(topic_id):
         )
 
         db.session.add(note)
+        db.session.flush()
+        record_snapshot(note)
         db.session.commit()
 
         # Return the note_id so JavaScript can redirect
@@ -68,11 +74,99 @@ def update_note(note_id):
 
     if request.method == 'POST':
         data = request.get_json()
-        note.title = data.get('title')
-        note.content = data.get('content')
-        note.updated_at = datetime.datetime.utcnow()  # Update timestamp if you have this field
+        # Clients that send the revision they edited get the same stale check as patches
+        base_revision = data.get('revision')
+        if base_revision is not None and base_revision != note.revision:
+            return _conflict(note)
+        try:
+            # Autosave sends unchanged notes too; those are not a new revision
+            replace_content(note, data.get('title'), data.get('content'))
+            db.session.commit()
+        except StaleDataError:
+            db.session.rollback()
+            return _conflict(db.session.get(Note, note_id))
+        return jsonify({'success': True, 'revision': note.revision})
+
+def _conflict(note):
+    """409 with the latest version, so the client can rebase or reload"""
+    return jsonify({
+        'success': False,
+        'error': 'Note was changed elsewhere',
+        'revision': note.revision,
+        'title': note.title,
+        'content': note.content,
+    }), 409
+
+@bp.route("<int:note_id>/patch", methods=["POST"])
+@login_required
+def patch_note(note_id):
+    """Apply text edits made against a known revision: {revision, ops: [{pos, del, ins}], title?}"""
+    note = Note.query.filter_by(id=note_id, user_id=current_user.id).first()
+    if not note:
+        return jsonify({'success': False, 'error': 'Note not found'}), 404
+
+    data = request.get_json(silent=True) or {}
+    base_revision = data.get('revision')
+    if not isinstance(base_revision, int):
+        return jsonify({'success': False, 'error': 'revision is required'}), 400
+    title = data.get('title')
+    if title is not None and not isinstance(title, str):
+        return jsonify({'success': False, 'error': 'title must be a string'}), 400
+    # Cheap guard against a client whose base text differs from ours
+    base_length = data.get('length')
+    if base_revision == note.revision and base_length is not None and base_length != len(note.content):
+        return _conflict(note)
+
+    try:
+        applied = apply_patch(note, base_revision, data.get('ops', []), title)
+        if not applied:
+            return _conflict(note)
         db.session.commit()
-        return jsonify({'success': True})
+    except InvalidPatch as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except StaleDataError:
+        db.session.rollback()
+        return _conflict(db.session.get(Note, note_id))
+
+    return jsonify({'success': True, 'revision': note.revision})
+
+@bp.route("<int:note_id>/revisions")
+@login_required
+def note_revisions(note_id):
+    """Revision history of a note, newest first"""
+    note = Note.query.filter_by(id=note_id, user_id=current_user.id).first()
+    if not note:
+        return jsonify({'success': False, 'error': 'Note not found'}), 404
+    return jsonify({
+        'revision': note.revision,
+        'revisions': [
+            {'revision': r.revision, 'kind': r.kind, 'created_at': r.created_at.isoformat()}
+            for r in list_revisions(note.id)
+        ],
+    })
+
+@bp.route("<int:note_id>/revisions/<int:revision>")
+@login_required
+def note_revision(note_id, revision):
+    """A note's title and content as of a past revision"""
+    note = Note.query.filter_by(id=note_id, user_id=current_user.id).first()
+    if not note:
+        return jsonify({'success': False, 'error': 'Note not found'}), 404
+    version = note_at_revision(note.id, revision)
+    if version is None:
+        return jsonify({'success': False, 'error': 'Revision not available'}), 404
+    title, content = version
+    return jsonify({'revision': revision, 'title': title, 'content': content})
+
+@bp.route("<int:note_id>/html")
+@login_required
+def rendered_note(note_id):
+    """The saved content of a note rendered from markdown"""
+    note = Note.query.filter_by(id=note_id, user_id=current_user.id).first()
+    if not note:
+        return jsonify({'success': False, 'error': 'Note not found'}), 404
+    return jsonify({'success': True, 'revision': note.revision, 'html': str(render_note(note))})
 
 # Route to view a specific note
 @bp.route("/notes/<int:note_id>")
@@ -0,0 +1,122 @@
+from collections import namedtuple
+from flask import current_app, has_app_context, has_request_context, session as cookie_session
+from sqlalchemy import event
+from sqlalchemy.orm import Session, make_transient_to_detached, object_session
+from .cache import cache_stats, make_backend
+from .extensions import db
+from .models import User
+
+# What a request needs to know about the signed-in user
+Principal = namedtuple("Principal", "id username email auth_version")
+
+stats = cache_stats("principal")
+
+# session.info key: user ids to invalidate once the transaction commits
+_PENDING_KEY = "principal_invalidate"
+
+# Every user started at this auth_version, so sessions that signed in
+# before it existed (a bare user id) belong to it
+LEGACY_AUTH_VERSION = 1
+
+
+def _cache():
+    return current_app.extensions['principal_cache']
+
+
+def _key(user_id):
+    return f"principal:{user_id}"
+
+
+def parse_session_id(session_id):
+    """Split "<id>.<auth_version>" into ints; a bare id from older sessions gets LEGACY_AUTH_VERSION"""
+    user_id, _, version = str(session_id).partition(".")
+    try:
+        return int(user_id), int(version) if version else LEGACY_AUTH_VERSION
+    except ValueError:
+        return None, None
+
+
+def _from_principal(principal):
+    """A User bound to the current session, built without a SELECT.
+
+    Columns outside the snapshot (such as the password hash) are expired
+    and load on first access.
+    """
+    user = User(id=principal.id, username=principal.username, email=principal.email,
+                auth_version=principal.auth_version)
+    make_transient_to_detached(user)
+    return db.session.merge(user, load=False)
+
+
+def load_principal(session_id):
+    """Flask-Login user_loader: the user for a session id, served from the cache"""
+    user_id, version = parse_session_id(session_id)
+    if user_id is None:
+        return None
+
+    cache = _cache()
+    principal = cache.get(_key(user_id))
+    if principal is not None and version == principal.auth_version:
+        stats.hit()
+        _upgrade_session_id(session_id, principal)
+        return _from_principal(principal)
+
+    stats.miss()
+    user = db.session.get(User, user_id)
+    if user is None:
+        return None
+    if version != user.auth_version:
+        # The password changed since this session signed in
+        return None
+    cache.set(_key(user_id), Principal(user.id, user.username, user.email, user.auth_version))
+    _upgrade_session_id(session_id, user)
+    return user
+
+
+def _upgrade_session_id(session_id, user):
+    """Give a still-valid bare-id session its explicit "<id>.<auth_version>" form"""
+    if "." not in str(session_id) and has_request_context() and cookie_session.get('_user_id') == session_id:
+        cookie_session['_user_id'] = f"{user.id}.{user.auth_version}"
+
+
+def invalidate_principal(user_id):
+    """Drop a cached principal; call after bulk statements that bypass the ORM"""
+    if has_app_context() and 'principal_cache' in current_app.extensions:
+        _cache().delete(_key(user_id))
+        stats.invalidated()
+
+
+def _user_changed(mapper, connection, target):
+    invalidate_principal(target.id)
+    # Again after commit, in case a concurrent request re-cached the old row
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault(_PENDING_KEY, set()).add(target.id)
+
+
+event.listen(User, "after_update", _user_changed)
+event.listen(User, "after_delete", _user_changed)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed(session):
+    # Savepoints fire this too, before the outer transaction commits
+    if session.in_nested_transaction():
+        return
+    for user_id in session.info.pop(_PENDING_KEY, ()):
+        invalidate_principal(user_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_pending(session):
+    if session.in_nested_transaction():
+        return
+    session.info.pop(_PENDING_KEY, None)
+
+
+def init_app(app):
+    app.extensions['principal_cache'] = make_backend(
+        app,
+        max_entries=app.config['PRINCIPAL_CACHE_SIZE'],
+        ttl=app.config['PRINCIPAL_CACHE_TTL'],
+    )
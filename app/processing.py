@@ -0,0 +1,145 @@
+import os
+import shutil
+import subprocess
+import tempfile
+from flask import current_app
+from pypdf import PdfReader
+from sqlalchemy import func, select
+from .extensions import db
+from .jobs import enqueue, job_handler, on_job_finished
+from .models import Job, Resource
+from .search import index_resource_text
+from .storage import get_storage, staging_dir
+
+# Cap on extracted text per PDF so a huge book cannot bloat the search index
+MAX_TEXT_CHARS = 2_000_000
+
+THUMBNAIL_WIDTH = 320
+
+PDF_JOBS = ("pdf.extract_text", "pdf.page_count", "pdf.thumbnail")
+
+
+def _subject(resource_id):
+    return f"resource:{resource_id}"
+
+
+def queue_pdf_processing(resource):
+    """Mark a freshly uploaded PDF resource as pending and queue its jobs.
+
+    The resource must already be flushed so it has an id. Job keys include
+    the content hash, so jobs still queued for this content are not queued
+    twice. Ones that already finished (the resource went back to a file it
+    had before) run again, since the resource lost its derived fields.
+    """
+    resource.status = 'pending'
+    for kind in PDF_JOBS:
+        enqueue(
+            kind,
+            payload={'resource_id': resource.id},
+            key=f"{kind}:{resource.id}:{resource.content_hash}",
+            subject=_subject(resource.id),
+            rerun=True,
+        )
+
+
+def _start(payload):
+    """Load the resource a job works on and flag it as processing"""
+    resource = db.session.get(Resource, payload['resource_id'])
+    if resource is None or not resource.is_pdf():
+        return None
+    if resource.status == 'pending':
+        resource.status = 'processing'
+        db.session.commit()
+    return resource
+
+
+@job_handler("pdf.extract_text")
+def extract_text(payload):
+    """Index the text of a PDF for search"""
+    resource = _start(payload)
+    if resource is None:
+        return
+
+    parts = []
+    length = 0
+    with get_storage().local_copy(resource.file_path) as path:
+        for page in PdfReader(path).pages:
+            text = page.extract_text() or ""
+            parts.append(text)
+            length += len(text)
+            if length >= MAX_TEXT_CHARS:
+                break
+
+    index_resource_text(resource.id, "\n".join(parts)[:MAX_TEXT_CHARS])
+    db.session.commit()
+
+
+@job_handler("pdf.page_count")
+def count_pages(payload):
+    """Record the number of pages of a PDF"""
+    resource = _start(payload)
+    if resource is None:
+        return
+
+    with get_storage().local_copy(resource.file_path) as path:
+        resource.page_count = len(PdfReader(path).pages)
+    db.session.commit()
+
+
+@job_handler("pdf.thumbnail")
+def render_thumbnail(payload):
+    """Render the first page of a PDF to a PNG next to its blob.
+
+    Needs poppler's pdftoppm; without it the resource simply keeps the
+    generic icon.
+    """
+    resource = _start(payload)
+    if resource is None:
+        return
+
+    pdftoppm = shutil.which("pdftoppm")
+    if not pdftoppm:
+        current_app.logger.info("pdftoppm not found, skipping thumbnail for resource %s", resource.id)
+        return
+
+    # Thumbnails follow the blob, so identical uploads share one
+    thumbnail_path = resource.file_path + ".png"
+    storage = get_storage()
+
+    if not storage.exists(thumbnail_path):
+        with storage.local_copy(resource.file_path) as path, \
+                tempfile.TemporaryDirectory(dir=staging_dir()) as tmp_dir:
+            out_prefix = os.path.join(tmp_dir, "thumb")
+            subprocess.run(
+                [pdftoppm, "-png", "-f", "1", "-l", "1", "-singlefile",
+                 "-scale-to-x", str(THUMBNAIL_WIDTH), "-scale-to-y", "-1", path, out_prefix],
+                check=True, capture_output=True, timeout=60,
+            )
+            storage.save_file(thumbnail_path, out_prefix + ".png")
+
+    resource.thumbnail_path = thumbnail_path
+    db.session.commit()
+
+
+@on_job_finished
+def _update_resource_status(job):
+    """Settle a resource as active or failed once all of its jobs are finished"""
+    if not (job.subject or "").startswith("resource:"):
+        return
+
+    resource = db.session.get(Resource, int(job.subject.split(":", 1)[1]))
+    if resource is None:
+        return
+
+    # Only the jobs for the file the resource currently points at
+    keys = [f"{kind}:{resource.id}:{resource.content_hash}" for kind in PDF_JOBS]
+    counts = dict(db.session.execute(
+        select(Job.status, func.count()).where(Job.key.in_(keys)).group_by(Job.status)
+    ).all())
+
+    if counts.get('failed'):
+        resource.status = 'failed'
+    elif counts.get('queued') or counts.get('running'):
+        resource.status = 'processing'
+    else:
+        resource.status = 'active'
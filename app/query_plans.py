@@ -0,0 +1,78 @@
+from datetime import datetime
+from sqlalchemy import func, select, tuple_
+from .models import Blob, Flashcard, Job, Note, Resource, Topic, TopicClosure, TopicStats, User
+
+
+def hot_queries():
+    """(name, statement) for the lookups the blueprints run on every request"""
+    now = datetime.utcnow()
+    return [
+        ("auth.login", select(User).where(User.email == "someone@example.com")),
+        ("load_user", select(User).where(User.id == 1)),
+        ("topic_tree", select(Topic.id, Topic.name, Topic.description, Topic.parent_topic_id, Topic.created_at)
+            .where(Topic.user_id == 1)),
+        ("topic.view_topic", select(Topic).where(Topic.id == 1, Topic.user_id == 1)),
+        ("topic.subtopics", select(Topic).where(Topic.parent_topic_id.in_([1, 2]))),
+        ("topic.resources", select(Resource).where(Resource.topic_id.in_([1, 2]))),
+        ("topic.notes", select(Note).where(Note.topic_id.in_([1, 2]))),
+        ("note.by_owner", select(Note).where(Note.id == 1, Note.user_id == 1)),
+        ("resource.by_owner", select(Resource).where(Resource.id == 1, Resource.user_id == 1)),
+        ("review.due_cards", select(Flashcard)
+            .where(Flashcard.user_id == 1, Flashcard.next_review_at <= now)
+            .order_by(Flashcard.next_review_at).limit(20)),
+        ("jobs.claim_next", select(Job.id)
+            .where(Job.status == 'queued', Job.run_at <= now)
+            .order_by(Job.run_at, Job.id).limit(1)),
+        ("jobs.by_key", select(Job).where(Job.key == "pdf.page_count:1:abc")),
+        ("blobstore.exists", select(Blob.sha256).where(Blob.sha256 == "0" * 64)),
+        ("api.list_topics", select(Topic.id, Topic.name, Topic.created_at)
+            .where(Topic.user_id == 1, Topic.parent_topic_id.is_(None),
+                   tuple_(Topic.created_at, Topic.id) < (now, 100))
+            .order_by(Topic.created_at.desc(), Topic.id.desc()).limit(21)),
+        ("api.list_notes", select(Note.id, Note.title, Note.created_at)
+            .where(Note.user_id == 1, Note.topic_id == 1, tuple_(Note.created_at, Note.id) < (now, 100))
+            .order_by(Note.created_at.desc(), Note.id.desc()).limit(21)),
+        ("topic_stats.for_user", select(TopicStats.topic_id, TopicStats.note_count,
+                                        select(func.count()).where(Flashcard.topic_id == TopicStats.topic_id,
+                                                                   Flashcard.next_review_at <= now)
+                                        .scalar_subquery())
+            .where(TopicStats.user_id == 1)),
+        ("transfer.export_notes", select(Note.id).where(Note.user_id == 1).order_by(Note.id)),
+        ("topic_closure.subtree", select(TopicClosure.descendant_id).where(TopicClosure.ancestor_id == 1)),
+        ("topic_closure.breadcrumbs", select(Topic.id, Topic.name)
+            .join(TopicClosure, TopicClosure.ancestor_id == Topic.id)
+            .where(TopicClosure.descendant_id == 1, TopicClosure.depth > 0)
+            .order_by(TopicClosure.depth.desc())),
+        ("topic_closure.notes_under", select(Note.id).where(
+            Note.topic_id.in_(select(TopicClosure.descendant_id).where(TopicClosure.ancestor_id == 1)))),
+    ]
+
+
+def explain(connection, statement):
+    """The plan lines for a statement on this connection's backend"""
+    compiled = statement.compile(dialect=connection.dialect, compile_kwargs={"render_postcompile": True})
+    params = compiled.params
+    if compiled.positional:
+        params = tuple(params[name] for name in compiled.positiontup)
+    prefix = "EXPLAIN QUERY PLAN " if connection.dialect.name == "sqlite" else "EXPLAIN "
+    return [row[-1] for row in connection.exec_driver_sql(prefix + str(compiled), params)]
+
+
+def is_full_scan(line, dialect_name):
+    if dialect_name == "sqlite":
+        return line.startswith("SCAN ") and "VIRTUAL TABLE" not in line and line != "SCAN CONSTANT ROW"
+    return "Seq Scan" in line
+
+
+def check_plans(engine):
+    """Plan every hot query; returns {name: (plan lines, uses a full scan)}"""
+    report = {}
+    with engine.begin() as connection:
+        if engine.dialect.name == "postgresql":
+            # Empty CI tables make a sequential scan the cheapest plan; ask
+            # the planner whether an index path exists at all
+            connection.exec_driver_sql("SET LOCAL enable_seqscan = off")
+        for name, statement in hot_queries():
+            lines = explain(connection, statement)
+            report[name] = (lines, any(is_full_scan(line, engine.dialect.name) for line in lines))
+    return report
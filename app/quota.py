@@ -0,0 +1,210 @@
+"""Per-user storage quota, with usage kept in the storage_usage table.
+
+A user's usage is the sum of the file sizes of their PDF resources; a
+file shared by two resources counts for both. The row is updated by the
+mapper events below in the same transaction as the resource change, so
+reading it is one primary key lookup however large the library. A change
+that would take a user over STORAGE_QUOTA_BYTES fails in the same UPDATE
+that charges it, which keeps concurrent uploads from both slipping under
+the limit. Bulk statements skip the events: code that inserts or deletes
+resources in bulk calls charge() itself, before the statement. rebuild()
+recomputes every row.
+"""
+from collections import namedtuple
+from flask import abort, current_app, request
+from sqlalchemy import delete, event, func, insert, inspect, select, update
+from sqlalchemy.exc import IntegrityError
+from .extensions import db
+from .models import Resource, StorageUsage, User
+from .storage import get_storage
+
+Usage = namedtuple("Usage", "bytes_used file_count limit")
+
+_usage = StorageUsage.__table__
+_COUNTERS = ("bytes_used", "file_count")
+
+
+class QuotaExceeded(Exception):
+    """Storing a file would take a user over their storage quota"""
+
+    def __init__(self, user_id, requested, used, limit):
+        super().__init__(f"storage quota exceeded: {used + requested} of {limit} bytes")
+        self.user_id = user_id
+        self.requested = requested
+        self.used = used
+        self.limit = limit
+
+
+def limit():
+    """Bytes each user may store; None for no limit"""
+    return current_app.config.get('STORAGE_QUOTA_BYTES') or None
+
+
+def _computed(user_ids=None):
+    """SELECT of (user_id, bytes_used, file_count) computed from the resource table"""
+    statement = select(
+        User.id,
+        select(func.coalesce(func.sum(Resource.file_size), 0))
+        .where(Resource.user_id == User.id).scalar_subquery(),
+        select(func.count(Resource.file_size))
+        .where(Resource.user_id == User.id).scalar_subquery(),
+    )
+    if user_ids is not None:
+        statement = statement.where(User.id.in_(user_ids))
+    return statement
+
+
+def _fill(connection, user_ids=None):
+    connection.execute(insert(_usage).from_select(("user_id",) + _COUNTERS, _computed(user_ids)))
+
+
+def _used(connection, user_id):
+    return connection.execute(select(_usage.c.bytes_used).where(_usage.c.user_id == user_id)).scalar()
+
+
+def charge(connection, user_id, size, files=0):
+    """Add size bytes (negative to release) to a user's usage, creating the row if it is missing.
+
+    Call it before the resources change: a missing row is counted from
+    the resource table as it stands. Raises QuotaExceeded, changing
+    nothing, if a positive charge would go over the limit.
+    """
+    if user_id is None or not (size or files):
+        return
+    cap = limit() if size > 0 else None
+    statement = (
+        update(_usage).where(_usage.c.user_id == user_id)
+        .values(bytes_used=_usage.c.bytes_used + size, file_count=_usage.c.file_count + files)
+    )
+    if cap is not None:
+        statement = statement.where(_usage.c.bytes_used + size <= cap)
+    if connection.execute(statement).rowcount:
+        return
+
+    used = _used(connection, user_id)
+    if used is None:
+        try:
+            with connection.begin_nested():
+                _fill(connection, [user_id])
+        except IntegrityError:
+            # Created concurrently by another upload
+            pass
+        if connection.execute(statement).rowcount:
+            return
+        used = _used(connection, user_id)
+    raise QuotaExceeded(user_id, size, used, cap)
+
+
+def for_user(user_id):
+    """A user's Usage; users without a row yet are counted from their resources"""
+    row = db.session.execute(
+        select(_usage.c.bytes_used, _usage.c.file_count).where(_usage.c.user_id == user_id)
+    ).first()
+    if row is None:
+        row = db.session.execute(_computed([user_id])).first()[1:]
+    return Usage(*row, limit())
+
+
+def remaining(user_id):
+    """Bytes a user may still store; None for no limit"""
+    usage = for_user(user_id)
+    if usage.limit is None:
+        return None
+    return max(usage.limit - usage.bytes_used, 0)
+
+
+def reject_oversized_upload(user_id, freed=0):
+    """Answer 413 before the body is read if the request cannot fit in the user's quota.
+
+    Content-Length covers the whole form, so up to
+    STORAGE_QUOTA_FORM_OVERHEAD bytes of it are allowed for the other
+    fields; the exact file size is checked again when it is charged.
+    freed is what the request gives back, e.g. the file it replaces.
+    """
+    room = remaining(user_id)
+    if room is None or request.content_length is None:
+        return
+    if request.content_length > room + freed + current_app.config['STORAGE_QUOTA_FORM_OVERHEAD']:
+        abort(413, description="This upload would exceed your storage quota.")
+
+
+def rebuild(connection):
+    """Recompute every row from the resource table"""
+    connection.execute(delete(_usage))
+    _fill(connection)
+
+
+def check(connection):
+    """Rows whose stored counters differ from the resource table: [(user_id, stored, actual)]"""
+    stored = {row[0]: tuple(row[1:]) for row in connection.execute(
+        select(_usage.c.user_id, *(_usage.c[name] for name in _COUNTERS))
+    )}
+    problems = []
+    for row in connection.execute(_computed()):
+        user_id, actual = row[0], tuple(row[1:])
+        counters = stored.pop(user_id, None)
+        # Users get a row with their first file
+        if counters != actual and not (counters is None and actual == (0, 0)):
+            problems.append((user_id, counters, actual))
+    problems += [(user_id, counters, None) for user_id, counters in stored.items()]
+    return problems
+
+
+def sync_file_sizes(connection):
+    """Set file_size from the stored files, for rows where they disagree.
+
+    Returns (resources fixed, file paths that are missing from storage).
+    Missing files keep their recorded size. Run rebuild() afterwards.
+    """
+    storage = get_storage()
+    resource = Resource.__table__
+    fixed, missing = 0, []
+    for file_path, recorded in connection.execute(
+        select(resource.c.file_path, resource.c.file_size)
+        .where(resource.c.file_path.is_not(None)).distinct()
+    ).all():
+        try:
+            actual = storage.size(file_path)
+        except FileNotFoundError:
+            missing.append(file_path)
+            continue
+        if actual != recorded:
+            fixed += connection.execute(
+                update(resource).where(resource.c.file_path == file_path, resource.c.file_size.is_distinct_from(actual))
+                .values(file_size=actual)
+            ).rowcount
+    return fixed, sorted(set(missing))
+
+
+def _moved(target, attribute):
+    history = inspect(target).attrs[attribute].history
+    if not history.has_changes():
+        return None
+    return (history.deleted[0] if history.deleted else None,
+            history.added[0] if history.added else None)
+
+
+def _counted(size):
+    return 0 if size is None else 1
+
+
+@event.listens_for(Resource, "before_insert")
+def _resource_inserted(mapper, connection, target):
+    charge(connection, target.user_id, target.file_size or 0, _counted(target.file_size))
+
+
+@event.listens_for(Resource, "before_delete")
+def _resource_deleted(mapper, connection, target):
+    charge(connection, target.user_id, -(target.file_size or 0), -_counted(target.file_size))
+
+
+@event.listens_for(Resource, "before_update")
+def _resource_updated(mapper, connection, target):
+    resized = _moved(target, 'file_size')
+    if resized:
+        old, new = resized
+        charge(connection, target.user_id, (new or 0) - (old or 0), _counted(new) - _counted(old))
+
+
+def init_app(app):
+    app.jinja_env.globals['storage_usage'] = for_user
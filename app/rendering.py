@@ -0,0 +1,98 @@
+import hashlib
+from flask import current_app, has_app_context
+from markdown_it import MarkdownIt
+from markupsafe import Markup
+from sqlalchemy import event, inspect
+from .cache import LRUCache, cache_stats
+from .models import Note
+
+# Raw HTML in notes is escaped and unsafe link schemes (javascript: etc.) are
+# refused by the parser, so the output needs no separate sanitising pass
+_markdown = MarkdownIt("commonmark", {"html": False}).enable(["table", "strikethrough"])
+
+# Previews only look at the start of a note
+PREVIEW_SOURCE_CHARS = 2000
+
+stats = cache_stats("markdown")
+
+
+def content_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _cache():
+    return current_app.extensions['markdown_cache']
+
+
+def render_markdown(text):
+    """Markdown to safe HTML, memoised by content hash"""
+    text = text or ""
+    key = "html:" + content_hash(text)
+    html = _cache().get(key)
+    if html is not None:
+        stats.hit()
+        return Markup(html)
+    stats.miss()
+    html = _markdown.render(text)
+    _cache().set(key, html)
+    return Markup(html)
+
+
+def render_note(note):
+    """A note's HTML, from the persisted copy when it matches the current content"""
+    if note.rendered_html is not None and note.content_hash == content_hash(note.content or ""):
+        return Markup(note.rendered_html)
+    return render_markdown(note.content)
+
+
+def _plain_text(tokens):
+    parts = []
+    for token in tokens:
+        if token.type == "inline":
+            parts.append("".join(
+                child.content if child.type in ("text", "code_inline") else " "
+                for child in token.children or ()
+                if child.type in ("text", "code_inline", "softbreak", "hardbreak")
+            ))
+        elif token.type in ("fence", "code_block"):
+            parts.append(token.content)
+    return " ".join(" ".join(parts).split())
+
+
+def note_preview(content, length=100):
+    """Plain-text excerpt of a note's markdown, parsed from its first few blocks only"""
+    content = content or ""
+    key = f"preview:{length}:{content_hash(content)}"
+    preview = _cache().get(key)
+    if preview is not None:
+        return preview
+
+    head = content[:PREVIEW_SOURCE_CHARS]
+    text = _plain_text(_markdown.parse(head))
+    if len(text) > length:
+        text = text[:length].rsplit(" ", 1)[0].rstrip(" .,;:") + "…"
+    elif len(content) > len(head):
+        text += "…"
+    _cache().set(key, text)
+    return text
+
+
+@event.listens_for(Note, "before_insert")
+@event.listens_for(Note, "before_update")
+def _persist_rendered(mapper, connection, target):
+    """Render once when the content changes, not on every view"""
+    if not has_app_context() or not current_app.config.get('NOTE_PERSIST_RENDERED'):
+        return
+    if target.content_hash is not None and not inspect(target).attrs.content.history.has_changes():
+        return
+    digest = content_hash(target.content or "")
+    if digest != target.content_hash:
+        target.content_hash = digest
+        target.rendered_html = str(render_markdown(target.content))
+
+
+def init_app(app):
+    app.extensions['markdown_cache'] = LRUCache(max_entries=app.config['MARKDOWN_CACHE_SIZE'])
+    app.jinja_env.filters['markdown'] = render_markdown
+    app.jinja_env.filters['render_note'] = render_note
+    app.jinja_env.filters['note_preview'] = note_preview
@@ -1,10 +1,13 @@
-import os
 from datetime import datetime
-from flask import Blueprint, flash, jsonify, redirect, render_template, request, url_for, current_app, send_from_directory
+from flask import Blueprint, abort, flash, jsonify, redirect, render_template, request, url_for, current_app, send_file
 from flask_login import current_user, login_required
 from werkzeug.utils import secure_filename
 from .models import Topic, Resource
 from .extensions import db
+from . import blobstore, jobs, links, quota
+from .delivery import send_resource_file
+from .processing import queue_pdf_processing
+from .storage import get_storage
 
 bp = Blueprint('resource', __name__, url_prefix='/resource')
 
@@ -15,35 +18,16 @@ def allowed_file(filename):
            filename.rsplit('.', 1)[1].lower() in current_app.config['ALLOWED_EXTENSIONS']
 
 
-def save_uploaded_file(file, user_id, topic_id):
-    """Save uploaded file and return file path, size, and original filename"""
+def save_uploaded_file(file):
+    """Store an uploaded file and return file path, size, original filename and content hash"""
     if file and allowed_file(file.filename):
         filename = secure_filename(file.filename)
-        
-        # Create user-specific directory structure
-        user_upload_dir = os.path.join(
-            current_app.config['UPLOAD_FOLDER'],
-            str(user_id),
-            str(topic_id)
-        )
-        os.makedirs(user_upload_dir, exist_ok=True)
-        
-        # Add timestamp to avoid filename conflicts
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        base, ext = os.path.splitext(filename)
-        unique_filename = f"{base}_{timestamp}{ext}"
-        
-        file_path = os.path.join(user_upload_dir, unique_filename)
-        file.save(file_path)
-        
-        # Get file size
-        file_size = os.path.getsize(file_path)
-        
-        # Return relative path for database storage
-        relative_path = os.path.relpath(file_path, current_app.config['UPLOAD_FOLDER'])
-        return relative_path, file_size, filename
+
+        # Identical uploads share one content-addressed blob on disk
+        relative_path, content_hash, file_size = blobstore.store_upload(file)
+        return relative_path, file_size, filename, content_hash
     
-    return None, None, None
+    return None, None, None, None
 
 
 @bp.route('/<int:topic_id>/create', methods=['GET', 'POST'])
@@ -59,6 +43,9 @@ def create_resource(topic_id):
     if request.method == 'GET':
         return render_template('resource_form.html', topic=topic)
     
+    # Before request.form is touched, so an oversized upload is never read
+    quota.reject_oversized_upload(current_user.id)
+    
     # Handle POST request
     title = request.form.get('title')
     resource_type = request.form.get('resource_type')  # 'link' or 'pdf'
@@ -87,6 +74,7 @@ def create_resource(topic_id):
             flash('URL is required for link resources', 'error')
             return redirect(url_for('resource.create_resource', topic_id=topic_id))
         new_resource.url = url
+        links.attach(new_resource)
     
     # Handle PDF file upload
     elif resource_type == 'pdf':
@@ -98,9 +86,7 @@ def create_resource(topic_id):
             flash('Only PDF files are allowed', 'error')
             return redirect(url_for('resource.create_resource', topic_id=topic_id))
         
-        file_path, file_size, original_filename = save_uploaded_file(
-            file, current_user.id, topic.id
-        )
+        file_path, file_size, original_filename, content_hash = save_uploaded_file(file)
         
         if not file_path:
             flash('Failed to upload file', 'error')
@@ -109,12 +95,21 @@ def create_resource(topic_id):
         new_resource.file_path = file_path
         new_resource.file_size = file_size
         new_resource.original_filename = original_filename
+        new_resource.content_hash = content_hash
     
     try:
         db.session.add(new_resource)
+        if new_resource.is_pdf():
+            db.session.flush()
+            queue_pdf_processing(new_resource)
         db.session.commit()
+        jobs.kick()
         flash('Resource created successfully!', 'success')
         return redirect(url_for('topic.view_topic', topic_id=topic_id))
+    except quota.QuotaExceeded:
+        db.session.rollback()
+        flash('Not enough storage left for this file. Delete some PDFs and try again.', 'error')
+        return redirect(url_for('topic.view_topic', topic_id=topic_id))
     except Exception as e:
         db.session.rollback()
         flash(f'Error creating resource: {str(e)}', 'error')
@@ -147,6 +142,9 @@ def update_resource(resource_id):
     if request.method == 'GET':
         return render_template('resource_form.html', resource=resource)
     
+    # A new file replaces the old one, so its size is given back
+    quota.reject_oversized_upload(current_user.id, freed=resource.file_size or 0)
+    
     # Handle POST request
     title = request.form.get('title')
     
@@ -159,8 +157,9 @@ def update_resource(resource_id):
     # Update URL if it's a link resource
     if resource.is_link():
         url = request.form.get('url')
-        if url:
+        if url and url != resource.url:
             resource.url = url
+            links.attach(resource)
     
     # Update file if it's a PDF resource and new file is provided
     elif resource.is_pdf():
@@ -170,34 +169,31 @@ def update_resource(resource_id):
                 flash('Only PDF files are allowed', 'error')
                 return redirect(url_for('resource.update_resource', resource_id=resource_id))
             
-            # Delete old file
-            if resource.file_path:
-                old_file_path = os.path.join(
-                    current_app.config['UPLOAD_FOLDER'],
-                    resource.file_path
-                )
-                if os.path.exists(old_file_path):
-                    try:
-                        os.remove(old_file_path)
-                    except Exception as e:
-                        print(f"Error deleting old file: {e}")
-            
             # Save new file
-            file_path, file_size, original_filename = save_uploaded_file(
-                file, current_user.id, resource.topic_id
-            )
+            file_path, file_size, original_filename, content_hash = save_uploaded_file(file)
             
             if file_path:
+                # Drop the reference to the old file instead of deleting it outright
+                blobstore.release_resource_file(resource)
                 resource.file_path = file_path
                 resource.file_size = file_size
                 resource.original_filename = original_filename
+                resource.content_hash = content_hash
+                resource.page_count = None
+                resource.thumbnail_path = None
+                queue_pdf_processing(resource)
     
     resource.updated_at = datetime.utcnow()
     
     try:
         db.session.commit()
+        jobs.kick()
         flash('Resource updated successfully!', 'success')
         return redirect(url_for('topic.view_topic', topic_id=resource.topic_id))
+    except quota.QuotaExceeded:
+        db.session.rollback()
+        flash('Not enough storage left for this file. Delete some PDFs and try again.', 'error')
+        return redirect(url_for('resource.update_resource', resource_id=resource_id))
     except Exception as e:
         db.session.rollback()
         flash(f'Error updating resource: {str(e)}', 'error')
@@ -216,17 +212,9 @@ def delete_resource(resource_id):
     
     topic_id = resource.topic_id
     
-    # Delete physical file if exists
-    if resource.is_pdf() and resource.file_path:
-        file_full_path = os.path.join(
-            current_app.config['UPLOAD_FOLDER'],
-            resource.file_path
-        )
-        if os.path.exists(file_full_path):
-            try:
-                os.remove(file_full_path)
-            except Exception as e:
-                print(f"Error deleting file: {e}")
+    # Release the stored file; it is removed once no resource references it
+    if resource.is_pdf():
+        blobstore.release_resource_file(resource)
     
     try:
         db.session.delete(resource)
@@ -257,19 +245,30 @@ def download_resource(resource_id):
         flash('File not found', 'error')
         return redirect(url_for('resource.view_resource', resource_id=resource_id))
     
-    # Get the directory and filename
-    file_directory = os.path.join(
-        current_app.config['UPLOAD_FOLDER'],
-        os.path.dirname(resource.file_path)
-    )
-    filename = os.path.basename(resource.file_path)
+    if not get_storage().exists(resource.file_path):
+        flash('File not found', 'error')
+        return redirect(url_for('resource.view_resource', resource_id=resource_id))
     
-    return send_from_directory(
-        file_directory,
-        filename,
-        as_attachment=True,
-        download_name=resource.original_filename or filename
-    )
-
+    return send_resource_file(resource)
 
 
+@bp.route('/<int:resource_id>/thumbnail')
+@login_required
+def resource_thumbnail(resource_id):
+    """First-page thumbnail of a PDF resource"""
+    resource = Resource.query.filter_by(id=resource_id, user_id=current_user.id).first()
+    
+    if not resource or not resource.thumbnail_path:
+        abort(404)
+    
+    storage = get_storage()
+    url = storage.url(resource.thumbnail_path, mimetype='image/png')
+    if url is not None:
+        return redirect(url)
+    
+    return send_file(
+        storage.local_path(resource.thumbnail_path),
+        mimetype='image/png',
+        conditional=True,
+        max_age=3600
+    )
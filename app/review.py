@@ -0,0 +1,118 @@
+from datetime import datetime, timedelta
+from flask import Blueprint, jsonify, request
+from flask_login import current_user, login_required
+from .extensions import db
+from .models import Flashcard
+
+bp = Blueprint('review', __name__, url_prefix='/review')
+
+MIN_EASE = 1.3
+MAX_BATCH = 100
+
+
+def next_state(ease_factor, interval_days, repetitions, grade):
+    """SM-2: return the new (ease_factor, interval_days, repetitions).
+
+    grade runs from 0 (blackout) to 5 (perfect recall); below 3 the card is
+    relearned from the start.
+    """
+    if grade >= 3:
+        if repetitions == 0:
+            interval_days = 1.0
+        elif repetitions == 1:
+            interval_days = 6.0
+        else:
+            interval_days = round(interval_days * ease_factor, 2)
+        repetitions += 1
+    else:
+        repetitions = 0
+        interval_days = 1.0
+
+    miss = 5 - grade
+    ease_factor = max(MIN_EASE, ease_factor + 0.1 - miss * (0.08 + miss * 0.02))
+    return ease_factor, interval_days, repetitions
+
+
+def apply_grade(card, grade, now):
+    """Schedule a card after a review"""
+    card.ease_factor, card.interval_days, card.repetitions = next_state(
+        card.ease_factor, card.interval_days, card.repetitions, grade
+    )
+    card.difficulty = min(5, 6 - max(grade, 1))
+    card.last_reviewed_at = now
+    card.next_review_at = now + timedelta(days=card.interval_days)
+
+
+def due_cards(user_id, now, limit):
+    """Next due cards for a user, read in order off the (user_id, next_review_at) index"""
+    return Flashcard.query.filter(
+        Flashcard.user_id == user_id,
+        Flashcard.next_review_at <= now
+    ).order_by(Flashcard.next_review_at).limit(limit).all()
+
+
+def grade_cards(user_id, grades, now):
+    """Apply a batch of {card_id: grade} in one transaction; returns the graded cards"""
+    cards = Flashcard.query.filter(
+        Flashcard.user_id == user_id,
+        Flashcard.id.in_(list(grades))
+    ).all()
+
+    for card in cards:
+        apply_grade(card, grades[card.id], now)
+    db.session.commit()
+    return cards
+
+
+def _card_json(card, with_answer=True):
+    data = {
+        'id': card.id,
+        'topic_id': card.topic_id,
+        'question': card.question,
+        'next_review_at': card.next_review_at.isoformat() if card.next_review_at else None,
+    }
+    if with_answer:
+        data['answer'] = card.answer
+    return data
+
+
+def _is_int(value):
+    # JSON true and false arrive as bools, which are ints to isinstance()
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+@bp.route("/next")
+@login_required
+def next_cards():
+    """The user's next due flashcards"""
+    limit = min(max(request.args.get('limit', 10, type=int), 1), MAX_BATCH)
+    cards = due_cards(current_user.id, datetime.utcnow(), limit)
+    return jsonify({'cards': [_card_json(card) for card in cards]})
+
+
+@bp.route("/grade", methods=["POST"])
+@login_required
+def grade():
+    """Grade a batch of reviewed cards: {"grades": [{"card_id": 1, "grade": 4}, ...]}"""
+    data = request.get_json(silent=True) or {}
+    entries = data.get('grades')
+
+    if not isinstance(entries, list) or not entries or len(entries) > MAX_BATCH:
+        return jsonify({'success': False, 'error': f'Send between 1 and {MAX_BATCH} grades'}), 400
+
+    grades = {}
+    for entry in entries:
+        card_id = entry.get('card_id') if isinstance(entry, dict) else None
+        value = entry.get('grade') if isinstance(entry, dict) else None
+        if not _is_int(card_id) or not _is_int(value) or not 0 <= value <= 5:
+            return jsonify({'success': False, 'error': 'Each grade needs an integer card_id and a grade from 0 to 5'}), 400
+        grades[card_id] = value
+
+    cards = grade_cards(current_user.id, grades, datetime.utcnow())
+
+    missing = sorted(set(grades) - {card.id for card in cards})
+    return jsonify({
+        'success': True,
+        'cards': [_card_json(card, with_answer=False) for card in cards],
+        'not_found': missing,
+    })
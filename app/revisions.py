@@ -0,0 +1,185 @@
+import json
+from flask import current_app
+from sqlalchemy import delete, event, inspect, select
+from .extensions import db
+from .models import Note, NoteRevision
+
+# Upper bounds on one patch request
+MAX_OPS = 200
+MAX_INSERT_CHARS = 1_000_000
+
+
+class InvalidPatch(ValueError):
+    """A patch that does not apply to the revision it claims to be based on"""
+
+
+def apply_ops(text, ops):
+    """Apply [{pos, del, ins}] edits in order; each pos refers to the text as edited so far"""
+    if not isinstance(ops, list) or len(ops) > MAX_OPS:
+        raise InvalidPatch(f"ops must be a list of at most {MAX_OPS} edits")
+
+    inserted = 0
+    for op in ops:
+        if not isinstance(op, dict):
+            raise InvalidPatch("each op must be an object")
+        pos, remove, insert = op.get('pos'), op.get('del', 0), op.get('ins', '')
+        if not isinstance(pos, int) or not isinstance(remove, int) or not isinstance(insert, str):
+            raise InvalidPatch("pos and del must be integers and ins a string")
+        if pos < 0 or remove < 0 or pos + remove > len(text):
+            raise InvalidPatch("op is out of range")
+        inserted += len(insert)
+        if inserted > MAX_INSERT_CHARS:
+            raise InvalidPatch("patch is too large")
+        text = text[:pos] + insert + text[pos + remove:]
+    return text
+
+
+def record_snapshot(note):
+    """Store the note's current title and content as its newest revision.
+
+    History older than the NOTE_HISTORY_SNAPSHOTS newest snapshots is dropped.
+    """
+    db.session.add(NoteRevision(note_id=note.id, revision=note.revision, kind='snapshot',
+                                title=note.title, content=note.content))
+    oldest_kept = db.session.execute(
+        select(NoteRevision.revision)
+        .where(NoteRevision.note_id == note.id, NoteRevision.kind == 'snapshot')
+        .order_by(NoteRevision.revision.desc())
+        .offset(current_app.config['NOTE_HISTORY_SNAPSHOTS'] - 1)
+        .limit(1)
+    ).scalar()
+    if oldest_kept is not None:
+        db.session.execute(
+            delete(NoteRevision)
+            .where(NoteRevision.note_id == note.id, NoteRevision.revision < oldest_kept)
+        )
+
+
+def replace_content(note, title, content):
+    """Replace a note's title and content; False, recording nothing, if neither changed.
+
+    Flushes the new revision, with the same StaleDataError on a concurrent
+    update as apply_patch().
+    """
+    if (title, content) == (note.title, note.content):
+        return False
+    note.title = title
+    note.content = content
+    db.session.flush()
+    record_snapshot(note)
+    return True
+
+
+def apply_patch(note, base_revision, ops, title=None):
+    """Apply a client patch made against base_revision; False if the note has moved on.
+
+    Flushes the new revision. The note's version counter turns a concurrent
+    update of the same revision into StaleDataError at flush time. A patch
+    that changes nothing records nothing and keeps the revision.
+    """
+    if base_revision != note.revision:
+        return False
+
+    content = apply_ops(note.content, ops)
+    new_title = note.title if title is None else title
+    if (new_title, content) == (note.title, note.content):
+        return True
+
+    # Notes saved before history existed need a starting point for replay
+    if not _has_history(note.id):
+        record_snapshot(note)
+
+    note.content = content
+    note.title = new_title
+    db.session.flush()
+
+    if note.revision % current_app.config['NOTE_SNAPSHOT_EVERY'] == 0:
+        compact(note)
+    else:
+        db.session.add(NoteRevision(note_id=note.id, revision=note.revision, kind='patch',
+                                    title=title, ops=json.dumps(ops)))
+    return True
+
+
+def compact(note):
+    """Write a snapshot for the current revision and drop patches older than the previous snapshot.
+
+    Recent history stays replayable patch by patch; older history keeps
+    one snapshot every NOTE_SNAPSHOT_EVERY revisions.
+    """
+    previous = db.session.execute(
+        select(NoteRevision.revision)
+        .where(NoteRevision.note_id == note.id, NoteRevision.kind == 'snapshot',
+               NoteRevision.revision < note.revision)
+        .order_by(NoteRevision.revision.desc())
+        .limit(1)
+    ).scalar()
+    if previous is not None:
+        db.session.execute(
+            delete(NoteRevision)
+            .where(NoteRevision.note_id == note.id, NoteRevision.kind == 'patch',
+                   NoteRevision.revision < previous)
+        )
+    record_snapshot(note)
+
+
+def _has_history(note_id):
+    return db.session.execute(
+        select(NoteRevision.id).where(NoteRevision.note_id == note_id).limit(1)
+    ).first() is not None
+
+
+def list_revisions(note_id):
+    return db.session.execute(
+        select(NoteRevision.revision, NoteRevision.kind, NoteRevision.created_at)
+        .where(NoteRevision.note_id == note_id)
+        .order_by(NoteRevision.revision.desc())
+    ).all()
+
+
+def note_at_revision(note_id, revision):
+    """(title, content) of a note at a past revision, or None if that revision was compacted away"""
+    snapshot = db.session.execute(
+        select(NoteRevision)
+        .where(NoteRevision.note_id == note_id, NoteRevision.kind == 'snapshot',
+               NoteRevision.revision <= revision)
+        .order_by(NoteRevision.revision.desc())
+        .limit(1)
+    ).scalar()
+    if snapshot is None:
+        return None
+
+    title, content = snapshot.title, snapshot.content
+    patches = db.session.execute(
+        select(NoteRevision)
+        .where(NoteRevision.note_id == note_id, NoteRevision.revision > snapshot.revision,
+               NoteRevision.revision <= revision)
+        .order_by(NoteRevision.revision)
+    ).scalars().all()
+    expected = snapshot.revision
+    for patch in patches:
+        expected += 1
+        if patch.revision != expected:
+            return None
+        if patch.kind == 'snapshot':
+            title, content = patch.title, patch.content
+        else:
+            content = apply_ops(content, json.loads(patch.ops))
+            title = patch.title if patch.title is not None else title
+    if expected != revision:
+        return None
+    return title, content
+
+
+@event.listens_for(Note, "before_update")
+def _bump_revision(mapper, connection, target):
+    # Other updates (rendered HTML, moving the note) keep the revision, so history has no gaps
+    state = inspect(target)
+    if state.attrs.title.history.has_changes() or state.attrs.content.history.has_changes():
+        target.revision += 1
+
+
+@event.listens_for(Note, "after_delete")
+def _delete_history(mapper, connection, target):
+    # One statement instead of loading every revision; SQLite does not enforce ON DELETE CASCADE here
+    connection.execute(delete(NoteRevision).where(NoteRevision.note_id == target.id))
@@ -0,0 +1,325 @@
+import re
+from flask import Blueprint, current_app, jsonify, request, url_for
+from flask_login import current_user, login_required
+from markupsafe import escape
+from sqlalchemy import and_, bindparam, event, literal, or_, select, text, union_all
+from .extensions import db
+from .models import Note, Resource
+
+bp = Blueprint('search', __name__, url_prefix='/search')
+
+# Document kinds. The FTS5 rowid is ref_id * 2 + kind, so a note or a
+# resource can be updated or removed by rowid instead of scanning the index.
+NOTE = 0
+RESOURCE = 1
+
+MAX_PER_PAGE = 50
+
+# Markers wrapped around matches before the snippet is HTML-escaped
+_MARK_OPEN = "\ue000"
+_MARK_CLOSE = "\ue001"
+
+CREATE_INDEX_SQL = """
+CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(
+    owner, title, body, extra,
+    tokenize = 'unicode61 remove_diacritics 2'
+)
+"""
+
+# owner holds "u<user_id>" so user scoping is part of the MATCH itself;
+# extra holds text extracted from uploaded PDFs.
+_SEARCH_SQL = """
+SELECT rowid, title,
+       snippet(search_index, 2, :open, :close, '…', 16) AS body_snippet,
+       snippet(search_index, 3, :open, :close, '…', 16) AS extra_snippet
+FROM search_index
+WHERE search_index MATCH :match
+ORDER BY bm25(search_index, 0.0, 10.0, 1.0, 0.5)
+LIMIT :limit OFFSET :offset
+"""
+
+_fts_ready = set()
+
+
+def _rowid(kind, ref_id):
+    return ref_id * 2 + kind
+
+
+def fts_available(connection):
+    """Check whether the FTS5 search index exists on this connection"""
+    if connection.dialect.name != "sqlite":
+        return False
+
+    key = str(connection.engine.url)
+    if key not in _fts_ready:
+        found = connection.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'search_index'"
+        )).first()
+        if not found:
+            return False
+        _fts_ready.add(key)
+    return True
+
+
+def rebuild_index(connection):
+    """Re-populate the FTS5 index from the note and resource tables"""
+    connection.execute(text("DELETE FROM search_index"))
+    connection.execute(text(
+        "INSERT INTO search_index(rowid, owner, title, body) "
+        "SELECT id * 2 + :kind, 'u' || user_id, title, content FROM note"
+    ), {"kind": NOTE})
+    connection.execute(text(
+        "INSERT INTO search_index(rowid, owner, title, body) "
+        "SELECT id * 2 + :kind, 'u' || user_id, title, COALESCE(url, '') FROM resource"
+    ), {"kind": RESOURCE})
+
+
+@event.listens_for(db.metadata, "after_create")
+def _create_search_index(target, connection, **kw):
+    """Create (and backfill on first creation) the FTS5 table on SQLite"""
+    if connection.dialect.name != "sqlite":
+        return
+
+    existed = fts_available(connection)
+    connection.execute(text(CREATE_INDEX_SQL))
+    _fts_ready.add(str(connection.engine.url))
+    if not existed:
+        rebuild_index(connection)
+
+
+def _note_document(note):
+    return {
+        "rowid": _rowid(NOTE, note.id),
+        "owner": f"u{note.user_id}",
+        "title": note.title or "",
+        "body": note.content or "",
+    }
+
+
+def _resource_document(resource):
+    return {
+        "rowid": _rowid(RESOURCE, resource.id),
+        "owner": f"u{resource.user_id}",
+        "title": resource.title or "",
+        "body": resource.url or "",
+    }
+
+
+def _insert_document(connection, doc):
+    connection.execute(text(
+        "INSERT INTO search_index(rowid, owner, title, body) VALUES (:rowid, :owner, :title, :body)"
+    ), doc)
+
+
+def _update_document(connection, doc):
+    # Leaves the extra column (PDF text) untouched
+    result = connection.execute(text(
+        "UPDATE search_index SET owner = :owner, title = :title, body = :body WHERE rowid = :rowid"
+    ), doc)
+    if result.rowcount == 0:
+        _insert_document(connection, doc)
+
+
+def _delete_document(connection, rowid):
+    connection.execute(text("DELETE FROM search_index WHERE rowid = :rowid"), {"rowid": rowid})
+
+
+@event.listens_for(Note, "after_insert")
+def _note_inserted(mapper, connection, target):
+    if fts_available(connection):
+        _insert_document(connection, _note_document(target))
+
+
+@event.listens_for(Note, "after_update")
+def _note_updated(mapper, connection, target):
+    if fts_available(connection):
+        _update_document(connection, _note_document(target))
+
+
+@event.listens_for(Note, "after_delete")
+def _note_deleted(mapper, connection, target):
+    if fts_available(connection):
+        _delete_document(connection, _rowid(NOTE, target.id))
+
+
+@event.listens_for(Resource, "after_insert")
+def _resource_inserted(mapper, connection, target):
+    if fts_available(connection):
+        _insert_document(connection, _resource_document(target))
+
+
+@event.listens_for(Resource, "after_update")
+def _resource_updated(mapper, connection, target):
+    if fts_available(connection):
+        _update_document(connection, _resource_document(target))
+
+
+@event.listens_for(Resource, "after_delete")
+def _resource_deleted(mapper, connection, target):
+    if fts_available(connection):
+        _delete_document(connection, _rowid(RESOURCE, target.id))
+
+
+def index_new_rows(note_ids=(), resource_ids=()):
+    """Index notes and resources inserted with bulk statements, which skip the ORM events"""
+    connection = db.session.connection()
+    if not fts_available(connection):
+        return
+
+    if note_ids:
+        connection.execute(text(
+            "INSERT INTO search_index(rowid, owner, title, body) "
+            "SELECT id * 2 + :kind, 'u' || user_id, title, content FROM note WHERE id IN :ids"
+        ).bindparams(bindparam("ids", expanding=True)), {"kind": NOTE, "ids": list(note_ids)})
+    if resource_ids:
+        connection.execute(text(
+            "INSERT INTO search_index(rowid, owner, title, body) "
+            "SELECT id * 2 + :kind, 'u' || user_id, title, COALESCE(url, '') FROM resource WHERE id IN :ids"
+        ).bindparams(bindparam("ids", expanding=True)), {"kind": RESOURCE, "ids": list(resource_ids)})
+
+
+def unindex_topics(topic_ids):
+    """Remove the notes and resources of these topics from the index; call before deleting them in bulk"""
+    connection = db.session.connection()
+    if not fts_available(connection) or not topic_ids:
+        return
+
+    for table, kind in (("note", NOTE), ("resource", RESOURCE)):
+        connection.execute(text(
+            "DELETE FROM search_index WHERE rowid IN "
+            f"(SELECT id * 2 + :kind FROM {table} WHERE topic_id IN :ids)"
+        ).bindparams(bindparam("ids", expanding=True)), {"kind": kind, "ids": list(topic_ids)})
+
+
+def index_resource_text(resource_id, content):
+    """Attach text extracted from an uploaded PDF to a resource's index entry"""
+    connection = db.session.connection()
+    if fts_available(connection):
+        connection.execute(
+            text("UPDATE search_index SET extra = :extra WHERE rowid = :rowid"),
+            {"extra": content or "", "rowid": _rowid(RESOURCE, resource_id)}
+        )
+
+
+def _search_terms(query):
+    return re.findall(r"\w+", query)[:16]
+
+
+def _highlight(snippet):
+    """Escape a snippet and turn the match markers into <mark> tags"""
+    html = str(escape(snippet))
+    return html.replace(_MARK_OPEN, "<mark>").replace(_MARK_CLOSE, "</mark>")
+
+
+def _make_snippet(content, terms, width=80):
+    """Build a snippet around the first matching term (fallback engine)"""
+    content = content or ""
+    lowered = content.lower()
+    positions = [lowered.find(t.lower()) for t in terms]
+    positions = [p for p in positions if p >= 0]
+    start = max(min(positions) - width // 2, 0) if positions else 0
+    window = content[start:start + width]
+
+    pattern = re.compile("|".join(re.escape(t) for t in terms), re.IGNORECASE)
+    marked = pattern.sub(lambda m: f"{_MARK_OPEN}{m.group(0)}{_MARK_CLOSE}", window)
+    prefix = "…" if start > 0 else ""
+    suffix = "…" if start + width < len(content) else ""
+    return _highlight(f"{prefix}{marked}{suffix}")
+
+
+def _search_fts(user_id, terms, limit, offset):
+    phrase = " ".join(f'"{term}"' for term in terms) + "*"
+    match = f"owner:u{user_id} AND {{title body extra}}: ({phrase})"
+
+    rows = db.session.execute(text(_SEARCH_SQL), {
+        "match": match,
+        "open": _MARK_OPEN,
+        "close": _MARK_CLOSE,
+        "limit": limit,
+        "offset": offset,
+    }).all()
+
+    results = []
+    for row in rows:
+        snippet = row.body_snippet
+        if _MARK_OPEN not in snippet and _MARK_OPEN in (row.extra_snippet or ""):
+            snippet = row.extra_snippet
+        results.append((row.rowid % 2, row.rowid // 2, row.title, _highlight(snippet)))
+    return results
+
+
+def _escape_like(term):
+    """Make % and _ in a search term match themselves"""
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _search_like(user_id, terms, limit, offset):
+    """Plain LIKE search used when FTS5 is not available"""
+    def matches(*columns):
+        patterns = [f"%{_escape_like(t)}%" for t in terms]
+        return and_(*[or_(*[c.ilike(p, escape="\\") for c in columns]) for p in patterns])
+
+    notes = select(
+        literal(NOTE).label("kind"), Note.id, Note.title,
+        Note.content.label("body"), Note.updated_at.label("updated_at")
+    ).where(Note.user_id == user_id, matches(Note.title, Note.content))
+
+    resources = select(
+        literal(RESOURCE).label("kind"), Resource.id, Resource.title,
+        Resource.url.label("body"), Resource.updated_at.label("updated_at")
+    ).where(Resource.user_id == user_id, matches(Resource.title, Resource.url))
+
+    combined = union_all(notes, resources).subquery()
+    rows = db.session.execute(
+        select(combined).order_by(combined.c.updated_at.desc()).limit(limit).offset(offset)
+    ).all()
+    return [(row.kind, row.id, row.title, _make_snippet(row.body, terms)) for row in rows]
+
+
+def search(user_id, query, page=1, per_page=20):
+    """Search a user's notes and resources, returning (results, has_next)"""
+    terms = _search_terms(query)
+    if not terms:
+        return [], False
+
+    offset = (page - 1) * per_page
+    engine = current_app.config.get('SEARCH_ENGINE', 'auto')
+    if engine != 'like' and fts_available(db.session.connection()):
+        rows = _search_fts(user_id, terms, per_page + 1, offset)
+    else:
+        rows = _search_like(user_id, terms, per_page + 1, offset)
+
+    return rows[:per_page], len(rows) > per_page
+
+
+@bp.route("")
+@login_required
+def search_view():
+    """Search the current user's notes and resources"""
+    query = request.args.get('q', '').strip()
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', 20, type=int), 1), MAX_PER_PAGE)
+
+    rows, has_next = search(current_user.id, query, page, per_page)
+
+    results = []
+    for kind, ref_id, title, snippet in rows:
+        if kind == NOTE:
+            link = url_for('note.view_note', note_id=ref_id)
+        else:
+            link = url_for('resource.view_resource', resource_id=ref_id)
+        results.append({
+            'type': 'note' if kind == NOTE else 'resource',
+            'id': ref_id,
+            'title': title,
+            'snippet': snippet,
+            'url': link,
+        })
+
+    return jsonify({
+        'query': query,
+        'page': page,
+        'per_page': per_page,
+        'has_next': has_next,
+        'results': results,
+    })
@@ -0,0 +1,299 @@
+"""Where uploaded files live: the local filesystem or an S3-compatible bucket.
+
+STORAGE_BACKEND picks the driver. Both store files under the same
+relative keys (blobs/ab/cd/<sha256>, see blobstore.py), so a file can be
+copied from one backend to the other with `manage.py migrate-storage`
+and the resource rows do not change. Uploads are hashed from their own
+stream (see blobstore.store_stream()); only streams that cannot seek are
+staged under UPLOAD_FOLDER/tmp first. S3 then reads the stream with
+save_stream() and uploads it in parallel parts, while the local driver
+copies it to a staging file that save_file() moves into place.
+"""
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from urllib.parse import quote
+from flask import current_app
+
+CHUNK_SIZE = 64 * 1024
+
+# Staging directory under UPLOAD_FOLDER for uploads being hashed; never migrated
+TMP_DIR = "tmp"
+
+
+class LocalStorage:
+    """Files under a directory on this machine"""
+
+    name = "local"
+
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, key):
+        return os.path.join(self.root, key)
+
+    def local_path(self, key):
+        """Filesystem path of a stored file, for send_file and X-Sendfile"""
+        return self.path(key)
+
+    def exists(self, key):
+        return os.path.exists(self.path(key))
+
+    def size(self, key):
+        return os.path.getsize(self.path(key))
+
+    def mtime(self, key):
+        return os.path.getmtime(self.path(key))
+
+    def open(self, key):
+        return open(self.path(key), "rb")
+
+    def save_file(self, key, tmp_path):
+        """Move a staged file into place; tmp_path must be on the same filesystem"""
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(tmp_path, path)
+
+    def save_stream(self, key, stream):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                shutil.copyfileobj(stream, out, CHUNK_SIZE)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def delete(self, key):
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    @contextmanager
+    def local_copy(self, key):
+        yield self.path(key)
+
+    def url(self, key, mimetype=None, download_name=None, expires=None):
+        """Served by the app (see delivery.py), so there is no direct URL"""
+        return None
+
+    def keys(self):
+        """(key, modification time) of every stored file, staging files included"""
+        for root, _, files in os.walk(self.root):
+            for name in files:
+                full_path = os.path.join(root, name)
+                try:
+                    mtime = os.path.getmtime(full_path)
+                except FileNotFoundError:
+                    continue
+                yield os.path.relpath(full_path, self.root), mtime
+
+
+class S3Storage:
+    """Files in an S3-compatible bucket (AWS, MinIO, Ceph, R2, ...).
+
+    Uploads above S3_MULTIPART_THRESHOLD go up as a multipart upload, with
+    up to S3_MAX_CONCURRENCY parts in flight at once and each part read
+    from the source as it is sent. Downloads are handed to the client as
+    presigned URLs, so the bytes never pass through a worker.
+    """
+
+    name = "s3"
+
+    def __init__(self, client, bucket, prefix="", transfer_config=None, staging_dir=None, presign_expires=300):
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix.strip("/") + "/" if prefix.strip("/") else ""
+        self.transfer_config = transfer_config
+        self.staging_dir = staging_dir
+        self.presign_expires = presign_expires
+
+    @classmethod
+    def from_config(cls, config):
+        import boto3
+        from boto3.s3.transfer import TransferConfig
+        from botocore.config import Config as BotoConfig
+
+        client = boto3.client(
+            "s3",
+            endpoint_url=config.get('S3_ENDPOINT_URL') or None,
+            region_name=config.get('S3_REGION') or None,
+            aws_access_key_id=config.get('S3_ACCESS_KEY_ID') or None,
+            aws_secret_access_key=config.get('S3_SECRET_ACCESS_KEY') or None,
+            config=BotoConfig(
+                signature_version="s3v4",
+                s3={'addressing_style': config.get('S3_ADDRESSING_STYLE', 'auto')},
+                # One pooled connection per part in flight, plus the request's own
+                max_pool_connections=config['S3_MAX_CONCURRENCY'] + 4,
+            ),
+        )
+        transfer_config = TransferConfig(
+            multipart_threshold=config['S3_MULTIPART_THRESHOLD'],
+            multipart_chunksize=config['S3_MULTIPART_CHUNKSIZE'],
+            max_concurrency=config['S3_MAX_CONCURRENCY'],
+            use_threads=config['S3_MAX_CONCURRENCY'] > 1,
+        )
+        return cls(client, config['S3_BUCKET'], config.get('S3_PREFIX', ''), transfer_config,
+                   staging_dir=os.path.join(config['UPLOAD_FOLDER'], TMP_DIR),
+                   presign_expires=config['S3_PRESIGN_EXPIRES'])
+
+    def _key(self, key):
+        return self.prefix + key.replace(os.sep, "/")
+
+    def local_path(self, key):
+        return None
+
+    def _head(self, key):
+        from botocore.exceptions import ClientError
+
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+
+    def exists(self, key):
+        return self._head(key) is not None
+
+    def size(self, key):
+        head = self._head(key)
+        if head is None:
+            raise FileNotFoundError(key)
+        return head['ContentLength']
+
+    def mtime(self, key):
+        head = self._head(key)
+        if head is None:
+            raise FileNotFoundError(key)
+        return head['LastModified'].timestamp()
+
+    def open(self, key):
+        """A streaming body: read() pulls the object over the network as it is consumed"""
+        from botocore.exceptions import ClientError
+
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=self._key(key))['Body']
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ("404", "NoSuchKey"):
+                raise FileNotFoundError(key) from e
+            raise
+
+    def save_file(self, key, tmp_path):
+        """Upload a staged file, then remove it"""
+        try:
+            self.client.upload_file(tmp_path, self.bucket, self._key(key), Config=self.transfer_config)
+        finally:
+            os.remove(tmp_path)
+
+    def save_stream(self, key, stream):
+        self.client.upload_fileobj(stream, self.bucket, self._key(key), Config=self.transfer_config)
+
+    def delete(self, key):
+        # DELETE on a missing key succeeds, as unlinking a missing local file is ignored
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+    @contextmanager
+    def local_copy(self, key):
+        """Download to a staging file for tools that need a path (pypdf, pdftoppm)"""
+        os.makedirs(self.staging_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.staging_dir, suffix=".get")
+        os.close(fd)
+        try:
+            self.client.download_file(self.bucket, self._key(key), tmp_path, Config=self.transfer_config)
+            yield tmp_path
+        finally:
+            os.remove(tmp_path)
+
+    def url(self, key, mimetype=None, download_name=None, expires=None):
+        """Presigned GET URL, with the response headers the download should carry"""
+        params = {'Bucket': self.bucket, 'Key': self._key(key)}
+        if mimetype:
+            params['ResponseContentType'] = mimetype
+        if download_name:
+            params['ResponseContentDisposition'] = content_disposition(download_name)
+        return self.client.generate_presigned_url(
+            "get_object", Params=params, ExpiresIn=expires or self.presign_expires)
+
+    def keys(self):
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix):
+            for item in page.get('Contents', ()):
+                yield item['Key'][len(self.prefix):], item['LastModified'].timestamp()
+
+
+def content_disposition(download_name, disposition="attachment"):
+    """Content-Disposition header that survives non-ASCII filenames"""
+    try:
+        download_name.encode("ascii")
+        return f'{disposition}; filename="{download_name}"'
+    except UnicodeEncodeError:
+        return f"{disposition}; filename*=UTF-8''{quote(download_name)}"
+
+
+def make_storage(app, backend=None):
+    """Build the driver for a backend name, STORAGE_BACKEND by default"""
+    backend = backend or app.config.get('STORAGE_BACKEND', 'local')
+    if backend == 'local':
+        return LocalStorage(app.config['UPLOAD_FOLDER'])
+    if backend == 's3':
+        return S3Storage.from_config(app.config)
+    raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
+
+
+def get_storage():
+    return current_app.extensions['storage']
+
+
+def staging_dir():
+    """Local directory uploads are written to while they are hashed"""
+    path = os.path.join(current_app.config['UPLOAD_FOLDER'], TMP_DIR)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def copy_files(source, target, keys, workers=8, overwrite=False):
+    """Copy files between two drivers with a pool of threads.
+
+    Returns (copied, skipped, failed) where failed lists (key, error).
+    Files already present in the target are skipped unless overwrite is
+    set; blob keys are content addressed, so a present blob is identical.
+    """
+    def copy(key):
+        if not overwrite and target.exists(key):
+            return "skipped"
+        local_path = source.local_path(key)
+        if local_path is not None:
+            with open(local_path, "rb") as stream:
+                target.save_stream(key, stream)
+        else:
+            body = source.open(key)
+            try:
+                target.save_stream(key, body)
+            finally:
+                body.close()
+        return "copied"
+
+    copied, skipped, failed = 0, 0, []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {key: pool.submit(copy, key) for key in keys}
+        for key, future in futures.items():
+            try:
+                outcome = future.result()
+            except Exception as e:
+                failed.append((key, e))
+                continue
+            if outcome == "copied":
+                copied += 1
+            else:
+                skipped += 1
+    return copied, skipped, failed
+
+
+def init_app(app):
+    app.extensions['storage'] = make_storage(app)
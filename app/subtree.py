@@ -0,0 +1,99 @@
+from collections import Counter
+from flask import current_app
+from sqlalchemy import delete, func, select
+from . import blobstore, fragment_cache, quota, topic_closure, topic_stats
+from .extensions import db
+from .models import Flashcard, GenerationUsage, Note, NoteRevision, Resource, Topic, TopicClosure
+from .search import unindex_topics
+from .topic_tree import invalidate_on_commit
+
+
+def subtree_ids(user_id, topic_id):
+    """Ids of a user's topic and all of its descendants, shallowest first, from the closure table"""
+    return db.session.execute(
+        select(TopicClosure.descendant_id)
+        .join(Topic, Topic.id == TopicClosure.ancestor_id)
+        .where(TopicClosure.ancestor_id == topic_id, Topic.user_id == user_id)
+        .order_by(TopicClosure.depth)
+    ).scalars().all()
+
+
+def _batches(ids, size):
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+def _release_files(topic_ids):
+    """Release the stored files of the PDF resources under these topics.
+
+    Returns the paths to remove once the transaction commits.
+    """
+    hashes = Counter()
+    paths = []
+    for content_hash, file_path in db.session.execute(
+        select(Resource.content_hash, Resource.file_path)
+        .where(Resource.topic_id.in_(topic_ids), Resource.file_path.is_not(None))
+    ):
+        if content_hash:
+            hashes[content_hash] += 1
+        else:
+            # Saved before the blob store existed: owned by this resource alone
+            paths.append(file_path)
+    return paths + blobstore.release_many(hashes)
+
+
+def delete_subtree(user_id, topic_id):
+    """Delete a topic, its descendants and everything filed under them.
+
+    Rows go with set-based DELETE ... WHERE topic_id IN (...) statements,
+    batched by TOPIC_DELETE_BATCH_SIZE, in the caller's transaction. No ORM
+    objects are loaded, so ORM events do not fire: search entries, note
+    history, blob references, closure rows and the topic tree cache are
+    cleaned up here instead. Files are removed by a background job once the
+    caller commits.
+
+    Returns the number of topics deleted (0 if the topic is not the user's).
+    """
+    topic_ids = subtree_ids(user_id, topic_id)
+    if not topic_ids:
+        return 0
+
+    removed_files = []
+    for batch in _batches(topic_ids, current_app.config['TOPIC_DELETE_BATCH_SIZE']):
+        removed_files += _release_files(batch)
+        size, files = db.session.execute(
+            select(func.coalesce(func.sum(Resource.file_size), 0), func.count(Resource.file_size))
+            .where(Resource.topic_id.in_(batch))
+        ).one()
+        # Bulk deletes skip the storage usage events
+        quota.charge(db.session.connection(), user_id, -size, -files)
+        unindex_topics(batch)
+        db.session.execute(
+            delete(NoteRevision).where(NoteRevision.note_id.in_(select(Note.id).where(Note.topic_id.in_(batch))))
+        )
+        for model in (Flashcard, Note, Resource, GenerationUsage):
+            db.session.execute(delete(model).where(model.topic_id.in_(batch)),
+                               execution_options={'synchronize_session': False})
+    # Bulk deletes skip the counter events: drop the rows of the deleted
+    # topics and recount the parent that lost a subtopic
+    parent_id = db.session.execute(select(Topic.parent_topic_id).where(Topic.id == topic_id)).scalar()
+    topic_stats.drop(topic_ids)
+    for batch in _batches(topic_ids, current_app.config['TOPIC_DELETE_BATCH_SIZE']):
+        topic_closure.remove_topics(db.session, batch)
+
+    # Deepest batches first: subtree_ids() lists parents before children
+    for batch in reversed(list(_batches(topic_ids, current_app.config['TOPIC_DELETE_BATCH_SIZE']))):
+        db.session.execute(delete(Topic).where(Topic.id.in_(batch)),
+                           execution_options={'synchronize_session': False})
+
+    # Loaded copies of the deleted rows are stale now
+    for obj in list(db.session.identity_map.values()):
+        if getattr(obj, 'topic_id', None) in topic_ids or (isinstance(obj, Topic) and obj.id in topic_ids):
+            db.session.expunge(obj)
+
+    topic_stats.refresh([parent_id])
+    blobstore.queue_removal(removed_files)
+    invalidate_on_commit(db.session, user_id)
+    fragment_cache.invalidate_on_commit(db.session, "user", user_id)
+    fragment_cache.invalidate_on_commit(db.session, "topic", parent_id)
+    return len(topic_ids)
@@ -0,0 +1,54 @@
+import threading
+import time
+from flask import current_app
+from .cache import make_backend
+
+
+class TokenBucket:
+    """Token-bucket rate limiter over a cache backend.
+
+    Each key holds up to `burst` tokens and regains `per_minute` tokens a
+    minute. With the Redis backend the read-modify-write is not atomic, so
+    concurrent workers may let a few extra attempts through; the limit is a
+    brake on bulk traffic, not an exact quota.
+    """
+
+    def __init__(self, backend, name, burst, per_minute):
+        self.backend = backend
+        self.name = name
+        self.burst = burst
+        self.rate = per_minute / 60.0
+        self._lock = threading.Lock()
+
+    def consume(self, key):
+        """Take one token for key; returns 0 if allowed, else seconds until a token is due"""
+        if self.burst <= 0:
+            return 0
+        cache_key = f"throttle:{self.name}:{key}"
+        now = time.time()
+        with self._lock:
+            tokens, updated = self.backend.get(cache_key) or (self.burst, now)
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens < 1:
+                return (1 - tokens) / self.rate if self.rate else 60
+            # Entries expire once the bucket would be full again
+            ttl = self.burst / self.rate if self.rate else None
+            self.backend.set(cache_key, (tokens - 1, now), ttl=ttl)
+        return 0
+
+
+def login_retry_after(ip, email):
+    """Consume a login attempt for the client IP and the email; seconds to wait if either is exhausted"""
+    buckets = current_app.extensions['login_throttle']
+    wait_ip = buckets['ip'].consume(ip or "unknown")
+    wait_email = buckets['email'].consume(email.lower()) if email else 0
+    return max(wait_ip, wait_email)
+
+
+def init_app(app):
+    backend = make_backend(app, max_entries=app.config['LOGIN_THROTTLE_CACHE_SIZE'], ttl=None)
+    app.extensions['login_throttle'] = {
+        'ip': TokenBucket(backend, "login_ip", app.config['LOGIN_IP_BURST'], app.config['LOGIN_IP_PER_MINUTE']),
+        'email': TokenBucket(backend, "login_email", app.config['LOGIN_EMAIL_BURST'],
+                             app.config['LOGIN_EMAIL_PER_MINUTE']),
+    }
@@ -1,13 +1,36 @@
 from .extensions import db
-from flask import Blueprint, jsonify, render_template, request, redirect, url_for, flash
+from flask import Blueprint, current_app, jsonify, render_template, request, redirect, url_for, flash
 from flask_login import login_required, current_user
-from .models import Topic
+from sqlalchemy.orm import defaultload
+from . import jobs, topic_closure, topic_stats
+from .models import Note, Topic
+from .subtree import delete_subtree
+from .topic_tree import get_topic_tree
 
 bp = Blueprint('topic', __name__, url_prefix='/topic')
 
 def get_all_user_topic():
-    """Helper function to get all main topic for sidebar"""
-    return Topic.query.filter_by(user_id=current_user.id, parent_topic_id=None).order_by(Topic.created_at.desc()).all()
+    """Helper function to get all main topic for sidebar (cached, see topic_tree.py)"""
+    return get_topic_tree(current_user.id)
+
+def nesting_allowed(parent_id, subtree_height=0):
+    """Whether a subtree this many levels tall may hang under parent_id"""
+    if parent_id is None:
+        return subtree_height <= current_app.config['TOPIC_MAX_DEPTH']
+    depth = topic_closure.depth(db.session, parent_id) + 1 + subtree_height
+    return depth <= current_app.config['TOPIC_MAX_DEPTH']
+
+def get_topic_page(topic_id, user_id):
+    """Load a topic for its page.
+
+    Subtopics, resources and notes load lazily, one SELECT per collection,
+    and only when the template renders them: a page whose content fragment
+    is cached (see fragment_cache.py) never loads them at all.
+    """
+    return Topic.query.filter_by(id=topic_id, user_id=user_id).options(
+        # Cards show a preview built from the content, not the rendered HTML
+        defaultload(Topic.notes).defer(Note.rendered_html),
+    ).first()
 
 @bp.route("/create", methods=['GET', 'POST'])
 @login_required
@@ -22,9 +45,8 @@ def create_topic():
             flash('Parent topic not found', 'error')
             return redirect(url_for('dashboard'))
         
-        # Check if parent is already a subtopic (prevent sub-sub-topic)
-        if parent_topic.is_subtopic():
-            flash('Cannot create a subtopic of a subtopic', 'error')
+        if not nesting_allowed(parent_id):
+            flash(f"Topics can only be nested {current_app.config['TOPIC_MAX_DEPTH']} levels deep", 'error')
             return redirect(url_for('topic.view_topic', topic_id=parent_id))
     
     if request.method == 'POST':
@@ -61,9 +83,8 @@ def create_topic():
 @bp.route("/<int:topic_id>")
 @login_required
 def view_topic(topic_id):
-    print("Viewing topic:", topic_id)
     """View a topic detail page"""
-    topic = Topic.query.filter_by(id=topic_id, user_id=current_user.id).first()
+    topic = get_topic_page(topic_id, current_user.id)
     
     if not topic:
         flash('Topic not found', 'error')
@@ -74,7 +95,9 @@ def view_topic(topic_id):
                            all_topic=get_all_user_topic(),
                            current_topic=topic,
                            active_panel='topic', 
-                           active_topic=topic)
+                           active_topic=topic,
+                           topic_stats=topic_stats.for_topic(current_user.id, topic.id),
+                           breadcrumbs=topic_closure.breadcrumbs(db.session, topic.id))
 
 @bp.route("/<int:topic_id>/update", methods=['GET', 'POST'])
 @login_required
@@ -100,6 +123,36 @@ def update_topic(topic_id):
                            current_topic=topic,
                            active_panel='topic')
 
+@bp.route("/<int:topic_id>/move", methods=['POST'])
+@login_required
+def move_topic(topic_id):
+    """Move a topic, with everything under it, to another parent (or to the top level)"""
+    topic = Topic.query.filter_by(id=topic_id, user_id=current_user.id).first()
+
+    if not topic:
+        flash('Topic not found', 'error')
+        return redirect(url_for('dashboard'))
+
+    parent_id = request.form.get('parent_id', type=int)
+    if parent_id is not None:
+        parent = Topic.query.filter_by(id=parent_id, user_id=current_user.id).first()
+        if not parent:
+            flash('Parent topic not found', 'error')
+            return redirect(url_for('topic.view_topic', topic_id=topic.id))
+        if topic_closure.is_within(db.session, parent_id, topic.id):
+            flash('A topic cannot be moved into one of its own subtopics', 'error')
+            return redirect(url_for('topic.view_topic', topic_id=topic.id))
+    if not nesting_allowed(parent_id, topic_closure.height(db.session, topic.id)):
+        flash(f"Topics can only be nested {current_app.config['TOPIC_MAX_DEPTH']} levels deep", 'error')
+        return redirect(url_for('topic.view_topic', topic_id=topic.id))
+
+    # One transaction: the closure rows, counters and caches follow from the events on Topic
+    topic.parent_topic_id = parent_id
+    db.session.commit()
+
+    flash('Topic moved successfully!', 'success')
+    return redirect(url_for('topic.view_topic', topic_id=topic.id))
+
 @bp.route("/<int:topic_id>/delete", methods=['POST'])
 @login_required
 def delete_topic(topic_id):
@@ -111,8 +164,9 @@ def delete_topic(topic_id):
         return redirect(url_for('dashboard'))
     
     parent_id = topic.parent_topic_id
-    db.session.delete(topic)
+    delete_subtree(current_user.id, topic_id)
     db.session.commit()
+    jobs.kick()
     
     flash('Topic deleted successfully!', 'success')
     
@@ -152,6 +206,10 @@ def create_subtopic(topic_id):
     if request.method == 'POST':
         name = request.form.get('name')
         description = request.form.get('description')
+
+        if not nesting_allowed(topic.id):
+            flash(f"Topics can only be nested {current_app.config['TOPIC_MAX_DEPTH']} levels deep", 'error')
+            return redirect(url_for('topic.view_topic', topic_id=topic.id))
         
         new_subtopic = Topic(
             name=name,
@@ -176,9 +234,11 @@ def delete_subtopic(topic_id):
         flash('Subtopic not found', 'error')
         return redirect(url_for('dashboard'))
 
-    db.session.delete(subtopic)
+    parent_id = subtopic.parent_topic_id
+    delete_subtree(current_user.id, topic_id)
     db.session.commit()
+    jobs.kick()
 
     flash('Subtopic deleted successfully!', 'success')
-    return redirect(url_for('topic.view_topic', topic_id=subtopic.parent_topic_id))
+    return redirect(url_for('topic.view_topic', topic_id=parent_id))
 
@@ -0,0 +1,159 @@
+"""The topic tree as a closure table, so subtree and ancestor reads are single indexed queries.
+
+topic_closure holds a row for every (ancestor, descendant) pair, each
+topic paired with itself at depth 0. "Everything under this topic" is
+then one lookup on the primary key and "the path to this topic" one
+lookup on (descendant_id, depth), however deep the tree. parent_topic_id
+stays the source of truth. The mapper events below keep the table in
+step with it in the same transaction, including moving a whole subtree.
+Bulk inserts call add_topics() themselves. rebuild() recomputes
+everything.
+"""
+from collections import namedtuple
+from sqlalchemy import delete, event, func, insert, inspect, literal, select
+from .models import Topic, TopicClosure
+
+# Enough for any real tree; stops rebuild() from looping on corrupt parent links
+_REBUILD_DEPTH_LIMIT = 1000
+
+Crumb = namedtuple("Crumb", "id name")
+
+_closure = TopicClosure.__table__
+_topic = Topic.__table__
+_COLUMNS = ("ancestor_id", "descendant_id", "depth")
+
+
+class TopicCycle(ValueError):
+    """A topic cannot be moved under itself or one of its own subtopics"""
+
+
+def descendants(topic_id, include_self=True):
+    """SELECT of the ids in a topic's subtree, for use in IN (...)"""
+    statement = select(_closure.c.descendant_id).where(_closure.c.ancestor_id == topic_id)
+    if not include_self:
+        statement = statement.where(_closure.c.depth > 0)
+    return statement
+
+
+def under(model, topic_id):
+    """WHERE clause for the rows of model (Note, Resource, ...) anywhere in a topic's subtree"""
+    return model.topic_id.in_(descendants(topic_id))
+
+
+def breadcrumbs(session, topic_id):
+    """The topic's ancestors as Crumbs, root first, not including the topic itself"""
+    rows = session.execute(
+        select(Topic.id, Topic.name)
+        .join(TopicClosure, TopicClosure.ancestor_id == Topic.id)
+        .where(TopicClosure.descendant_id == topic_id, TopicClosure.depth > 0)
+        .order_by(TopicClosure.depth.desc())
+    ).all()
+    return [Crumb(*row) for row in rows]
+
+
+def depth(connection, topic_id):
+    """Levels above a topic: 0 for a root topic"""
+    return connection.execute(
+        select(func.coalesce(func.max(_closure.c.depth), 0)).where(_closure.c.descendant_id == topic_id)
+    ).scalar()
+
+
+def height(connection, topic_id):
+    """Levels below a topic: 0 for a topic without subtopics"""
+    return connection.execute(
+        select(func.coalesce(func.max(_closure.c.depth), 0)).where(_closure.c.ancestor_id == topic_id)
+    ).scalar()
+
+
+def is_within(connection, topic_id, ancestor_id):
+    """True if topic_id is ancestor_id or one of its descendants"""
+    return connection.execute(
+        select(1).where(_closure.c.ancestor_id == ancestor_id, _closure.c.descendant_id == topic_id)
+    ).first() is not None
+
+
+def _link(connection, topic_id, parent_id):
+    connection.execute(insert(_closure).values(ancestor_id=topic_id, descendant_id=topic_id, depth=0))
+    if parent_id is not None:
+        connection.execute(insert(_closure).from_select(_COLUMNS, select(
+            _closure.c.ancestor_id, literal(topic_id), _closure.c.depth + 1
+        ).where(_closure.c.descendant_id == parent_id)))
+
+
+def _move(connection, topic_id, new_parent_id):
+    """Re-hang a subtree under a new parent (or make it a root): two set-based statements"""
+    subtree = select(_closure.c.descendant_id).where(_closure.c.ancestor_id == topic_id)
+    # Paths from the old ancestors into the subtree
+    connection.execute(delete(_closure).where(
+        _closure.c.descendant_id.in_(subtree), _closure.c.ancestor_id.not_in(subtree)
+    ))
+    if new_parent_id is not None:
+        above = _closure.alias("above")
+        below = _closure.alias("below")
+        # Every ancestor of the new parent paired with every topic in the subtree
+        connection.execute(insert(_closure).from_select(_COLUMNS, select(
+            above.c.ancestor_id, below.c.descendant_id, above.c.depth + below.c.depth + 1
+        ).select_from(above.join(below, below.c.ancestor_id == topic_id))
+            .where(above.c.descendant_id == new_parent_id)))
+
+
+def add_topics(session, topic_ids):
+    """Closure rows for topics inserted in bulk.
+
+    Their parents must already have their rows, i.e. a parent is inserted
+    in an earlier call than its children (as Importer does).
+    """
+    if not topic_ids:
+        return
+    session.execute(insert(_closure).from_select(_COLUMNS, select(
+        _topic.c.id, _topic.c.id, literal(0)
+    ).where(_topic.c.id.in_(topic_ids))))
+    session.execute(insert(_closure).from_select(_COLUMNS, select(
+        _closure.c.ancestor_id, _topic.c.id, _closure.c.depth + 1
+    ).join(_topic, _closure.c.descendant_id == _topic.c.parent_topic_id).where(_topic.c.id.in_(topic_ids))))
+
+
+def remove_topics(session, topic_ids):
+    """Drop the rows of topics deleted in bulk, together with their whole subtrees"""
+    session.execute(delete(_closure).where(_closure.c.descendant_id.in_(topic_ids)))
+
+
+def rebuild(connection):
+    """Recompute the table from parent_topic_id"""
+    connection.execute(delete(_closure))
+    paths = select(
+        _topic.c.id.label("ancestor_id"), _topic.c.id.label("descendant_id"), literal(0).label("depth")
+    ).cte("paths", recursive=True)
+    paths = paths.union_all(
+        select(paths.c.ancestor_id, _topic.c.id, paths.c.depth + 1)
+        .where(_topic.c.parent_topic_id == paths.c.descendant_id, paths.c.depth < _REBUILD_DEPTH_LIMIT)
+    )
+    connection.execute(insert(_closure).from_select(
+        _COLUMNS, select(paths.c.ancestor_id, paths.c.descendant_id, paths.c.depth)
+    ))
+
+
+@event.listens_for(Topic, "after_insert")
+def _topic_inserted(mapper, connection, target):
+    _link(connection, target.id, target.parent_topic_id)
+
+
+@event.listens_for(Topic, "before_update")
+def _topic_moving(mapper, connection, target):
+    history = inspect(target).attrs.parent_topic_id.history
+    new_parent = history.added[0] if history.added else None
+    if history.has_changes() and new_parent is not None and is_within(connection, new_parent, target.id):
+        raise TopicCycle(f"topic {target.id} cannot be moved under its own subtree")
+
+
+@event.listens_for(Topic, "after_update")
+def _topic_moved(mapper, connection, target):
+    history = inspect(target).attrs.parent_topic_id.history
+    if history.has_changes():
+        _move(connection, target.id, target.parent_topic_id)
+
+
+@event.listens_for(Topic, "before_delete")
+def _topic_deleting(mapper, connection, target):
+    # Subtopics deleted by the ORM cascade drop their own rows
+    connection.execute(delete(_closure).where(_closure.c.descendant_id == target.id))
@@ -0,0 +1,219 @@
+"""Per-topic counters for the dashboard cards, kept in the topic_stats table.
+
+Each row is updated in the same transaction as the change it counts, by
+the mapper events below, so reading the cards is a single indexed SELECT.
+Bulk statements skip those events: code that inserts or deletes rows in
+bulk calls refresh() (or drop()) for the topics it touched.
+"""
+from collections import namedtuple
+from datetime import datetime
+from sqlalchemy import delete, event, exists, func, insert, inspect, select, update
+from .extensions import db
+from .models import Flashcard, Note, Resource, Topic, TopicStats
+
+# What a dashboard card shows; due is the number of cards due for review now
+TopicCounts = namedtuple("TopicCounts", "resources notes flashcards due subtopics bytes_uploaded")
+
+EMPTY = TopicCounts(0, 0, 0, 0, 0, 0)
+
+_stats = TopicStats.__table__
+_COUNTERS = ("resource_count", "note_count", "flashcard_count", "subtopic_count", "bytes_uploaded")
+
+
+def _computed(topic_ids=None):
+    """SELECT of (topic_id, user_id, counters...) computed from the source tables"""
+    def count(model):
+        return select(func.count()).where(model.topic_id == Topic.id).scalar_subquery()
+
+    child = db.aliased(Topic)
+    statement = select(
+        Topic.id,
+        Topic.user_id,
+        count(Resource),
+        count(Note),
+        count(Flashcard),
+        select(func.count()).where(child.parent_topic_id == Topic.id).scalar_subquery(),
+        select(func.coalesce(func.sum(Resource.file_size), 0))
+        .where(Resource.topic_id == Topic.id).scalar_subquery(),
+    )
+    if topic_ids is not None:
+        statement = statement.where(Topic.id.in_(topic_ids))
+    return statement
+
+
+def _fill(connection, topic_ids=None):
+    connection.execute(
+        insert(_stats).from_select(("topic_id", "user_id") + _COUNTERS, _computed(topic_ids))
+    )
+
+
+def refresh(topic_ids, connection=None):
+    """Recompute the counters of these topics; topics that no longer exist lose their row"""
+    topic_ids = list(set(topic_ids) - {None})
+    if not topic_ids:
+        return
+    connection = connection or db.session.connection()
+    connection.execute(delete(_stats).where(_stats.c.topic_id.in_(topic_ids)))
+    _fill(connection, topic_ids)
+
+
+def drop(topic_ids, connection=None):
+    """Remove the rows of deleted topics"""
+    if topic_ids:
+        connection = connection or db.session.connection()
+        connection.execute(delete(_stats).where(_stats.c.topic_id.in_(list(topic_ids))))
+
+
+def rebuild(connection):
+    """Recompute every row from scratch"""
+    connection.execute(delete(_stats))
+    _fill(connection)
+
+
+def check(connection):
+    """Rows whose stored counters differ from the source tables: [(topic_id, stored, actual)]"""
+    stored = {row[0]: tuple(row[1:]) for row in connection.execute(
+        select(_stats.c.topic_id, *(_stats.c[name] for name in _COUNTERS))
+    )}
+    problems = []
+    for row in connection.execute(_computed()):
+        topic_id, actual = row[0], tuple(row[2:])
+        counters = stored.pop(topic_id, None)
+        if counters != actual:
+            problems.append((topic_id, counters, actual))
+    # Rows left over belong to topics that no longer exist
+    problems += [(topic_id, counters, None) for topic_id, counters in stored.items()]
+    return problems
+
+
+def for_user(user_id, topic_ids=None):
+    """{topic_id: TopicCounts} for a user's topics (or some of them), in one statement"""
+    due = (
+        select(func.count())
+        .where(Flashcard.topic_id == _stats.c.topic_id, Flashcard.next_review_at <= datetime.utcnow())
+        .scalar_subquery()
+    )
+    statement = (
+        select(_stats.c.topic_id, _stats.c.resource_count, _stats.c.note_count, _stats.c.flashcard_count,
+               due, _stats.c.subtopic_count, _stats.c.bytes_uploaded)
+        .where(_stats.c.user_id == user_id)
+    )
+    if topic_ids is not None:
+        statement = statement.where(_stats.c.topic_id.in_(list(topic_ids)))
+    return {row[0]: TopicCounts(*row[1:]) for row in db.session.execute(statement)}
+
+
+def for_topic(user_id, topic_id):
+    return for_user(user_id, [topic_id]).get(topic_id, EMPTY)
+
+
+def _ensure(connection, *topic_ids):
+    """Create the missing rows of these topics, before the change they will count is made.
+
+    A row computed afterwards would already include the change, and every
+    other row of the same flush, so the deltas would count them twice.
+    """
+    topic_ids = list(set(topic_ids) - {None})
+    if topic_ids:
+        connection.execute(insert(_stats).from_select(
+            ("topic_id", "user_id") + _COUNTERS,
+            _computed(topic_ids).where(~exists().where(_stats.c.topic_id == Topic.id)),
+        ))
+
+
+def _bump(connection, topic_id, **deltas):
+    """Add deltas to a topic's counters; _ensure() its row before the change"""
+    if topic_id is None:
+        return
+    connection.execute(
+        update(_stats).where(_stats.c.topic_id == topic_id)
+        .values({name: _stats.c[name] + delta for name, delta in deltas.items()})
+    )
+
+
+def _moved(target, attribute):
+    """(old, new) if an attribute changed in this flush, else None"""
+    history = inspect(target).attrs[attribute].history
+    if not history.has_changes():
+        return None
+    return (history.deleted[0] if history.deleted else None,
+            history.added[0] if history.added else None)
+
+
+def _listen(model, counter, size=None):
+    """Keep counter (and bytes_uploaded, from the size attribute) in step with model's rows"""
+    def deltas(sign, size_value):
+        changes = {counter: sign}
+        if size:
+            changes['bytes_uploaded'] = sign * (size_value or 0)
+        return changes
+
+    @event.listens_for(model, "before_insert")
+    @event.listens_for(model, "before_delete")
+    def _counting(mapper, connection, target):
+        _ensure(connection, target.topic_id)
+
+    @event.listens_for(model, "before_update")
+    def _updating(mapper, connection, target):
+        moved = _moved(target, 'topic_id')
+        if moved:
+            _ensure(connection, *moved)
+        elif size and _moved(target, size):
+            _ensure(connection, target.topic_id)
+
+    @event.listens_for(model, "after_insert")
+    def _inserted(mapper, connection, target):
+        _bump(connection, target.topic_id, **deltas(1, size and getattr(target, size)))
+
+    @event.listens_for(model, "after_delete")
+    def _deleted(mapper, connection, target):
+        _bump(connection, target.topic_id, **deltas(-1, size and getattr(target, size)))
+
+    @event.listens_for(model, "after_update")
+    def _updated(mapper, connection, target):
+        moved = _moved(target, 'topic_id')
+        resized = _moved(target, size) if size else None
+        if moved:
+            old_size = resized[0] if resized else size and getattr(target, size)
+            _bump(connection, moved[0], **deltas(-1, old_size))
+            _bump(connection, moved[1], **deltas(1, size and getattr(target, size)))
+        elif resized:
+            _bump(connection, target.topic_id, bytes_uploaded=(resized[1] or 0) - (resized[0] or 0))
+
+
+_listen(Resource, 'resource_count', size='file_size')
+_listen(Note, 'note_count')
+_listen(Flashcard, 'flashcard_count')
+
+
+@event.listens_for(Topic, "before_insert")
+def _topic_inserting(mapper, connection, target):
+    _ensure(connection, target.parent_topic_id)
+
+
+@event.listens_for(Topic, "after_insert")
+def _topic_inserted(mapper, connection, target):
+    _fill(connection, [target.id])
+    _bump(connection, target.parent_topic_id, subtopic_count=1)
+
+
+@event.listens_for(Topic, "before_delete")
+def _topic_deleting(mapper, connection, target):
+    drop([target.id], connection)
+    _ensure(connection, target.parent_topic_id)
+    _bump(connection, target.parent_topic_id, subtopic_count=-1)
+
+
+@event.listens_for(Topic, "before_update")
+def _topic_updating(mapper, connection, target):
+    moved = _moved(target, 'parent_topic_id')
+    if moved:
+        _ensure(connection, *moved)
+
+
+@event.listens_for(Topic, "after_update")
+def _topic_updated(mapper, connection, target):
+    moved = _moved(target, 'parent_topic_id')
+    if moved:
+        _bump(connection, moved[0], subtopic_count=-1)
+        _bump(connection, moved[1], subtopic_count=1)
@@ -0,0 +1,111 @@
+from collections import namedtuple
+from flask import current_app, has_app_context
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session, object_session
+from .cache import cache_stats, make_backend
+from .extensions import db
+from .models import Topic
+
+# Compact, picklable stand-in for a Topic row in the sidebar.
+# subtopics is a tuple of TopicNode, newest first.
+TopicNode = namedtuple("TopicNode", "id name description parent_topic_id created_at subtopics")
+
+stats = cache_stats("topic_tree")
+
+# session.info key holding user ids to invalidate again after commit
+_PENDING_KEY = "topic_tree_pending"
+
+
+def _cache():
+    return current_app.extensions['topic_tree_cache']
+
+
+def _key(user_id):
+    return f"topic_tree:{user_id}"
+
+
+def build_tree(rows):
+    """Assemble (id, name, description, parent_topic_id, created_at) rows into root nodes"""
+    children = {}
+    for row in rows:
+        children.setdefault(row.parent_topic_id, []).append(row)
+
+    def build(parent_id, seen):
+        nodes = []
+        for row in sorted(children.get(parent_id, ()), key=lambda r: r.created_at, reverse=True):
+            if row.id in seen:
+                continue
+            subtopics = build(row.id, seen | {row.id})
+            nodes.append(TopicNode(row.id, row.name, row.description, row.parent_topic_id, row.created_at, subtopics))
+        return tuple(nodes)
+
+    return build(None, frozenset())
+
+
+def get_topic_tree(user_id):
+    """All of a user's topics as a tree of TopicNode, served from the cache"""
+    cache = _cache()
+    tree = cache.get(_key(user_id))
+    if tree is not None:
+        stats.hit()
+        return tree
+
+    stats.miss()
+    rows = db.session.execute(
+        select(Topic.id, Topic.name, Topic.description, Topic.parent_topic_id, Topic.created_at)
+        .where(Topic.user_id == user_id)
+    ).all()
+    tree = build_tree(rows)
+    cache.set(_key(user_id), tree)
+    return tree
+
+
+def invalidate_topic_tree(user_id):
+    """Drop a user's cached tree; call after bulk statements that bypass the ORM"""
+    if has_app_context() and 'topic_tree_cache' in current_app.extensions:
+        _cache().delete(_key(user_id))
+        stats.invalidated()
+
+
+def invalidate_on_commit(session, user_id):
+    """Drop a user's cached tree now and again once the session's transaction commits"""
+    invalidate_topic_tree(user_id)
+    # Invalidate once more after commit, in case a concurrent request
+    # re-cached the tree before this transaction became visible
+    session.info.setdefault(_PENDING_KEY, set()).add(user_id)
+
+
+def _topic_changed(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        invalidate_on_commit(session, target.user_id)
+    else:
+        invalidate_topic_tree(target.user_id)
+
+
+for _event in ("after_insert", "after_update", "after_delete"):
+    event.listen(Topic, _event, _topic_changed)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed(session):
+    # Savepoints fire this too; wait for the outer transaction
+    if session.in_nested_transaction():
+        return
+    for user_id in session.info.pop(_PENDING_KEY, ()):
+        invalidate_topic_tree(user_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_pending(session):
+    if session.in_nested_transaction():
+        return
+    session.info.pop(_PENDING_KEY, None)
+
+
+def init_app(app):
+    app.extensions['topic_tree_cache'] = make_backend(
+        app,
+        max_entries=app.config['TOPIC_TREE_CACHE_SIZE'],
+        ttl=app.config['TOPIC_TREE_CACHE_TTL'],
+    )
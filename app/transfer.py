@@ -0,0 +1,427 @@
+import json
+import zipfile
+from contextlib import closing
+from datetime import datetime
+from flask import Blueprint, Response, current_app, jsonify, request, stream_with_context
+from flask_login import current_user, login_required
+from sqlalchemy import insert, select
+from . import blobstore, fragment_cache, jobs, links, quota, topic_closure, topic_stats
+from .extensions import db
+from .models import Flashcard, Note, Resource, Topic
+from .processing import queue_pdf_processing
+from .search import index_new_rows
+from .storage import get_storage
+from .topic_tree import invalidate_topic_tree
+
+bp = Blueprint('transfer', __name__, url_prefix='/api')
+
+# Rows fetched per round trip while streaming an export
+EXPORT_BATCH_SIZE = 1000
+
+_RESOURCE_COLUMNS = (Resource.id, Resource.topic_id, Resource.title, Resource.resource_type, Resource.url,
+                     Resource.original_filename, Resource.file_size, Resource.content_hash, Resource.created_at)
+_NOTE_COLUMNS = (Note.id, Note.topic_id, Note.title, Note.content, Note.is_ai_generated,
+                 Note.created_at, Note.updated_at)
+_FLASHCARD_COLUMNS = (Flashcard.id, Flashcard.topic_id, Flashcard.question, Flashcard.answer, Flashcard.difficulty,
+                      Flashcard.ease_factor, Flashcard.interval_days, Flashcard.repetitions,
+                      Flashcard.last_reviewed_at, Flashcard.next_review_at, Flashcard.created_at)
+
+
+class InvalidRecord(ValueError):
+    """A line of an import file could not be used"""
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialise {type(value).__name__}")
+
+
+def _line(record):
+    return json.dumps(record, default=_json_default, ensure_ascii=False) + "\n"
+
+
+def _topics_parent_first(user_id):
+    """The user's topics ordered so that every parent precedes its children"""
+    rows = db.session.execute(
+        select(Topic.id, Topic.parent_topic_id, Topic.name, Topic.description, Topic.created_at)
+        .where(Topic.user_id == user_id)
+        .order_by(Topic.id)
+    ).all()
+    children = {}
+    for row in rows:
+        children.setdefault(row.parent_topic_id, []).append(row)
+
+    ordered, level = [], children.get(None, [])
+    while level:
+        ordered.extend(level)
+        level = [child for row in level for child in children.get(row.id, [])]
+    return ordered
+
+
+def _stream_rows(columns, user_id):
+    model = columns[0].class_
+    statement = (
+        select(*columns)
+        .where(model.user_id == user_id)
+        .order_by(model.id)
+        .execution_options(yield_per=EXPORT_BATCH_SIZE)
+    )
+    for row in db.session.execute(statement):
+        yield row._asdict()
+
+
+def export_records(user_id):
+    """Yield every record of a user's topic tree, parents before children"""
+    yield {'type': 'meta', 'format': 'studymate-export', 'version': 1,
+           'exported_at': datetime.utcnow()}
+    for row in _topics_parent_first(user_id):
+        yield {'type': 'topic', 'id': row.id, 'parent_topic_id': row.parent_topic_id,
+               'name': row.name, 'description': row.description, 'created_at': row.created_at}
+    for kind, columns in (('resource', _RESOURCE_COLUMNS), ('note', _NOTE_COLUMNS),
+                          ('flashcard', _FLASHCARD_COLUMNS)):
+        for record in _stream_rows(columns, user_id):
+            record['type'] = kind
+            yield record
+
+
+class _ZipStream:
+    """Write-only sink that lets zipfile produce a zip archive incrementally"""
+
+    def __init__(self):
+        self._chunks = []
+        self._offset = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._offset
+
+    def flush(self):
+        pass
+
+    def pending(self):
+        return sum(len(chunk) for chunk in self._chunks)
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _export_zip(user_id):
+    sink = _ZipStream()
+    blobs = set()
+    with zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_DEFLATED) as archive:
+        with archive.open("data.jsonl", mode="w", force_zip64=True) as entry:
+            for record in export_records(user_id):
+                if record['type'] == 'resource' and record.get('content_hash'):
+                    blobs.add(record['content_hash'])
+                entry.write(_line(record).encode())
+                if sink.pending() >= 64 * 1024:
+                    yield sink.drain()
+
+        storage = get_storage()
+        for sha256 in sorted(blobs):
+            try:
+                source = storage.open(blobstore.blob_path(sha256))
+            except FileNotFoundError:
+                continue
+            with closing(source), archive.open(f"blobs/{sha256}", mode="w", force_zip64=True) as entry:
+                while chunk := source.read(blobstore.CHUNK_SIZE):
+                    entry.write(chunk)
+                    yield sink.drain()
+    yield sink.drain()
+
+
+@bp.route("/export")
+@login_required
+def export_data():
+    """Stream the user's topics, resources, notes and flashcards as JSON lines (or a zip with PDFs)"""
+    user_id = current_user.id
+    stamp = datetime.utcnow().strftime('%Y%m%d')
+
+    if request.args.get('format') == 'zip':
+        response = Response(stream_with_context(_export_zip(user_id)), mimetype='application/zip')
+        response.headers['Content-Disposition'] = f'attachment; filename="studymate-{stamp}.zip"'
+        return response
+
+    lines = (_line(record) for record in export_records(user_id))
+    response = Response(stream_with_context(lines), mimetype='application/x-ndjson')
+    response.headers['Content-Disposition'] = f'attachment; filename="studymate-{stamp}.jsonl"'
+    return response
+
+
+_COUNT_KEYS = {Resource: 'resources', Note: 'notes', Flashcard: 'flashcards'}
+
+
+def _timestamp(value):
+    return datetime.fromisoformat(value) if value else None
+
+
+class Importer:
+    """Insert exported records for one user in batched, chunked transactions.
+
+    Old ids are remapped as topics are inserted; records must arrive with
+    parents before children, as export_records() produces them. A topic
+    nested deeper than TOPIC_MAX_DEPTH is rejected, as the topic forms do.
+    """
+
+    def __init__(self, user_id, archive=None, batch_size=1000):
+        self.user_id = user_id
+        self.archive = archive
+        self.batch_size = batch_size
+        self.topic_ids = {}
+        # Levels above each topic by its old id: 0 for a root topic
+        self.topic_depths = {}
+        self.max_depth = current_app.config['TOPIC_MAX_DEPTH']
+        self.pending_topics = []
+        self.rows = {Resource: [], Note: [], Flashcard: []}
+        self.counts = {'topics': 0, 'resources': 0, 'notes': 0, 'flashcards': 0, 'skipped': 0}
+        # What the committed batches hold, reported if the import is abandoned
+        self.committed = dict(self.counts)
+        # Storage quota left for imported PDFs; None for no limit
+        self.room = quota.remaining(user_id)
+
+    def add(self, record):
+        kind = record.get('type')
+        if kind == 'topic':
+            self._add_topic(record)
+        elif kind == 'resource':
+            self._add_resource(record)
+        elif kind == 'note':
+            self._add_row(Note, record, {
+                'title': (record.get('title') or 'Untitled Note')[:200],
+                'content': record.get('content') or '',
+                'is_ai_generated': bool(record.get('is_ai_generated')),
+                'created_at': _timestamp(record.get('created_at')) or datetime.now(),
+                'updated_at': _timestamp(record.get('updated_at')) or datetime.now(),
+            })
+        elif kind == 'flashcard':
+            self._add_row(Flashcard, record, {
+                'question': record.get('question') or '',
+                'answer': record.get('answer') or '',
+                'difficulty': int(record.get('difficulty') or 1),
+                'ease_factor': float(record.get('ease_factor') or 2.5),
+                'interval_days': float(record.get('interval_days') or 0.0),
+                'repetitions': int(record.get('repetitions') or 0),
+                'last_reviewed_at': _timestamp(record.get('last_reviewed_at')),
+                'next_review_at': _timestamp(record.get('next_review_at')) or datetime.utcnow(),
+                'created_at': _timestamp(record.get('created_at')) or datetime.utcnow(),
+            })
+        elif kind != 'meta':
+            raise InvalidRecord(f"unknown record type {kind!r}")
+
+    def _add_topic(self, record):
+        if not record.get('name') or 'id' not in record:
+            raise InvalidRecord("topics need an id and a name")
+        parent = record.get('parent_topic_id')
+        # Unknown parents make the topic a root topic
+        depth = self.topic_depths[parent] + 1 if parent in self.topic_depths else 0
+        if depth > self.max_depth:
+            raise InvalidRecord(f"topic {record['id']} is nested more than {self.max_depth} levels deep")
+        self.topic_depths[record['id']] = depth
+        # A parent still waiting in the batch must get its new id first
+        if parent is not None and parent not in self.topic_ids:
+            self._flush_topics()
+        self.pending_topics.append(record)
+        if len(self.pending_topics) >= self.batch_size:
+            self._flush_topics()
+
+    def _flush_topics(self):
+        if not self.pending_topics:
+            return
+        rows = [
+            {
+                'name': record['name'][:120],
+                'description': record.get('description'),
+                'user_id': self.user_id,
+                # Unknown parents make the topic a root topic
+                'parent_topic_id': self.topic_ids.get(record.get('parent_topic_id')),
+                'created_at': _timestamp(record.get('created_at')) or datetime.now(),
+                'updated_at': datetime.now(),
+            }
+            for record in self.pending_topics
+        ]
+        new_ids = db.session.execute(
+            insert(Topic).returning(Topic.id, sort_by_parameter_order=True), rows
+        ).scalars().all()
+        for record, new_id in zip(self.pending_topics, new_ids):
+            self.topic_ids[record['id']] = new_id
+        # Bulk inserts skip the closure and counter events
+        topic_closure.add_topics(db.session, new_ids)
+        topic_stats.refresh(new_ids + [row['parent_topic_id'] for row in rows])
+        self.counts['topics'] += len(rows)
+        self.pending_topics = []
+
+    def _topic_for(self, record):
+        self._flush_topics()
+        return self.topic_ids.get(record.get('topic_id'))
+
+    def _add_row(self, model, record, values):
+        topic_id = self._topic_for(record)
+        if topic_id is None:
+            self.counts['skipped'] += 1
+            return
+        values.update(user_id=self.user_id, topic_id=topic_id)
+        self.rows[model].append(values)
+        if len(self.rows[model]) >= self.batch_size:
+            self._flush_rows(model)
+
+    def _add_resource(self, record):
+        values = {
+            'title': (record.get('title') or 'Untitled Resource')[:200],
+            'resource_type': record.get('resource_type'),
+            'url': None,
+            'url_hash': None,
+            'file_path': None,
+            'file_size': None,
+            'original_filename': None,
+            'content_hash': None,
+            'status': 'active',
+            'created_at': _timestamp(record.get('created_at')) or datetime.utcnow(),
+        }
+        if values['resource_type'] == 'link' and record.get('url'):
+            values.update(url=record['url'], url_hash=links.url_key(record['url']))
+        elif values['resource_type'] == 'pdf' and self._has_blob(record.get('content_hash')):
+            # Checked before the file is stored; the batch is charged when it is inserted
+            size = self.archive.getinfo(f"blobs/{record['content_hash']}").file_size
+            if self.room is not None:
+                if size > self.room:
+                    raise quota.QuotaExceeded(self.user_id, size, quota.limit() - self.room, quota.limit())
+                self.room -= size
+            # Hash the archived bytes ourselves: the claimed hash is not trusted
+            with self.archive.open(f"blobs/{record['content_hash']}") as source:
+                path, sha256, size = blobstore.store_stream(source)
+            values.update(file_path=path, content_hash=sha256, file_size=size,
+                          original_filename=(record.get('original_filename') or 'document.pdf')[:255])
+        else:
+            # PDFs can only be imported from a zip export that carries the file
+            self.counts['skipped'] += 1
+            return
+        self._add_row(Resource, record, values)
+
+    def _has_blob(self, sha256):
+        if not self.archive or not sha256:
+            return False
+        try:
+            self.archive.getinfo(f"blobs/{sha256}")
+        except KeyError:
+            return False
+        return True
+
+    def _flush_rows(self, model):
+        if model is Resource:
+            self._charge_files()
+        rows = self.rows[model]
+        if not rows:
+            return
+        new_ids = db.session.execute(
+            insert(model).returning(model.id, sort_by_parameter_order=True), rows
+        ).scalars().all()
+        if model is Note:
+            index_new_rows(note_ids=new_ids)
+        elif model is Resource:
+            index_new_rows(resource_ids=new_ids)
+            # Imported PDFs get the same text/page/thumbnail jobs as uploads
+            for row, new_id in zip(rows, new_ids):
+                if row['content_hash']:
+                    queue_pdf_processing(db.session.get(Resource, new_id))
+            links.ensure_metadata(row['url'] for row in rows if row['url_hash'])
+        topic_stats.refresh({row['topic_id'] for row in rows})
+        self.counts[_COUNT_KEYS[model]] += len(rows)
+        self.rows[model] = []
+        # Each batch is its own transaction
+        self._commit()
+
+    def _commit(self):
+        db.session.commit()
+        self.committed = dict(self.counts)
+
+    def _charge_files(self):
+        """Charge the batch's PDFs to the storage quota; bulk inserts skip the usage events.
+
+        Raises QuotaExceeded if another upload used the room the batch
+        counted on; the caller rolls the batch back.
+        """
+        sizes = [row['file_size'] for row in self.rows[Resource] if row['file_size'] is not None]
+        quota.charge(db.session.connection(), self.user_id, sum(sizes), len(sizes))
+
+    def finish(self):
+        self._flush_topics()
+        for model in self.rows:
+            self._flush_rows(model)
+        self._commit()
+        return self._done()
+
+    def abort(self):
+        """Roll back the batch in progress, keeping the batches already committed"""
+        db.session.rollback()
+        self.pending_topics = []
+        self.rows = {model: [] for model in self.rows}
+        self.counts = dict(self.committed)
+        return self._done()
+
+    def _done(self):
+        # Bulk inserts skip the ORM events that invalidate the sidebar and fragment caches
+        invalidate_topic_tree(self.user_id)
+        fragment_cache.invalidate_fragments("user", self.user_id)
+        jobs.kick()
+        return self.counts
+
+
+def _records(lines):
+    for number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            raise InvalidRecord(f"line {number}: invalid JSON")
+        if not isinstance(record, dict):
+            raise InvalidRecord(f"line {number}: expected a JSON object")
+        yield number, record
+
+
+def _import(lines, archive=None):
+    importer = Importer(current_user.id, archive, current_app.config['IMPORT_BATCH_SIZE'])
+    number = 0
+    try:
+        for number, record in _records(lines):
+            importer.add(record)
+        return jsonify({'success': True, **importer.finish()})
+    except quota.QuotaExceeded as e:
+        counts = importer.abort()
+        return jsonify({'success': False, 'error': f"line {number}: {e}", **counts}), 413
+    except (InvalidRecord, ValueError, TypeError) as e:
+        message = str(e) if str(e).startswith("line ") else f"line {number}: {e}"
+        # Batches already committed stay imported
+        counts = importer.abort()
+        return jsonify({'success': False, 'error': message, **counts}), 400
+
+
+@bp.route("/import", methods=["POST"])
+@login_required
+def import_data():
+    """Import a JSON lines export (request body or 'file' upload) or a zip export"""
+    request.max_content_length = current_app.config['IMPORT_MAX_CONTENT_LENGTH']
+
+    if request.mimetype == 'multipart/form-data':
+        upload = request.files.get('file')
+        if not upload:
+            return jsonify({'success': False, 'error': 'No file uploaded'}), 400
+        if zipfile.is_zipfile(upload.stream):
+            upload.stream.seek(0)
+            with zipfile.ZipFile(upload.stream) as archive:
+                if "data.jsonl" not in archive.namelist():
+                    return jsonify({'success': False, 'error': 'data.jsonl missing from archive'}), 400
+                with archive.open("data.jsonl") as data:
+                    return _import((raw.decode('utf-8') for raw in data), archive)
+        upload.stream.seek(0)
+        return _import(raw.decode('utf-8') for raw in upload.stream)
+
+    return _import(raw.decode('utf-8') for raw in request.stream)
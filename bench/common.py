@@ -0,0 +1,53 @@
+"""Shared helpers for the benchmark scripts in this package."""
+import json
+import os
+import statistics
+import sys
+import tempfile
+from app import create_app
+from app.config import Config
+from app.extensions import db
+
+
+def make_app(data_dir=None, **overrides):
+    """Create the app against a throwaway SQLite database and upload folder"""
+    data_dir = data_dir or tempfile.mkdtemp(prefix="studymate-bench-")
+    settings = {
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(data_dir, 'bench.db')}",
+        'UPLOAD_FOLDER': os.path.join(data_dir, 'uploads'),
+        'JOBS_MODE': 'sync',
+    }
+    settings.update(overrides)
+    app = create_app(type("BenchConfig", (Config,), settings))
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+def percentiles(samples):
+    """Summary of latency samples in milliseconds"""
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def pick(p):
+        return round(ordered[min(int(len(ordered) * p), len(ordered) - 1)], 3)
+
+    return {
+        'count': len(ordered),
+        'mean': round(statistics.fmean(ordered), 3),
+        'p50': pick(0.50),
+        'p95': pick(0.95),
+        'p99': pick(0.99),
+        'max': round(ordered[-1], 3),
+    }
+
+
+def emit(report, path=None):
+    """Write a report as JSON to a file, or to stdout"""
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if path:
+        with open(path, "w") as f:
+            f.write(text + "\n")
+    else:
+        sys.stdout.write(text + "\n")
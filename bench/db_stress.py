@@ -0,0 +1,179 @@
+"""Concurrent write stress test for the database engine profiles.
+
+Starts N writer processes (standing in for gunicorn workers) that each
+commit small note inserts as fast as they can against one shared database,
+and reports write throughput, latency and "database is locked" failures.
+
+    python -m bench.db_stress --writers 8 --seconds 10
+    python -m bench.db_stress --postgres-url postgresql://localhost/studymate_bench
+
+Profiles: "sqlite-stock" (no pragmas), "sqlite-tuned" (Config.SQLITE_PRAGMAS)
+and "postgresql". Without --postgres-url a throwaway local cluster is started
+with initdb/pg_ctl when they are on PATH; otherwise that profile is skipped.
+"""
+import argparse
+import multiprocessing
+import os
+import shutil
+import socket
+import subprocess
+import tempfile
+import time
+from contextlib import contextmanager
+from sqlalchemy.exc import OperationalError
+from app import create_app
+from app.config import Config
+from app.database import describe
+from app.extensions import db
+from app.models import Note, Topic, User
+from .common import emit, percentiles
+from .run import git_revision
+
+
+def _app(uri, pragmas):
+    settings = {
+        'SQLALCHEMY_DATABASE_URI': uri,
+        'SQLITE_PRAGMAS': pragmas,
+        'UPLOAD_FOLDER': os.path.join(tempfile.gettempdir(), 'studymate-stress-uploads'),
+        'JOBS_MODE': 'sync',
+        'INSTRUMENTATION_ENABLED': False,
+    }
+    return create_app(type("StressConfig", (Config,), settings))
+
+
+def _prepare(uri, pragmas):
+    app = _app(uri, pragmas)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        user = User(username="stress", email="stress@example.com", password="x")
+        db.session.add(user)
+        db.session.flush()
+        topic = Topic(name="Stress", user_id=user.id)
+        db.session.add(topic)
+        db.session.commit()
+        settings = describe(db.engine)
+        ids = user.id, topic.id
+    with app.app_context():
+        db.engine.dispose()
+    return ids, settings
+
+
+def _writer(uri, pragmas, ids, start, deadline, results):
+    user_id, topic_id = ids
+    app = _app(uri, pragmas)
+    latencies, errors = [], 0
+    with app.app_context():
+        start.wait()
+        while time.time() < deadline:
+            began = time.perf_counter()
+            try:
+                db.session.add(Note(title="stress", content="x" * 500, user_id=user_id, topic_id=topic_id))
+                db.session.commit()
+                latencies.append((time.perf_counter() - began) * 1000)
+            except OperationalError:
+                db.session.rollback()
+                errors += 1
+        db.engine.dispose()
+    results.put((latencies, errors))
+
+
+def run_profile(uri, pragmas, writers, seconds):
+    ids, settings = _prepare(uri, pragmas)
+    context = multiprocessing.get_context("spawn")
+    start = context.Event()
+    results = context.Queue()
+    # Spawned processes need time to import the app before the clock starts
+    deadline = time.time() + seconds + 5
+    processes = [
+        context.Process(target=_writer, args=(uri, pragmas, ids, start, deadline, results))
+        for _ in range(writers)
+    ]
+    for process in processes:
+        process.start()
+    time.sleep(5)
+    start.set()
+
+    latencies, errors = [], 0
+    for _ in processes:
+        samples, failed = results.get()
+        latencies += samples
+        errors += failed
+    for process in processes:
+        process.join()
+
+    return {
+        'writers': writers,
+        'settings': settings,
+        'commits': len(latencies),
+        'errors': errors,
+        'commits_per_second': round(len(latencies) / seconds, 1),
+        'latency_ms': percentiles(latencies),
+    }
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@contextmanager
+def local_postgres():
+    """A temporary PostgreSQL cluster, or None when the server binaries are missing"""
+    initdb, pg_ctl = shutil.which("initdb"), shutil.which("pg_ctl")
+    if not (initdb and pg_ctl):
+        yield None
+        return
+    data_dir = tempfile.mkdtemp(prefix="studymate-pg-")
+    port = _free_port()
+    subprocess.run([initdb, "-D", data_dir, "-U", "postgres", "--auth=trust"], check=True, capture_output=True)
+    subprocess.run([pg_ctl, "-D", data_dir, "-w", "-l", os.path.join(data_dir, "server.log"),
+                    "-o", f"-p {port} -k {data_dir} -c max_connections=200", "start"],
+                   check=True, capture_output=True)
+    try:
+        yield f"postgresql://postgres@127.0.0.1:{port}/postgres"
+    finally:
+        subprocess.run([pg_ctl, "-D", data_dir, "-m", "fast", "stop"], capture_output=True)
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--writers", type=int, default=8, help="parallel writer processes")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--profiles", default="sqlite-stock,sqlite-tuned,postgresql")
+    parser.add_argument("--postgres-url", help="use this server instead of a throwaway local cluster")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    results = {}
+    for profile in args.profiles.split(","):
+        if profile.startswith("sqlite-"):
+            data_dir = tempfile.mkdtemp(prefix="studymate-stress-")
+            uri = f"sqlite:///{os.path.join(data_dir, 'stress.db')}"
+            pragmas = Config.SQLITE_PRAGMAS if profile == "sqlite-tuned" else {}
+            results[profile] = run_profile(uri, pragmas, args.writers, args.seconds)
+            shutil.rmtree(data_dir, ignore_errors=True)
+        elif profile == "postgresql":
+            if args.postgres_url:
+                results[profile] = run_profile(args.postgres_url, {}, args.writers, args.seconds)
+                continue
+            with local_postgres() as uri:
+                if uri is None:
+                    results[profile] = {'skipped': "no --postgres-url and no initdb/pg_ctl on PATH"}
+                else:
+                    results[profile] = run_profile(uri, {}, args.writers, args.seconds)
+        else:
+            parser.error(f"unknown profile {profile}")
+
+    emit({
+        'benchmark': 'db_stress',
+        'git_revision': git_revision(),
+        'params': vars(args),
+        'results': results,
+    }, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Exercise generation under concurrent users, with the stub provider.
+
+Each of --users users asks for exercises on one of their topics at the
+same moment, --rounds times; half of them ask about the same topic as
+another user's identical copy, so single-flight and the shared cache come
+into play. For each variant, reports wall time per round, request
+latency and how many provider calls were made.
+
+    python -m bench.generation --users 20 --stub-latency 0.5
+"""
+import argparse
+import threading
+import time
+from app.extensions import db
+from app.models import Note, Topic
+from .common import emit, make_app, percentiles
+from .run import TestClientDriver, git_revision
+from .seed import seed
+
+VARIANTS = {
+    # Every request is its own provider call
+    'unbatched': {'GENERATION_BATCH_SIZE': 1, 'GENERATION_BATCH_WINDOW': 0},
+    'batched': {'GENERATION_BATCH_SIZE': 16, 'GENERATION_BATCH_WINDOW': 0.05},
+}
+
+
+def _shared_topics(app, dataset):
+    """One topic per user; pairs of users get the same notes, as classmates sharing a handout would"""
+    topics = []
+    with app.app_context():
+        for n, (user_id, _) in enumerate(dataset['users']):
+            topic = Topic(name=f"Handout {n // 2}", user_id=user_id)
+            db.session.add(topic)
+            db.session.flush()
+            for i in range(5):
+                db.session.add(Note(title=f"Part {i}", user_id=user_id, topic_id=topic.id,
+                                    content=f"Handout {n // 2} section {i} covers one idea in detail. " * 3))
+            topics.append(topic.id)
+        db.session.commit()
+    return topics
+
+
+def _stream(driver, path):
+    # Read the whole event stream: the generation runs while it is consumed
+    return driver.client.get(path).get_data(as_text=True)
+
+
+def run_variant(settings, args):
+    app = make_app(GENERATION_STUB_LATENCY=args.stub_latency, LOGIN_IP_BURST=10 ** 6, **settings)
+    dataset = seed(app, users=args.users, topics=1, subtopics=0, resources=0, notes=0, flashcards=0, pdfs=0)
+    topics = _shared_topics(app, dataset)
+    drivers = [TestClientDriver(app, email) for _, email in dataset['users']]
+    batcher = app.extensions['generation']
+
+    latencies = []
+    rounds = []
+    for round_number in range(args.rounds):
+        # A different count each round changes the prompt, so nothing is cached across rounds
+        path = "/generation/topic/{}/exercises?count=" + str(round_number + 1)
+
+        def ask(driver, topic_id):
+            began = time.perf_counter()
+            body = _stream(driver, path.format(topic_id))
+            assert "event: done" in body, body[-200:]
+            latencies.append((time.perf_counter() - began) * 1000)
+
+        threads = [threading.Thread(target=ask, args=pair) for pair in zip(drivers, topics)]
+        began = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        rounds.append((time.perf_counter() - began) * 1000)
+
+    # Same requests again: answered from generation_cache
+    began = time.perf_counter()
+    for driver, topic_id in zip(drivers, topics):
+        _stream(driver, f"/generation/topic/{topic_id}/exercises?count=1")
+    cached_ms = (time.perf_counter() - began) * 1000 / len(drivers)
+
+    return {
+        'round_ms': percentiles(rounds),
+        'latency_ms': percentiles(latencies),
+        'requests': len(latencies),
+        'provider_calls': batcher.batches,
+        'requests_sent_to_provider': batcher.batched_requests,
+        'single_flight_shared': batcher.shared,
+        'cached_request_ms': round(cached_ms, 3),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--stub-latency", type=float, default=0.5, help="seconds per simulated model call")
+    parser.add_argument("--variants", default=",".join(VARIANTS))
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    emit({
+        'benchmark': 'generation',
+        'git_revision': git_revision(),
+        'params': vars(args),
+        'results': {name: run_variant(VARIANTS[name], args) for name in args.variants.split(",")},
+    }, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""Link preview fetching against a local stand-in HTTP server.
+
+The stand-in server answers every page after a fixed delay and supports
+ETag revalidation. The URLs are spread over several loopback addresses
+(127.0.0.1, 127.0.0.2, ...) so the per-host limit matters. For each
+variant, times the first fetch of every URL and a second pass in which
+every page is revalidated. Separately, adds the same links for several
+users through the app and counts how often the server is actually asked.
+
+    python -m bench.link_fetch --urls 200 --hosts 10 --latency-ms 100
+"""
+import argparse
+import asyncio
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from app import links
+from app.extensions import db
+from app.models import LinkMetadata, Resource, Topic, User
+from .common import emit, make_app
+from .run import git_revision
+
+VARIANTS = {
+    # One request at a time, as a synchronous fetcher would
+    'serial': {'concurrency': 1, 'per_host': 1},
+    'pooled_async': {'concurrency': 20, 'per_host': 2},
+}
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+
+def start_server(latency):
+    requests = {'full': 0, 'not_modified': 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            time.sleep(latency)
+            etag = f'"{self.path}"'
+            if self.headers.get("If-None-Match") == etag:
+                requests['not_modified'] += 1
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+            requests['full'] += 1
+            body = (f'<html><head><title>Page {self.path}</title>'
+                    f'<meta name="description" content="Stand-in page">'
+                    f'<link rel="icon" href="/favicon.png"></head><body>{"." * 20000}</body></html>').encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = _Server(("", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, requests
+
+
+def urls(port, count, hosts):
+    return [f"http://127.0.0.{i % hosts + 1}:{port}/page/{i}" for i in range(count)]
+
+
+def run_variant(settings, args, port):
+    fetch_settings = links.FetchSettings(
+        concurrency=settings['concurrency'], per_host=settings['per_host'], timeout=30,
+        max_bytes=256 * 1024, allow_private=True, user_agent="bench",
+    )
+    entries = [(str(i), url, None, None) for i, url in enumerate(urls(port, args.urls, args.hosts))]
+
+    began = time.perf_counter()
+    results = asyncio.run(links.fetch_all(entries, fetch_settings))
+    cold = time.perf_counter() - began
+    assert all(result.title for result in results), [r.error for r in results if not r.title][:3]
+
+    revalidate = [(r.url_hash, r.final_url, r.etag, r.last_modified) for r in results]
+    began = time.perf_counter()
+    results = asyncio.run(links.fetch_all(revalidate, fetch_settings))
+    warm = time.perf_counter() - began
+    return {
+        'first_fetch_s': round(cold, 3),
+        'revalidate_s': round(warm, 3),
+        'not_modified': sum(result.not_modified for result in results),
+    }
+
+
+def shared_cache(args, port, requests):
+    """Several users add the same links; the server should see each URL once"""
+    app = make_app(LINK_FETCH_ALLOW_PRIVATE=True, TEMPLATE_PRECOMPILE=False)
+    before = requests['full']
+    with app.app_context():
+        for n in range(args.users):
+            user = User(username=f"user{n}", email=f"user{n}@bench.invalid", password="x")
+            topic = Topic(name="Links", user=user)
+            db.session.add(topic)
+            for url in urls(port, args.urls, args.hosts):
+                # Users paste the same page with their own tracking parameters
+                resource = Resource(title="Link", resource_type="link", url=f"{url}?utm_source=user{n}",
+                                    user=user, topic=topic)
+                db.session.add(resource)
+                links.attach(resource)
+            db.session.commit()
+            links.fetch_due()
+        return {
+            'resources': Resource.query.count(),
+            'metadata_rows': LinkMetadata.query.count(),
+            'server_fetches': requests['full'] - before,
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--urls", type=int, default=200)
+    parser.add_argument("--hosts", type=int, default=10)
+    parser.add_argument("--latency-ms", type=float, default=100)
+    parser.add_argument("--users", type=int, default=5)
+    parser.add_argument("--variants", default=",".join(VARIANTS))
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    server, requests = start_server(args.latency_ms / 1000)
+    port = server.server_address[1]
+    try:
+        emit({
+            'benchmark': 'link_fetch',
+            'git_revision': git_revision(),
+            'params': vars(args),
+            'results': {name: run_variant(VARIANTS[name], args, port) for name in args.variants.split(",")},
+            'shared_cache': shared_cache(args, port, requests),
+        }, args.output)
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
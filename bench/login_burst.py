@@ -0,0 +1,118 @@
+"""Dashboard latency during a burst of logins.
+
+Runs the app behind a local threaded WSGI server, measures /dashboard on its
+own, then again while client threads fire a burst of logins. Each hashing
+mode is measured separately, so inline hashing can be compared with the
+process pool.
+
+    python -m bench.login_burst --logins 1000 --modes inline,process
+"""
+import argparse
+import http.client
+import threading
+import time
+from collections import Counter
+from .common import emit, make_app, percentiles
+from .run import WSGIServerDriver, git_revision
+from .seed import PASSWORD, seed
+
+
+def _login(port, email):
+    connection = http.client.HTTPConnection("127.0.0.1", port)
+    try:
+        connection.request("POST", "/auth/login", f"email={email}&password={PASSWORD}".encode(),
+                           {'Content-Type': 'application/x-www-form-urlencoded'})
+        response = connection.getresponse()
+        response.read()
+        return response.status
+    finally:
+        connection.close()
+
+
+def _probe(driver, stop, latencies, interval):
+    while not stop.is_set():
+        began = time.perf_counter()
+        driver.request("GET", "/dashboard")
+        latencies.append((time.perf_counter() - began) * 1000)
+        time.sleep(interval)
+
+
+def run_mode(mode, args):
+    # Throttling is off here: the burst comes from one address on purpose
+    app = make_app(HASH_MODE=mode, HASH_WORKERS=args.hash_workers,
+                   HASH_QUEUE_LIMIT=args.queue_limit, JOBS_MODE='thread', JOBS_WORKERS=0,
+                   LOGIN_IP_BURST=0, LOGIN_EMAIL_BURST=0)
+    dataset = seed(app, users=args.users, topics=5, subtopics=2, resources=2, notes=5, flashcards=5)
+    emails = [email for _, email in dataset['users']]
+    app.extensions['hashing'].warm()
+    driver = WSGIServerDriver(app, emails[0])
+
+    baseline = []
+    stop = threading.Event()
+    probe = threading.Thread(target=_probe, args=(driver, stop, baseline, args.probe_interval))
+    probe.start()
+    time.sleep(args.baseline_seconds)
+    stop.set()
+    probe.join()
+
+    during, statuses = [], Counter()
+    lock = threading.Lock()
+    counter = iter(range(args.logins))
+
+    def login_worker():
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            status = _login(driver.port, emails[i % len(emails)])
+            with lock:
+                statuses[status] += 1
+
+    stop = threading.Event()
+    probe = threading.Thread(target=_probe, args=(driver, stop, during, args.probe_interval))
+    probe.start()
+    began = time.perf_counter()
+    workers = [threading.Thread(target=login_worker) for _ in range(args.concurrency)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - began
+    stop.set()
+    probe.join()
+
+    driver.close()
+    app.extensions['hashing'].shutdown()
+    return {
+        'dashboard_baseline_ms': percentiles(baseline),
+        'dashboard_during_burst_ms': percentiles(during),
+        'burst_seconds': round(elapsed, 2),
+        'logins_per_second': round(args.logins / elapsed, 1),
+        'login_statuses': {str(status): count for status, count in sorted(statuses.items())},
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--logins", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=32, help="client threads sending logins")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--modes", default="inline,process")
+    parser.add_argument("--hash-workers", type=int, default=2)
+    parser.add_argument("--queue-limit", type=int, default=16, help="HASH_QUEUE_LIMIT")
+    parser.add_argument("--baseline-seconds", type=float, default=3)
+    parser.add_argument("--probe-interval", type=float, default=0.05, help="seconds between dashboard probes")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    emit({
+        'benchmark': 'login_burst',
+        'git_revision': git_revision(),
+        'params': vars(args),
+        'results': {mode: run_mode(mode, args) for mode in args.modes.split(",")},
+    }, args.output)
+
+
+if __name__ == "__main__":
+    main()
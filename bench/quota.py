@@ -0,0 +1,83 @@
+"""Storage quota accounting: the usage counter against summing file sizes per upload.
+
+Gives one user libraries of increasing size (--sizes PDF resources,
+inserted with Core statements) and, at each size, times the two ways of
+knowing whether the next upload fits: reading and charging the
+storage_usage row (quota.py), and the SUM(file_size) over the user's
+resources it replaces.
+
+    python -m bench.quota --sizes 100,10000,100000
+"""
+import argparse
+import statistics
+import time
+from datetime import datetime
+from sqlalchemy import func, insert, select
+from app import quota
+from app.extensions import db
+from app.models import Resource, Topic, User
+from .common import emit, make_app
+from .run import git_revision
+
+
+def _time(action, samples):
+    timings = []
+    for _ in range(samples):
+        began = time.perf_counter()
+        action()
+        timings.append((time.perf_counter() - began) * 1e6)
+    return round(statistics.median(timings), 1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="100,10000,100000", help="resources in the library, per step")
+    parser.add_argument("--samples", type=int, default=200)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    app = make_app(TEMPLATE_PRECOMPILE=False, STORAGE_QUOTA_BYTES=10 ** 15)
+    steps = {}
+    with app.app_context():
+        user_id = db.session.execute(insert(User).returning(User.id), [
+            {'username': "quota", 'email': "quota@bench.invalid", 'password': "x"}
+        ]).scalar()
+        topic_id = db.session.execute(insert(Topic).returning(Topic.id), [
+            {'name': "Library", 'user_id': user_id, 'created_at': datetime.now(), 'updated_at': datetime.now()}
+        ]).scalar()
+        stored = 0
+        for size in sorted(map(int, args.sizes.split(","))):
+            db.session.execute(insert(Resource), [
+                {'title': f"R{n}", 'resource_type': "pdf", 'file_path': f"blobs/{n}", 'file_size': 100_000,
+                 'user_id': user_id, 'topic_id': topic_id}
+                for n in range(stored, size)
+            ])
+            stored = size
+            db.session.commit()
+            with db.engine.begin() as connection:
+                quota.rebuild(connection)
+
+            def counter():
+                quota.remaining(user_id)
+                quota.charge(db.session.connection(), user_id, 100_000, 1)
+                db.session.rollback()
+
+            def summed():
+                db.session.execute(
+                    select(func.coalesce(func.sum(Resource.file_size), 0)).where(Resource.user_id == user_id)
+                ).scalar()
+                db.session.rollback()
+
+            steps[size] = {'counter_us': _time(counter, args.samples), 'sum_us': _time(summed, args.samples)}
+
+    emit({
+        'benchmark': 'quota',
+        'git_revision': git_revision(),
+        'params': vars(args),
+        # Median microseconds per upload check, by resources in the library
+        'steps': steps,
+    }, args.output)
+
+
+if __name__ == "__main__":
+    main()
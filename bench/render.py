@@ -0,0 +1,103 @@
+"""Render time of the dashboard and topic pages, with and without fragment caching.
+
+For each variant, measures warm requests to /dashboard and /topic/<id>
+through the test client, plus the "edited" case where a note is added
+before each topic request so its content fragment has to be rendered
+again. Separately times app start-up and the first render with an
+empty and with a populated template bytecode cache.
+
+    python -m bench.render --requests 300 --notes 200
+"""
+import argparse
+import tempfile
+import time
+from .common import emit, make_app, percentiles
+from .run import TestClientDriver, git_revision
+from .seed import seed
+
+VARIANTS = {
+    'no_fragment_cache': {'FRAGMENT_CACHE_ENABLED': False},
+    'fragment_cache': {'FRAGMENT_CACHE_ENABLED': True},
+}
+
+
+def _time(driver, method, path, requests, before=None, body=None):
+    latencies = []
+    for i in range(requests):
+        if before:
+            before(i)
+        began = time.perf_counter()
+        status = driver.request(method, path, *(body or ()))
+        latencies.append((time.perf_counter() - began) * 1000)
+        assert status < 400, f"{path} returned {status}"
+    return percentiles(latencies)
+
+
+def run_variant(settings, args):
+    app = make_app(JOBS_MODE='thread', JOBS_WORKERS=0, TEMPLATE_BYTECODE_CACHE_DIR=None, **settings)
+    dataset = seed(app, users=1, topics=args.topics, subtopics=args.subtopics, resources=args.resources,
+                   notes=args.notes, flashcards=args.flashcards)
+    user_id, email = dataset['users'][0]
+    topic_id = dataset['topics'][user_id][0]
+    driver = TestClientDriver(app, email)
+    instrumentation = app.extensions['instrumentation']
+
+    results = {}
+    for name, path in (('dashboard', '/dashboard'), ('view_topic', f'/topic/{topic_id}')):
+        for _ in range(args.warmup):
+            driver.request('GET', path)
+        instrumentation.reset()
+        results[name] = {'latency_ms': _time(driver, 'GET', path, args.requests)}
+        stats = instrumentation.snapshot().get('dashboard' if name == 'dashboard' else 'topic.view_topic')
+        if stats and stats.sql_count.count:
+            results[name]['sql_queries_per_request'] = round(stats.sql_count.total / stats.sql_count.count, 2)
+
+    def add_note(i):
+        driver.request('POST', f'/note/{topic_id}/note',
+                       f'{{"title": "Edit {i}", "content": "Edited between renders"}}'.encode(), 'application/json')
+
+    results['view_topic_after_edit'] = {
+        'latency_ms': _time(driver, 'GET', f'/topic/{topic_id}', args.requests // 4 or 1, before=add_note)
+    }
+    return results
+
+
+def startup(args):
+    """App start-up (with template precompilation) and first render, cold and warm bytecode cache"""
+    bytecode_dir = tempfile.mkdtemp(prefix="studymate-jinja-")
+    results = {}
+    for name in ('empty_bytecode_cache', 'populated_bytecode_cache'):
+        began = time.perf_counter()
+        app = make_app(TEMPLATE_BYTECODE_CACHE_DIR=bytecode_dir, JOBS_MODE='thread', JOBS_WORKERS=0)
+        results[name] = {'create_app_ms': round((time.perf_counter() - began) * 1000, 1)}
+
+    began = time.perf_counter()
+    make_app(TEMPLATE_BYTECODE_CACHE_DIR=None, TEMPLATE_PRECOMPILE=False, JOBS_MODE='thread', JOBS_WORKERS=0)
+    results['no_precompile'] = {'create_app_ms': round((time.perf_counter() - began) * 1000, 1)}
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--topics", type=int, default=10)
+    parser.add_argument("--subtopics", type=int, default=5)
+    parser.add_argument("--resources", type=int, default=50)
+    parser.add_argument("--notes", type=int, default=200)
+    parser.add_argument("--flashcards", type=int, default=20)
+    parser.add_argument("--variants", default=",".join(VARIANTS))
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    emit({
+        'benchmark': 'render',
+        'git_revision': git_revision(),
+        'params': vars(args),
+        'results': {name: run_variant(VARIANTS[name], args) for name in args.variants.split(",")},
+        'startup': startup(args),
+    }, args.output)
+
+
+if __name__ == "__main__":
+    main()
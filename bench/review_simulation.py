@@ -0,0 +1,98 @@
+"""Replay a year of spaced-repetition reviews for one heavy user.
+
+Measures how long fetching the next due batch takes as the deck ages, to
+check that it stays flat thanks to the (user_id, next_review_at) index.
+
+    python -m bench.review_simulation --cards 20000 --days 365
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import insert
+from app.extensions import db
+from app.models import Flashcard, Topic, User
+from app.review import due_cards, grade_cards
+from .common import emit, make_app, percentiles
+
+
+def seed(user_count, cards, start):
+    users = [User(username=f"user{i}", email=f"user{i}@example.com", password="x") for i in range(user_count)]
+    db.session.add_all(users)
+    db.session.flush()
+    topics = [Topic(name="Deck", user_id=user.id) for user in users]
+    db.session.add_all(topics)
+    db.session.flush()
+
+    for user, topic in zip(users, topics):
+        rows = [
+            {
+                'question': f"Question {i}",
+                'answer': f"Answer {i}",
+                'user_id': user.id,
+                'topic_id': topic.id,
+                'next_review_at': start + timedelta(minutes=i % 1440),
+            }
+            for i in range(cards)
+        ]
+        db.session.execute(insert(Flashcard), rows)
+    db.session.commit()
+    return users[0].id
+
+
+def simulate(user_id, days, daily_limit, batch, start, rng):
+    fetch_ms = {}
+    reviews = 0
+    for day in range(days):
+        now = start + timedelta(days=day, hours=12)
+        done_today = 0
+        samples = fetch_ms.setdefault(day // 30, [])
+        while done_today < daily_limit:
+            began = time.perf_counter()
+            cards = due_cards(user_id, now, batch)
+            samples.append((time.perf_counter() - began) * 1000)
+            if not cards:
+                break
+            # Recall gets more reliable as a card matures
+            grades = {
+                card.id: 5 if rng.random() < min(0.95, 0.6 + card.repetitions * 0.1) else rng.choice((1, 2, 3))
+                for card in cards
+            }
+            grade_cards(user_id, grades, now)
+            done_today += len(cards)
+        reviews += done_today
+    return reviews, fetch_ms
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cards", type=int, default=20000, help="cards per user")
+    parser.add_argument("--users", type=int, default=5, help="users sharing the table")
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--daily-limit", type=int, default=300, help="reviews per day")
+    parser.add_argument("--batch", type=int, default=50, help="cards fetched per /review/next call")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    app = make_app()
+    start = datetime(2025, 1, 1)
+    with app.app_context():
+        user_id = seed(args.users, args.cards, start)
+        began = time.perf_counter()
+        reviews, fetch_ms = simulate(user_id, args.days, args.daily_limit, args.batch, start, random.Random(args.seed))
+        elapsed = time.perf_counter() - began
+
+    emit({
+        'benchmark': 'review_simulation',
+        'params': vars(args),
+        'reviews': reviews,
+        'elapsed_s': round(elapsed, 3),
+        'reviews_per_s': round(reviews / elapsed, 1) if elapsed else None,
+        # Latency of the due-queue fetch, per 30-day window
+        'fetch_next_ms_by_month': {str(month): percentiles(samples) for month, samples in sorted(fetch_ms.items())},
+    }, args.output)
+
+
+if __name__ == "__main__":
+    main()
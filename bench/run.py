@@ -0,0 +1,257 @@
+"""End-to-end benchmark of the main StudyMate endpoints.
+
+Seeds a fresh dataset, then drives each scenario through the Flask test
+client and through a local threaded WSGI server, and prints throughput
+and latency percentiles as JSON so runs can be compared between commits.
+
+    python -m bench.run --requests 200 --output bench_output.json
+"""
+import argparse
+import http.client
+import json
+import platform
+import subprocess
+import threading
+import time
+import uuid
+from http.cookies import SimpleCookie
+from werkzeug.serving import make_server
+from .common import emit, make_app, percentiles
+from .seed import PASSWORD, sample_pdf, seed
+
+
+class Scenario:
+    """One request shape, parameterised by the request number"""
+
+    def __init__(self, name, endpoint, method, path, body=None, content_type=None):
+        self.name = name
+        self.endpoint = endpoint
+        self.method = method
+        self.path = path
+        self.body = body
+        self.content_type = content_type
+
+
+def _multipart(fields, files):
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+        )
+    for name, (filename, content) in files.items():
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+            f'Content-Type: application/pdf\r\n\r\n'.encode() + content + b"\r\n"
+        )
+    parts.append(f"--{boundary}--\r\n".encode())
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+
+def build_scenarios(topic_ids, pdf_resource_id):
+    topic_id = topic_ids[0]
+    pdf = sample_pdf()
+
+    def upload_body(i):
+        # Vary the content so each upload is a new blob
+        return _multipart(
+            {'title': f'Upload {i}', 'resource_type': 'pdf'},
+            {'file': (f'upload{i}.pdf', pdf + f"% {i}\n".encode())},
+        )
+
+    return [
+        Scenario("dashboard", "dashboard", "GET", lambda i: "/dashboard"),
+        Scenario("view_topic", "topic.view_topic", "GET",
+                 lambda i: f"/topic/{topic_ids[i % len(topic_ids)]}"),
+        Scenario("save_note", "note.save_note", "POST", lambda i: f"/note/{topic_id}/note",
+                 body=lambda i: (json.dumps({'title': f'Note {i}', 'content': 'Benchmark note. ' * 50}).encode(),
+                                 "application/json")),
+        Scenario("create_resource", "resource.create_resource", "POST",
+                 lambda i: f"/resource/{topic_id}/create", body=upload_body),
+        Scenario("download_resource", "resource.download_resource", "GET",
+                 lambda i: f"/resource/{pdf_resource_id}/download"),
+    ]
+
+
+class TestClientDriver:
+    name = "test_client"
+
+    def __init__(self, app, email):
+        self.client = app.test_client()
+        response = self.client.post("/auth/login", data={'email': email, 'password': PASSWORD})
+        assert response.status_code == 302, "benchmark login failed"
+
+    def request(self, method, path, body=None, content_type=None):
+        response = self.client.open(path, method=method, data=body, content_type=content_type)
+        response.close()
+        return response.status_code
+
+
+class WSGIServerDriver:
+    name = "wsgi_server"
+
+    def __init__(self, app, email):
+        self.server = make_server("127.0.0.1", 0, app, threaded=True)
+        self.port = self.server.server_port
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.local = threading.local()
+
+        body = f"email={email}&password={PASSWORD}".encode()
+        connection = http.client.HTTPConnection("127.0.0.1", self.port)
+        connection.request("POST", "/auth/login", body, {'Content-Type': 'application/x-www-form-urlencoded'})
+        response = connection.getresponse()
+        response.read()
+        assert response.status == 302, "benchmark login failed"
+        cookie = SimpleCookie(response.getheader("Set-Cookie"))
+        self.cookie = "; ".join(f"{k}={v.value}" for k, v in cookie.items())
+        connection.close()
+
+    def request(self, method, path, body=None, content_type=None):
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = self.local.connection = http.client.HTTPConnection("127.0.0.1", self.port)
+        headers = {'Cookie': self.cookie}
+        if content_type:
+            headers['Content-Type'] = content_type
+        connection.request(method, path, body, headers)
+        response = connection.getresponse()
+        response.read()
+        return response.status
+
+    def close(self):
+        self.server.shutdown()
+
+
+def run_scenario(app, driver, scenario, requests, concurrency, warmup):
+    instrumentation = app.extensions['instrumentation']
+
+    def call(i):
+        body, content_type = scenario.body(i) if scenario.body else (None, None)
+        began = time.perf_counter()
+        status = driver.request(scenario.method, scenario.path(i), body, content_type)
+        return (time.perf_counter() - began) * 1000, status
+
+    for i in range(warmup):
+        call(i)
+    instrumentation.reset()
+
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+    counter = iter(range(warmup, warmup + requests))
+
+    def worker():
+        nonlocal errors
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            elapsed, status = call(i)
+            with lock:
+                latencies.append(elapsed)
+                errors += status >= 400
+
+    began = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - began
+
+    result = {
+        'requests': requests,
+        'errors': errors,
+        'throughput_rps': round(requests / elapsed, 1),
+        'latency_ms': percentiles(latencies),
+    }
+    stats = instrumentation.snapshot().get(scenario.endpoint)
+    if stats and stats.sql_count.count:
+        result['sql_queries_per_request'] = round(stats.sql_count.total / stats.sql_count.count, 2)
+    return result
+
+
+def parse_overrides(items):
+    """KEY=VALUE pairs as config overrides; values are JSON where they parse as JSON"""
+    overrides = {}
+    for item in items:
+        key, _, value = item.partition("=")
+        try:
+            overrides[key] = json.loads(value)
+        except ValueError:
+            overrides[key] = value
+    return overrides
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=5)
+    parser.add_argument("--topics", type=int, default=10)
+    parser.add_argument("--subtopics", type=int, default=3)
+    parser.add_argument("--resources", type=int, default=20)
+    parser.add_argument("--notes", type=int, default=50)
+    parser.add_argument("--flashcards", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=200, help="measured requests per scenario")
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=4, help="client threads against the WSGI server")
+    parser.add_argument("--drivers", default="test_client,wsgi_server")
+    parser.add_argument("--scenarios", help="comma-separated subset of scenario names")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--config", action="append", default=[], metavar="KEY=VALUE",
+                        help="override an app setting, e.g. PRINCIPAL_CACHE_SIZE=0 (JSON values)")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    # Jobs stay queued so uploads measure only the request path
+    app = make_app(JOBS_MODE='thread', JOBS_WORKERS=0, **parse_overrides(args.config))
+    dataset = seed(app, args.users, args.topics, args.subtopics, args.resources,
+                   args.notes, args.flashcards, seed_value=args.seed)
+    user_id, email = dataset['users'][0]
+    topic_ids = dataset['topics'][user_id]
+
+    with app.app_context():
+        from app.models import Resource
+        pdf_resource_id = Resource.query.filter_by(user_id=user_id, resource_type='pdf').first().id
+
+    scenarios = build_scenarios(topic_ids, pdf_resource_id)
+    if args.scenarios:
+        wanted = set(args.scenarios.split(","))
+        scenarios = [s for s in scenarios if s.name in wanted]
+
+    results = {}
+    for driver_name in args.drivers.split(","):
+        if driver_name == "test_client":
+            driver, concurrency = TestClientDriver(app, email), 1
+        elif driver_name == "wsgi_server":
+            driver, concurrency = WSGIServerDriver(app, email), args.concurrency
+        else:
+            parser.error(f"unknown driver {driver_name}")
+
+        results[driver_name] = {
+            scenario.name: run_scenario(app, driver, scenario, args.requests, concurrency, args.warmup)
+            for scenario in scenarios
+        }
+        if hasattr(driver, "close"):
+            driver.close()
+
+    emit({
+        'benchmark': 'endpoints',
+        'git_revision': git_revision(),
+        'python': platform.python_version(),
+        'params': vars(args),
+        'results': results,
+    }, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""Faker-driven dataset builder for benchmarks.
+
+    python -m bench.seed --users 10 --topics 20 --notes 50
+"""
+import argparse
+import hashlib
+import io
+import os
+import random
+from datetime import datetime, timedelta
+from faker import Faker
+from pypdf import PdfWriter
+from sqlalchemy import insert, select, update
+from werkzeug.security import generate_password_hash
+from app.blobstore import blob_path
+from app.extensions import db
+from app.models import Blob, Flashcard, Note, Resource, Topic, User
+from app.search import fts_available, rebuild_index
+from .common import emit, make_app
+
+PASSWORD = "benchmark-password"
+
+
+def sample_pdf(pages=3):
+    writer = PdfWriter()
+    for _ in range(pages):
+        writer.add_blank_page(612, 792)
+    out = io.BytesIO()
+    writer.write(out)
+    return out.getvalue()
+
+
+def _store_blob(upload_folder, content):
+    sha256 = hashlib.sha256(content).hexdigest()
+    path = os.path.join(upload_folder, blob_path(sha256))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(content)
+    return sha256
+
+
+def seed(app, users=5, topics=10, subtopics=3, resources=10, notes=20, flashcards=50, pdfs=1, seed_value=1):
+    """Populate the app's database; returns {'users': [(id, email)], 'topics': {user_id: [topic ids]}}.
+
+    Counts are per user (topics), per topic (subtopics) and per root topic
+    (resources, notes, flashcards). Every user shares one password, PASSWORD.
+    """
+    fake = Faker()
+    Faker.seed(seed_value)
+    rng = random.Random(seed_value)
+    now = datetime.utcnow()
+    # One hash for everyone: hashing is deliberately slow
+    password = generate_password_hash(PASSWORD, method=app.config['PASSWORD_HASH_METHOD'])
+
+    with app.app_context():
+        pdf = sample_pdf()
+        sha256 = _store_blob(app.config['UPLOAD_FOLDER'], pdf)
+        db.session.add(Blob(sha256=sha256, size=len(pdf), ref_count=0))
+
+        user_rows = [
+            {'username': fake.user_name(), 'email': f"bench{i}@example.com", 'password': password}
+            for i in range(users)
+        ]
+        db.session.execute(insert(User), user_rows)
+        user_ids = db.session.execute(select(User.id, User.email).order_by(User.id)).all()
+
+        topic_ids = {}
+        pdf_refs = 0
+        for user_id, _ in user_ids:
+            roots = db.session.execute(
+                insert(Topic).returning(Topic.id, sort_by_parameter_order=True),
+                [
+                    {
+                        'name': fake.catch_phrase()[:120],
+                        'description': fake.paragraph(),
+                        'user_id': user_id,
+                        'created_at': now - timedelta(minutes=t),
+                        'updated_at': now,
+                    }
+                    for t in range(topics)
+                ],
+            ).scalars().all()
+            topic_ids[user_id] = roots
+
+            child_rows = [
+                {'name': fake.bs()[:120], 'description': fake.sentence(), 'user_id': user_id,
+                 'parent_topic_id': root, 'created_at': now, 'updated_at': now}
+                for root in roots for _ in range(subtopics)
+            ]
+            if child_rows:
+                db.session.execute(insert(Topic), child_rows)
+
+            resource_rows, note_rows, card_rows = [], [], []
+            for root in roots:
+                for r in range(resources):
+                    if r < pdfs:
+                        resource_rows.append({
+                            'title': fake.sentence(nb_words=4), 'resource_type': 'pdf',
+                            'url': None, 'file_path': blob_path(sha256), 'file_size': len(pdf),
+                            'original_filename': 'textbook.pdf', 'content_hash': sha256,
+                            'user_id': user_id, 'topic_id': root, 'status': 'active',
+                        })
+                        pdf_refs += 1
+                    else:
+                        resource_rows.append({
+                            'title': fake.sentence(nb_words=4), 'resource_type': 'link',
+                            'url': fake.url(), 'file_path': None, 'file_size': None,
+                            'original_filename': None, 'content_hash': None,
+                            'user_id': user_id, 'topic_id': root, 'status': 'active',
+                        })
+                note_rows += [
+                    {'title': fake.sentence(nb_words=5)[:200], 'content': "\n\n".join(fake.paragraphs(nb=rng.randint(2, 8))),
+                     'user_id': user_id, 'topic_id': root}
+                    for _ in range(notes)
+                ]
+                card_rows += [
+                    {'question': fake.sentence() + "?", 'answer': fake.sentence(), 'user_id': user_id, 'topic_id': root,
+                     'next_review_at': now + timedelta(hours=rng.randint(-72, 72))}
+                    for _ in range(flashcards)
+                ]
+
+            for model, rows in ((Resource, resource_rows), (Note, note_rows), (Flashcard, card_rows)):
+                if rows:
+                    db.session.execute(insert(model), rows)
+
+        db.session.execute(update(Blob).where(Blob.sha256 == sha256).values(ref_count=pdf_refs))
+
+        # Bulk inserts bypass the ORM events that feed the search index
+        connection = db.session.connection()
+        if fts_available(connection):
+            rebuild_index(connection)
+        db.session.commit()
+
+    return {'users': [tuple(row) for row in user_ids], 'topics': topic_ids}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--data-dir", help="keep the database and uploads here")
+    parser.add_argument("--users", type=int, default=5)
+    parser.add_argument("--topics", type=int, default=10, help="root topics per user")
+    parser.add_argument("--subtopics", type=int, default=3, help="subtopics per root topic")
+    parser.add_argument("--resources", type=int, default=10, help="resources per root topic")
+    parser.add_argument("--notes", type=int, default=20, help="notes per root topic")
+    parser.add_argument("--flashcards", type=int, default=50, help="flashcards per root topic")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    app = make_app(args.data_dir)
+    result = seed(app, args.users, args.topics, args.subtopics, args.resources,
+                  args.notes, args.flashcards, seed_value=args.seed)
+    emit({'database': app.config['SQLALCHEMY_DATABASE_URI'], 'users': len(result['users'])})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""Storage backends: transfer timings for the S3 driver.
+
+Times one large upload through the S3 driver (storage.py) with different
+numbers of parts in flight, and a local-to-S3 migration of many small
+files with different numbers of copy workers. The contract both drivers
+honour is checked in tests/test_storage.py.
+
+S3 is any S3-compatible endpoint given with --endpoint (MinIO, say) and
+an existing --bucket, with credentials from the usual AWS variables.
+Without --endpoint an in-process moto server stands in, if moto is
+installed; it runs on this machine, so its timings show the overhead of
+each variant rather than what a real network gives. --rtt-ms adds a
+delay before every S3 request to stand in for the network round trip.
+
+    python -m bench.storage --endpoint http://localhost:9000 --bucket studymate
+"""
+import argparse
+import io
+import os
+import time
+import uuid
+from app import storage
+from .common import emit, make_app
+from .run import git_revision
+
+MB = 1024 * 1024
+
+
+def start_stand_in(bucket):
+    """An in-process moto S3 server; returns (endpoint, stop)"""
+    import boto3
+    from moto.server import ThreadedMotoServer
+
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "bench")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "bench")
+    server = ThreadedMotoServer(port=0, verbose=False)
+    server.start()
+    host, port = server.get_host_and_port()
+    endpoint = f"http://{host}:{port}"
+    boto3.client("s3", endpoint_url=endpoint, region_name="us-east-1").create_bucket(Bucket=bucket)
+    return endpoint, server.stop
+
+
+def s3_driver(app, rtt):
+    driver = storage.make_storage(app, 's3')
+    if rtt:
+        driver.client.meta.events.register("before-send.s3", lambda **kwargs: time.sleep(rtt))
+    return driver
+
+
+def time_upload(app, rtt, size, concurrency):
+    """Seconds to store one file of size bytes with this many parts in flight"""
+    app.config['S3_MAX_CONCURRENCY'] = concurrency
+    driver = s3_driver(app, rtt)
+    key = f"blobs/bench/upload-{concurrency}-{uuid.uuid4().hex}"
+    source = io.BytesIO(os.urandom(size))
+    began = time.perf_counter()
+    driver.save_stream(key, source)
+    elapsed = time.perf_counter() - began
+    driver.delete(key)
+    return elapsed
+
+
+def time_migration(app, rtt, files, file_size, workers):
+    source = storage.make_storage(app, 'local')
+    target = s3_driver(app, rtt)
+    target.prefix = f"{target.prefix}migration-{workers}/"
+    keys = [f"blobs/migrate/{n}" for n in range(files)]
+    for key in keys:
+        if not source.exists(key):
+            source.save_stream(key, io.BytesIO(os.urandom(file_size)))
+    began = time.perf_counter()
+    copied, skipped, failed = storage.copy_files(source, target, keys, workers=workers)
+    elapsed = time.perf_counter() - began
+    assert copied == files and not failed, (copied, skipped, failed)
+    # A second run finds everything in place
+    _, skipped, _ = storage.copy_files(source, target, keys, workers=workers)
+    return {'seconds': round(elapsed, 3), 'files_per_s': round(files / elapsed, 1), 'skipped_on_rerun': skipped}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--endpoint", help="S3-compatible endpoint; default an in-process moto server")
+    parser.add_argument("--bucket", default="studymate-bench")
+    parser.add_argument("--upload-mb", type=int, default=64, help="size of the timed upload")
+    parser.add_argument("--part-mb", type=int, default=8)
+    parser.add_argument("--concurrency", default="1,4,8", help="parts in flight per upload, per variant")
+    parser.add_argument("--files", type=int, default=200, help="files in the timed migration")
+    parser.add_argument("--file-kb", type=int, default=256)
+    parser.add_argument("--workers", default="1,8", help="copy workers, per variant")
+    parser.add_argument("--rtt-ms", type=float, default=0, help="delay added before every S3 request")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    stop = None
+    endpoint = args.endpoint
+    if endpoint is None:
+        endpoint, stop = start_stand_in(args.bucket)
+
+    app = make_app(
+        S3_BUCKET=args.bucket, S3_ENDPOINT_URL=endpoint, S3_REGION="us-east-1", S3_ADDRESSING_STYLE="path",
+        S3_PREFIX=f"bench-{uuid.uuid4().hex[:8]}",
+        S3_MULTIPART_THRESHOLD=args.part_mb * MB, S3_MULTIPART_CHUNKSIZE=args.part_mb * MB,
+    )
+    try:
+        rtt = args.rtt_ms / 1000
+        with app.app_context():
+            upload = {
+                n: round(args.upload_mb / time_upload(app, rtt, args.upload_mb * MB, n), 1)
+                for n in map(int, args.concurrency.split(","))
+            }
+            migration = {n: time_migration(app, rtt, args.files, args.file_kb * 1024, n)
+                         for n in map(int, args.workers.split(","))}
+    finally:
+        if stop:
+            stop()
+
+    emit({
+        'benchmark': 'storage',
+        'git_revision': git_revision(),
+        'params': vars(args),
+        'endpoint': 'moto (in-process)' if args.endpoint is None else args.endpoint,
+        # MB/s for one upload, by parts in flight
+        'upload_mb_per_s': upload,
+        'migration': migration,
+    }, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""Subtree and ancestor reads on a deep topic tree: closure table against recursive CTEs.
+
+Builds --trees trees of --depth levels. Each tree is a spine of
+--depth topics with --fanout leaf subtopics on every spine topic, plus one
+note per spine topic; the defaults make 100,000 topics. For each level of
+the spine, times three reads with the closure table (topic_closure.py)
+and with the recursive CTE over parent_topic_id that it replaces:
+breadcrumbs (ancestors), descendant ids, and the notes anywhere under the
+topic. Also reports how long building the closure table took.
+
+    python -m bench.topic_depth --trees 1000 --depth 10 --fanout 9
+"""
+import argparse
+import random
+import statistics
+import time
+from datetime import datetime
+from sqlalchemy import insert, literal, select
+from app import topic_closure
+from app.extensions import db
+from app.models import Note, Topic, User
+from .common import emit, make_app
+from .run import git_revision
+
+
+def build(app, args):
+    """Insert the trees with Core statements; returns the spine ids, [tree][level]"""
+    now = datetime.now()
+    with app.app_context():
+        user_id = db.session.execute(insert(User).returning(User.id), [
+            {'username': "deep", 'email': "deep@bench.invalid", 'password': "x"}
+        ]).scalar()
+        next_id = 1
+        topics, notes, spines = [], [], []
+        for tree in range(args.trees):
+            spine, parent = [], None
+            for level in range(args.depth):
+                spine_id = next_id
+                next_id += 1
+                topics.append({'id': spine_id, 'name': f"T{tree} L{level}", 'user_id': user_id,
+                               'parent_topic_id': parent, 'created_at': now, 'updated_at': now})
+                notes.append({'title': f"Note {spine_id}", 'content': "x", 'user_id': user_id,
+                              'topic_id': spine_id, 'created_at': now, 'updated_at': now})
+                for leaf in range(args.fanout):
+                    topics.append({'id': next_id, 'name': f"T{tree} L{level} leaf {leaf}", 'user_id': user_id,
+                                   'parent_topic_id': spine_id, 'created_at': now, 'updated_at': now})
+                    next_id += 1
+                spine.append(spine_id)
+                parent = spine_id
+            spines.append(spine)
+        # Core inserts skip the mapper events; the closure is built below in one statement
+        db.session.execute(insert(Topic), topics)
+        db.session.execute(insert(Note), notes)
+        db.session.commit()
+
+        began = time.perf_counter()
+        with db.engine.begin() as connection:
+            topic_closure.rebuild(connection)
+        rebuild_s = time.perf_counter() - began
+        closure_rows = db.session.execute(select(db.func.count()).select_from(topic_closure._closure)).scalar()
+    return spines, len(topics), closure_rows, rebuild_s
+
+
+def _ancestors_cte(topic_id):
+    up = select(Topic.id, Topic.parent_topic_id, literal(0).label("depth")).where(Topic.id == topic_id)
+    up = up.cte("up", recursive=True)
+    up = up.union_all(select(Topic.id, Topic.parent_topic_id, up.c.depth + 1).where(Topic.id == up.c.parent_topic_id))
+    return select(up.c.id).where(up.c.depth > 0).order_by(up.c.depth.desc())
+
+
+def _descendants_cte(topic_id):
+    down = select(Topic.id).where(Topic.id == topic_id).cte("down", recursive=True)
+    down = down.union_all(select(Topic.id).where(Topic.parent_topic_id == down.c.id))
+    return select(down.c.id)
+
+
+READS = {
+    'ancestors': (
+        lambda topic_id: select(topic_closure._closure.c.ancestor_id)
+        .where(topic_closure._closure.c.descendant_id == topic_id, topic_closure._closure.c.depth > 0)
+        .order_by(topic_closure._closure.c.depth.desc()),
+        _ancestors_cte,
+    ),
+    'descendants': (
+        topic_closure.descendants,
+        _descendants_cte,
+    ),
+    'notes_under': (
+        lambda topic_id: select(Note.id).where(topic_closure.under(Note, topic_id)),
+        lambda topic_id: select(Note.id).where(Note.topic_id.in_(_descendants_cte(topic_id))),
+    ),
+}
+
+
+def _time(statement_for, topic_ids):
+    samples = []
+    for topic_id in topic_ids:
+        statement = statement_for(topic_id)
+        began = time.perf_counter()
+        db.session.execute(statement).all()
+        samples.append((time.perf_counter() - began) * 1e6)
+    return round(statistics.median(samples), 1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--trees", type=int, default=1000)
+    parser.add_argument("--depth", type=int, default=10)
+    parser.add_argument("--fanout", type=int, default=9)
+    parser.add_argument("--samples", type=int, default=200, help="topics timed per level")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    app = make_app(TEMPLATE_PRECOMPILE=False)
+    spines, topic_count, closure_rows, rebuild_s = build(app, args)
+    rng = random.Random(1)
+
+    levels = {}
+    with app.app_context():
+        for level in range(args.depth):
+            topic_ids = [spine[level] for spine in rng.sample(spines, min(args.samples, len(spines)))]
+            levels[level + 1] = {
+                name: {'closure_us': _time(closure, topic_ids), 'recursive_cte_us': _time(cte, topic_ids)}
+                for name, (closure, cte) in READS.items()
+            }
+
+    emit({
+        'benchmark': 'topic_depth',
+        'git_revision': git_revision(),
+        'params': vars(args),
+        'topics': topic_count,
+        'closure_rows': closure_rows,
+        'closure_rebuild_s': round(rebuild_s, 3),
+        # Median microseconds per read, by the level of the topic read (1 = root)
+        'levels': levels,
+    }, args.output)
+
+
+if __name__ == "__main__":
+    main()
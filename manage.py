@@ -1,11 +1,164 @@
+import os
+import sys
+import tempfile
+import click
 from app import create_app
+from app.config import Config
 from app.extensions import db
-
-from app.models import User
+from app import blobstore, links, migrations, query_plans, quota, storage, topic_closure, topic_stats
 
 app = create_app()
 
-if __name__ == "__main__":
+
+@click.group(invoke_without_command=True)
+@click.pass_context
+def cli(ctx):
+    """Database management; with no command, creates or upgrades the schema"""
+    if ctx.invoked_subcommand is None:
+        ctx.invoke(migrate)
+
+
+@cli.command()
+def migrate():
+    """Create missing tables and apply pending migrations"""
+    with app.app_context():
+        ran = migrations.upgrade(db.engine)
+    for m in ran:
+        print(f"applied {m.version}: {m.description}")
+    print("database is up to date")
+
+
+@cli.command()
+def status():
+    """List migrations and whether they have been applied"""
     with app.app_context():
-        db.create_all()
-        print("database & table created")
\ No newline at end of file
+        waiting = {m.version for m in migrations.pending(db.engine)}
+    for m in migrations.MIGRATIONS:
+        print(f"{m.version:>4}  {'pending' if m.version in waiting else 'applied':8} {m.description}")
+
+
+@cli.command("check-plans")
+@click.option("--scratch", is_flag=True, help="Check a throwaway SQLite database built by the migrations")
+def check_plans(scratch):
+    """EXPLAIN each hot query; exits non-zero if any uses a full table scan"""
+    target = app
+    if scratch:
+        path = os.path.join(tempfile.mkdtemp(prefix="studymate-plans-"), "plans.db")
+        target = create_app(type("PlanConfig", (Config,), {'SQLALCHEMY_DATABASE_URI': f"sqlite:///{path}"}))
+
+    with target.app_context():
+        if scratch:
+            migrations.upgrade(db.engine)
+        report = query_plans.check_plans(db.engine)
+
+    failed = [name for name, (_, full_scan) in report.items() if full_scan]
+    for name, (lines, full_scan) in report.items():
+        print(f"{'FAIL' if full_scan else 'ok':4}  {name}")
+        for line in lines:
+            print(f"      {line}")
+    if failed:
+        print(f"{len(failed)} hot queries use a full table scan: {', '.join(failed)}")
+        sys.exit(1)
+
+
+@cli.command("gc-files")
+@click.option("--dry-run", is_flag=True, help="Report what would be removed without removing it")
+@click.option("--min-age", type=int, default=None, help="Seconds a file must be untouched (default ORPHAN_FILE_MIN_AGE)")
+def gc_files(dry_run, min_age):
+    """Remove uploaded files no resource references and fix blob reference counts"""
+    with app.app_context():
+        fixed, removed = blobstore.collect_garbage(
+            app.config['ORPHAN_FILE_MIN_AGE'] if min_age is None else min_age, dry_run=dry_run)
+    verb = "would remove" if dry_run else "removed"
+    for path in removed:
+        print(f"{verb} {path}")
+    print(f"{verb} {len(removed)} orphan files; {fixed} blob reference counts out of step")
+
+
+@cli.command("rebuild-stats")
+def rebuild_stats():
+    """Recompute the per-topic dashboard counters from scratch"""
+    with app.app_context(), db.engine.begin() as connection:
+        topic_stats.rebuild(connection)
+    print("topic counters rebuilt")
+
+
+@cli.command("rebuild-closure")
+def rebuild_closure():
+    """Recompute the topic closure table from the parent links"""
+    with app.app_context(), db.engine.begin() as connection:
+        topic_closure.rebuild(connection)
+    print("topic closure rebuilt")
+
+
+@cli.command("check-stats")
+def check_stats():
+    """Compare the per-topic counters with the tables they count; exits non-zero on a mismatch"""
+    with app.app_context(), db.engine.connect() as connection:
+        problems = topic_stats.check(connection)
+    for topic_id, stored, actual in problems:
+        print(f"topic {topic_id}: stored {stored}, actual {actual}")
+    if problems:
+        print(f"{len(problems)} topics out of step; run rebuild-stats")
+        sys.exit(1)
+    print("topic counters are consistent")
+
+
+@cli.command("reconcile-quota")
+@click.option("--dry-run", is_flag=True, help="Report what is out of step without fixing it")
+def reconcile_quota(dry_run):
+    """Recompute storage usage from the resource table and the stored files"""
+    with app.app_context(), db.engine.connect() as connection:
+        transaction = connection.begin()
+        resized, missing = quota.sync_file_sizes(connection)
+        problems = quota.check(connection)
+        if resized:
+            # bytes_uploaded on the dashboard cards sums the same sizes
+            topic_stats.rebuild(connection)
+        quota.rebuild(connection)
+        if dry_run:
+            transaction.rollback()
+        else:
+            transaction.commit()
+    for path in missing:
+        print(f"missing from storage: {path}")
+    for user_id, stored, actual in problems:
+        print(f"user {user_id}: stored {stored}, actual {actual}")
+    verb = "would fix" if dry_run else "fixed"
+    print(f"{verb} {resized} resource file sizes and {len(problems)} usage counters; {len(missing)} files missing")
+
+
+@cli.command("refresh-links")
+@click.option("--all", "everything", is_flag=True, help="Revalidate every link, not only the ones due")
+def refresh_links(everything):
+    """Fetch or revalidate link previews that are due; suitable for a cron job"""
+    with app.app_context():
+        if everything:
+            links.expire_all()
+        fetched = links.fetch_due()
+    print(f"fetched {fetched} links")
+
+
+@cli.command("migrate-storage")
+@click.option("--from", "source", default=None, help="Backend to copy from (default STORAGE_BACKEND)")
+@click.option("--to", "target", required=True, type=click.Choice(["local", "s3"]), help="Backend to copy to")
+@click.option("--workers", type=int, default=8, help="Files copied at once")
+@click.option("--overwrite", is_flag=True, help="Copy files the target already has")
+def migrate_storage(source, target, workers, overwrite):
+    """Copy every stored file to another backend; switch STORAGE_BACKEND once it succeeds"""
+    source_storage = storage.make_storage(app, source)
+    target_storage = storage.make_storage(app, target)
+    if source_storage.name == target_storage.name:
+        print("source and target are the same backend")
+        sys.exit(1)
+    keys = [key for key, _ in source_storage.keys() if not key.startswith(storage.TMP_DIR + os.sep)]
+    copied, skipped, failed = storage.copy_files(source_storage, target_storage, keys, workers, overwrite)
+    for key, error in failed:
+        print(f"failed {key}: {error}")
+    print(f"copied {copied} files, {skipped} already present, {len(failed)} failed")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,48 @@
+import pytest
+from app import create_app
+from app.config import Config
+from app.extensions import db
+from .helpers import add_user, login
+
+
+@pytest.fixture
+def make_app(tmp_path_factory):
+    """Factory for apps, each on its own throwaway SQLite database and upload folder"""
+    def factory(**overrides):
+        data_dir = tmp_path_factory.mktemp("app")
+        settings = {
+            'TESTING': True,
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{data_dir / 'test.db'}",
+            'UPLOAD_FOLDER': str(data_dir / 'uploads'),
+            'JOBS_MODE': 'sync',
+            'HASH_MODE': 'inline',
+            'LOGIN_IP_BURST': 1000,
+            'TEMPLATE_PRECOMPILE': False,
+            'TEMPLATE_BYTECODE_CACHE_DIR': None,
+        }
+        settings.update(overrides)
+        app = create_app(type("TestConfig", (Config,), settings))
+        with app.app_context():
+            db.create_all()
+        return app
+    return factory
+
+
+@pytest.fixture
+def app(make_app):
+    return make_app()
+
+
+@pytest.fixture
+def user_id(app):
+    return add_user(app)
+
+
+@pytest.fixture
+def client(app, user_id):
+    """A test client signed in as the user_id user"""
+    client = app.test_client()
+    login(client)
+    return client
+
+
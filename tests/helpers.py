@@ -0,0 +1,66 @@
+"""Shared helpers for the tests"""
+import io
+from pypdf import PdfWriter
+from sqlalchemy import event
+from werkzeug.security import generate_password_hash
+from app.extensions import db
+from app.models import Resource, Topic, User
+
+PASSWORD = "secret1"
+
+
+def add_user(app, email="alice@example.com"):
+    with app.app_context():
+        user = User(username=email.split("@")[0], email=email,
+                    password=generate_password_hash(PASSWORD, method="pbkdf2:sha256:1000"))
+        db.session.add(user)
+        db.session.commit()
+        return user.id
+
+
+def add_topic(app, user_id, name="Topic", parent_id=None):
+    with app.app_context():
+        topic = Topic(name=name, user_id=user_id, parent_topic_id=parent_id)
+        db.session.add(topic)
+        db.session.commit()
+        return topic.id
+
+
+def login(client, email="alice@example.com"):
+    response = client.post("/auth/login", data={'email': email, 'password': PASSWORD})
+    assert response.status_code == 302, response.data[:300]
+
+
+def pdf_bytes(pages=2, title="Test"):
+    """A small valid PDF; the title changes its content"""
+    writer = PdfWriter()
+    for _ in range(pages):
+        writer.add_blank_page(200, 200)
+    writer.add_metadata({'/Title': title})
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+
+def upload_pdf(client, topic_id, data, title="Notes", filename="notes.pdf"):
+    """Create a PDF resource through the form; returns its id"""
+    response = client.post(f"/resource/{topic_id}/create", data={
+        'title': title, 'resource_type': "pdf", 'file': (io.BytesIO(data), filename),
+    }, content_type="multipart/form-data")
+    assert response.status_code == 302, response.data[:300]
+    with client.application.app_context():
+        return db.session.execute(
+            db.select(Resource.id).where(Resource.title == title).order_by(Resource.id.desc())
+        ).scalar()
+
+
+class StatementCounter:
+    """Counts the SQL statements the app's engine executes"""
+
+    def __init__(self, app):
+        self.count = 0
+        with app.app_context():
+            event.listen(db.engine, "before_cursor_execute", self._executed)
+
+    def _executed(self, *args, **kwargs):
+        self.count += 1
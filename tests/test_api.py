@@ -0,0 +1,32 @@
+from sqlalchemy import update
+from app import migrations
+from app.extensions import db
+from app.models import Topic
+from .helpers import add_topic
+
+
+def _all_pages(client, url):
+    names, cursor = [], None
+    while True:
+        response = client.get(url + (f"&cursor={cursor}" if cursor else ""))
+        assert response.status_code == 200
+        names += [item['name'] for item in response.json['items']]
+        cursor = response.json['next_cursor']
+        if cursor is None:
+            return names
+
+
+def test_pages_cover_every_row_once(app, client, user_id):
+    for n in range(7):
+        add_topic(app, user_id, name=f"T{n}")
+    assert _all_pages(client, "/api/v1/topics?limit=3") == [f"T{n}" for n in reversed(range(7))]
+
+
+def test_topics_without_creation_time_are_listed_after_migration(app, client, user_id):
+    for n in range(5):
+        add_topic(app, user_id, name=f"T{n}")
+    with app.app_context():
+        db.session.execute(update(Topic).where(Topic.name.in_(["T1", "T3"])).values(created_at=None))
+        db.session.commit()
+        migrations.upgrade(db.engine)
+    assert sorted(_all_pages(client, "/api/v1/topics?limit=2")) == [f"T{n}" for n in range(5)]
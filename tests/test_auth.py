@@ -0,0 +1,116 @@
+import types
+import pytest
+from werkzeug.security import generate_password_hash
+from app import throttle
+from app.cache import LRUCache
+from app.extensions import db
+from app.models import User
+from .helpers import PASSWORD, add_user
+
+FAST_HASH = "pbkdf2:sha256:1000"
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(throttle, "time", types.SimpleNamespace(time=lambda: now[0]))
+    return now
+
+
+def test_bucket_allows_a_burst_then_refills(clock):
+    bucket = throttle.TokenBucket(LRUCache(), "test", burst=3, per_minute=6)
+    assert [bucket.consume("k") for _ in range(3)] == [0, 0, 0]
+    assert bucket.consume("k") == pytest.approx(10)
+    # Other keys have their own bucket
+    assert bucket.consume("other") == 0
+
+    clock[0] += 10
+    assert bucket.consume("k") == 0
+    assert bucket.consume("k") == pytest.approx(10)
+
+
+def test_bucket_with_no_burst_is_disabled():
+    bucket = throttle.TokenBucket(LRUCache(), "test", burst=0, per_minute=0)
+    assert all(bucket.consume("k") == 0 for _ in range(10))
+
+
+def _attempt(client, email="alice@example.com", ip="10.0.0.1", **headers):
+    return client.post("/auth/login", data={'email': email, 'password': "wrong"},
+                       environ_base={'REMOTE_ADDR': ip}, headers=headers)
+
+
+def test_login_is_throttled_per_ip(make_app, clock):
+    app = make_app(LOGIN_IP_BURST=3, LOGIN_IP_PER_MINUTE=6, LOGIN_EMAIL_BURST=0)
+    client = app.test_client()
+    for n in range(3):
+        assert _attempt(client, f"user{n}@example.com").status_code == 200
+    response = _attempt(client, "user9@example.com")
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == "10"
+    assert _attempt(client, "user9@example.com", ip="10.0.0.2").status_code == 200
+
+
+def test_login_is_throttled_per_account(make_app, clock):
+    app = make_app(LOGIN_IP_BURST=0, LOGIN_EMAIL_BURST=2, LOGIN_EMAIL_PER_MINUTE=2)
+    client = app.test_client()
+    assert _attempt(client, ip="10.0.0.1").status_code == 200
+    assert _attempt(client, ip="10.0.0.2").status_code == 200
+    response = _attempt(client, "Alice@Example.com", ip="10.0.0.3")
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == "30"
+    assert _attempt(client, "bob@example.com", ip="10.0.0.3").status_code == 200
+
+
+def test_forwarded_clients_get_their_own_bucket_behind_a_trusted_proxy(make_app, clock):
+    app = make_app(LOGIN_IP_BURST=1, LOGIN_IP_PER_MINUTE=1, LOGIN_EMAIL_BURST=0, PROXY_FIX_HOPS=1)
+    client = app.test_client()
+    proxy = "10.0.0.1"
+    assert _attempt(client, ip=proxy, **{'X-Forwarded-For': "203.0.113.1"}).status_code == 200
+    assert _attempt(client, ip=proxy, **{'X-Forwarded-For': "203.0.113.2"}).status_code == 200
+    assert _attempt(client, ip=proxy, **{'X-Forwarded-For': "203.0.113.1"}).status_code == 429
+
+
+def test_forwarded_header_is_ignored_without_a_trusted_proxy(make_app, clock):
+    app = make_app(LOGIN_IP_BURST=1, LOGIN_IP_PER_MINUTE=1, LOGIN_EMAIL_BURST=0)
+    client = app.test_client()
+    assert _attempt(client, **{'X-Forwarded-For': "203.0.113.1"}).status_code == 200
+    # A client cannot get a fresh bucket by making up the header
+    assert _attempt(client, **{'X-Forwarded-For': "203.0.113.2"}).status_code == 429
+
+
+@pytest.fixture
+def pooled_app(make_app):
+    """Hashes run in the worker process pool, as in production"""
+    app = make_app(HASH_MODE="process", HASH_WORKERS=1, PASSWORD_HASH_METHOD=FAST_HASH)
+    yield app
+    app.extensions['hashing'].shutdown()
+
+
+def test_register_and_login_hash_in_the_process_pool(pooled_app):
+    client = pooled_app.test_client()
+    response = client.post("/auth/register", data={
+        'username': "alice", 'email': "alice@example.com", 'password': PASSWORD, 'confirm_password': PASSWORD,
+    })
+    assert response.status_code == 302
+    with pooled_app.app_context():
+        assert db.session.execute(db.select(User.password)).scalar().startswith(FAST_HASH + "$")
+    assert client.post("/auth/login", data={'email': "alice@example.com", 'password': PASSWORD}).status_code == 302
+
+
+def test_login_upgrades_an_old_hash(pooled_app):
+    user_id = add_user(pooled_app)
+    with pooled_app.app_context():
+        db.session.get(User, user_id).password = generate_password_hash(PASSWORD, method="pbkdf2:sha256:500")
+        db.session.commit()
+    client = pooled_app.test_client()
+    assert client.post("/auth/login", data={'email': "alice@example.com", 'password': PASSWORD}).status_code == 302
+    with pooled_app.app_context():
+        assert db.session.get(User, user_id).password.startswith(FAST_HASH + "$")
+
+
+def test_login_answers_503_when_the_hash_queue_is_full(make_app):
+    app = make_app(HASH_MODE="process", HASH_QUEUE_LIMIT=0)
+    add_user(app)
+    response = app.test_client().post("/auth/login", data={'email': "alice@example.com", 'password': PASSWORD})
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == "5"
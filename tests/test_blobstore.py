@@ -0,0 +1,105 @@
+import io
+import os
+from sqlalchemy import delete, select
+from app import blobstore
+from app.extensions import db
+from app.models import Blob, Resource
+from app.storage import get_storage
+from .helpers import add_topic, pdf_bytes, upload_pdf
+
+CONTENT = b"%PDF-1.4 blob store test\n" * 100
+
+
+class _Unseekable(io.RawIOBase):
+    def __init__(self, data):
+        self._source = io.BytesIO(data)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        chunk = self._source.read(len(buffer))
+        buffer[:len(chunk)] = chunk
+        return len(chunk)
+
+
+def _blob(sha256):
+    return db.session.get(Blob, sha256)
+
+
+def test_identical_content_is_stored_once(app):
+    with app.app_context():
+        key, sha256, size = blobstore.store_stream(io.BytesIO(CONTENT))
+        again, _, _ = blobstore.store_stream(_Unseekable(CONTENT))
+        db.session.commit()
+        assert key == again and size == len(CONTENT)
+        assert _blob(sha256).ref_count == 2
+        with get_storage().open(key) as stored:
+            assert stored.read() == CONTENT
+
+
+def test_last_release_removes_file_and_row(app):
+    with app.app_context():
+        key, sha256, _ = blobstore.store_stream(io.BytesIO(CONTENT))
+        db.session.commit()
+        blobstore.release(sha256)
+        db.session.commit()
+        db.session.expire_all()
+        assert _blob(sha256) is None
+        assert not get_storage().exists(key)
+
+
+def test_reference_taken_before_removal_keeps_file(app):
+    with app.app_context():
+        key, sha256, _ = blobstore.store_stream(io.BytesIO(CONTENT))
+        db.session.commit()
+        # Released, but the after-commit removal has not run yet
+        blobstore.release(sha256)
+        db.session.info.pop(blobstore._PENDING_KEY)
+        db.session.commit()
+        blobstore.store_stream(io.BytesIO(CONTENT))
+        db.session.commit()
+
+        blobstore._remove_files([key])
+        db.session.expire_all()
+        assert _blob(sha256).ref_count == 1
+        assert get_storage().exists(key)
+
+
+def test_file_removed_after_dedup_check_is_written_again(app, monkeypatch):
+    with app.app_context():
+        key, sha256, _ = blobstore.store_stream(io.BytesIO(CONTENT))
+        db.session.commit()
+        blobstore.release(sha256)
+        db.session.commit()
+        assert not get_storage().exists(key)
+
+        # The upload saw the row before the removal deleted it with the file
+        monkeypatch.setattr(blobstore, "_has_row", lambda sha256: True)
+        blobstore.store_stream(io.BytesIO(CONTENT))
+        db.session.commit()
+        assert _blob(sha256).ref_count == 1
+        assert os.path.getsize(get_storage().local_path(key)) == len(CONTENT)
+
+
+def test_garbage_collection_restores_missing_rows(app, client, user_id):
+    topic_id = add_topic(app, user_id)
+    data = pdf_bytes()
+    for title in ("First", "Second"):
+        upload_pdf(client, topic_id, data, title=title)
+    with app.app_context():
+        sha256 = db.session.execute(select(Resource.content_hash)).scalars().first()
+        db.session.execute(delete(Blob))
+        db.session.commit()
+
+        assert blobstore.collect_garbage(0, dry_run=True)[0] == 1
+        assert _blob(sha256) is None
+        assert blobstore.collect_garbage(0) == (1, [])
+        assert (_blob(sha256).ref_count, _blob(sha256).size) == (2, len(data))
+
+        # The restored count keeps the file while the other resource uses it
+        resource = db.session.execute(select(Resource).where(Resource.title == "First")).scalar()
+        blobstore.release_resource_file(resource)
+        db.session.delete(resource)
+        db.session.commit()
+        assert get_storage().exists(blobstore.blob_path(sha256))
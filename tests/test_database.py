@@ -0,0 +1,27 @@
+from app.database import normalise_url
+from app.extensions import db
+
+
+def _pragmas(app, *names):
+    with app.app_context(), db.engine.connect() as connection:
+        return {name: connection.exec_driver_sql(f"PRAGMA {name}").scalar() for name in names}
+
+
+def test_sqlite_connections_get_the_pragmas(app):
+    assert _pragmas(app, 'journal_mode', 'synchronous', 'busy_timeout', 'foreign_keys', 'cache_size') == {
+        'journal_mode': 'wal',
+        'synchronous': 1,  # NORMAL
+        'busy_timeout': 5000,
+        'foreign_keys': 1,
+        'cache_size': -64000,
+    }
+
+
+def test_pragmas_follow_the_config(make_app):
+    app = make_app(SQLITE_PRAGMAS={'busy_timeout': 250})
+    assert _pragmas(app, 'busy_timeout', 'foreign_keys') == {'busy_timeout': 250, 'foreign_keys': 0}
+
+
+def test_legacy_postgres_scheme_is_normalised():
+    assert normalise_url("postgres://u@h/db") == "postgresql://u@h/db"
+    assert normalise_url("sqlite:///x.db") == "sqlite:///x.db"
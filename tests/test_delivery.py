@@ -0,0 +1,81 @@
+import os
+import pytest
+from werkzeug.http import parse_options_header
+from .helpers import add_topic, pdf_bytes, upload_pdf
+
+
+@pytest.fixture
+def download(app, client, user_id):
+    """(URL, file contents) of an uploaded PDF"""
+    data = pdf_bytes(pages=5)
+    resource_id = upload_pdf(client, add_topic(app, user_id), data)
+    return f"/resource/{resource_id}/download", data
+
+
+def _served_file(app, response):
+    """The bytes the front-end server would send for an offloaded download"""
+    if 'X-Sendfile' in response.headers:
+        path = response.headers['X-Sendfile']
+    else:
+        prefix = app.config['DOWNLOAD_ACCEL_PREFIX'].rstrip('/') + '/'
+        location = response.headers['X-Accel-Redirect']
+        assert location.startswith(prefix)
+        path = os.path.join(app.config['UPLOAD_FOLDER'], location[len(prefix):])
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def test_range_returns_the_slice(client, download):
+    url, data = download
+    response = client.get(url, headers={'Range': "bytes=10-99"})
+    assert response.status_code == 206
+    assert response.data == data[10:100]
+    assert response.headers['Content-Range'] == f"bytes 10-99/{len(data)}"
+
+
+def test_suffix_range_returns_the_tail(client, download):
+    url, data = download
+    response = client.get(url, headers={'Range': "bytes=-100"})
+    assert response.status_code == 206
+    assert response.data == data[-100:]
+
+
+def test_unsatisfiable_range_is_416(client, download):
+    url, data = download
+    response = client.get(url, headers={'Range': f"bytes={len(data) + 10}-"})
+    assert response.status_code == 416
+    assert response.headers['Content-Range'] == f"bytes */{len(data)}"
+
+
+def test_if_range_with_stale_etag_sends_everything(client, download):
+    url, data = download
+    response = client.get(url, headers={'Range': "bytes=0-9", 'If-Range': '"stale"'})
+    assert response.status_code == 200
+    assert response.data == data
+
+
+def test_conditional_requests_are_304(client, download):
+    url, _ = download
+    first = client.get(url)
+    assert first.status_code == 200
+    etag, last_modified = first.headers['ETag'], first.headers['Last-Modified']
+
+    assert client.get(url, headers={'If-None-Match': etag}).status_code == 304
+    assert client.get(url, headers={'If-Modified-Since': last_modified}).status_code == 304
+    assert client.get(url, headers={'If-None-Match': '"other"'}).status_code == 200
+
+
+@pytest.mark.parametrize("mode", ["x-accel", "x-sendfile"])
+def test_offloaded_modes_serve_the_same_file(app, client, download, mode):
+    url, data = download
+    direct = client.get(url)
+    app.config['DOWNLOAD_MODE'] = mode
+    offloaded = client.get(url)
+
+    assert direct.data == data
+    assert offloaded.status_code == 200 and offloaded.data == b""
+    assert _served_file(app, offloaded) == direct.data
+    for header in ("Content-Type", "ETag", "Last-Modified"):
+        assert offloaded.headers[header] == direct.headers[header], header
+    assert (parse_options_header(offloaded.headers['Content-Disposition'])
+            == parse_options_header(direct.headers['Content-Disposition']))
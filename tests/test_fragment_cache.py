@@ -0,0 +1,74 @@
+import threading
+from app import fragment_cache
+from app.extensions import db
+from app.models import Note
+from .helpers import add_topic
+
+
+def _counting_template(app):
+    renders = []
+    app.jinja_env.globals['count_render'] = lambda: renders.append(1) or len(renders)
+    template = app.jinja_env.from_string(
+        '{% cache "test", fragment_scope("topic", 1) %}render {{ count_render() }}{% endcache %}'
+    )
+    return template, renders
+
+
+def test_fragment_is_cached_until_its_scope_is_invalidated(app):
+    template, _ = _counting_template(app)
+    with app.app_context():
+        assert [template.render() for _ in range(2)] == ["render 1", "render 1"]
+        fragment_cache.invalidate_fragments("topic", 1)
+        assert template.render() == "render 2"
+        # Other scopes leave it alone
+        fragment_cache.invalidate_fragments("topic", 2)
+        assert template.render() == "render 2"
+
+
+def test_disabled_cache_renders_every_time(make_app):
+    app = make_app(FRAGMENT_CACHE_ENABLED=False)
+    template, _ = _counting_template(app)
+    with app.app_context():
+        assert [template.render() for _ in range(2)] == ["render 1", "render 2"]
+
+
+def _add_note(app, user_id, topic_id, title):
+    with app.app_context():
+        note = Note(title=title, content="Body", user_id=user_id, topic_id=topic_id)
+        db.session.add(note)
+        db.session.commit()
+        return note.id
+
+
+def test_topic_page_shows_edited_notes(app, client, user_id):
+    topic_id = add_topic(app, user_id)
+    note_id = _add_note(app, user_id, topic_id, "First title")
+    assert "First title" in client.get(f"/topic/{topic_id}").get_data(as_text=True)
+
+    client.post(f"/note/{note_id}/update", json={'title': "Second title", 'content': "Body"})
+    page = client.get(f"/topic/{topic_id}").get_data(as_text=True)
+    assert "Second title" in page and "First title" not in page
+
+
+def test_savepoint_does_not_use_up_the_invalidation_after_commit(app, client, user_id):
+    topic_id = add_topic(app, user_id)
+    note_id = _add_note(app, user_id, topic_id, "First title")
+    with app.app_context():
+        db.session.get(Note, note_id).title = "Second title"
+        db.session.flush()
+        # As jobs.enqueue() or quota.charge() do in the same request
+        with db.session.begin_nested():
+            pass
+        # A concurrent request still sees the committed rows and caches them
+        pages = []
+
+        def view():
+            pages.append(client.get(f"/topic/{topic_id}").get_data(as_text=True))
+
+        request = threading.Thread(target=view)
+        request.start()
+        request.join()
+        assert "First title" in pages[0]
+        db.session.commit()
+    page = client.get(f"/topic/{topic_id}").get_data(as_text=True)
+    assert "Second title" in page and "First title" not in page
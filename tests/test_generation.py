@@ -0,0 +1,81 @@
+import threading
+import pytest
+from sqlalchemy import select
+from app import generation
+from app.extensions import db
+from app.models import GenerationCache
+
+
+class FakeProvider(generation.Provider):
+    """Answers with the prompt, or misbehaves as told"""
+    name = "fake"
+    model = "fake-1"
+
+    def __init__(self, drop=0, fail=None):
+        super().__init__({})
+        self.drop = drop
+        self.fail = fail
+
+    def generate(self, requests):
+        if self.fail:
+            raise self.fail
+        answers = [generation.Generation([{'question': r.prompt, 'answer': r.context}], 1, 1, 0) for r in requests]
+        return answers[:len(answers) - self.drop]
+
+
+def _request(n):
+    return generation.GenerationRequest(f"prompt {n}", f"context {n}", 1)
+
+
+def _submit_all(batcher, count):
+    return [batcher.submit(f"key {n}", _request(n))[0] for n in range(count)]
+
+
+def test_short_answer_fails_the_unanswered_requests():
+    batcher = generation.Batcher(FakeProvider(drop=1), max_batch=10, window=0.2)
+    futures = _submit_all(batcher, 3)
+    assert [future.result(timeout=5)[0].exercises[0]['question'] for future in futures[:2]] == ["prompt 0", "prompt 1"]
+    with pytest.raises(RuntimeError, match="returned 2 answers for 3 requests"):
+        futures[2].result(timeout=5)
+
+
+def test_every_request_is_resolved_when_the_batch_fails():
+    batcher = generation.Batcher(FakeProvider(fail=ValueError("model down")), max_batch=10, window=0.2)
+    futures = _submit_all(batcher, 3)
+    for future in futures:
+        with pytest.raises(ValueError, match="model down"):
+            future.result(timeout=5)
+    # Nothing is left in flight, so the next request is sent again
+    batcher.provider.fail = None
+    future, leader = batcher.submit("key 0", _request(0))
+    assert leader and future.result(timeout=5)[0].exercises
+
+
+def test_failing_result_hook_still_resolves_every_request():
+    def on_result(key, generation_, latency_ms):
+        raise OSError("disk full")
+
+    batcher = generation.Batcher(FakeProvider(), max_batch=10, window=0.2, on_result=on_result)
+    for future in _submit_all(batcher, 2):
+        with pytest.raises(OSError, match="disk full"):
+            future.result(timeout=5)
+
+
+def test_answer_is_cached_without_a_waiting_request(app):
+    batcher = app.extensions['generation']
+    stored = threading.Event()
+    store_answer = batcher.on_result
+
+    def on_result(*args):
+        store_answer(*args)
+        stored.set()
+
+    batcher.on_result = on_result
+    generation_request = _request(0)
+    with app.app_context():
+        key = generation.cache_key(batcher.provider, generation_request)
+    # Nobody reads the future, as when the leading request's client goes away
+    batcher.submit(key, generation_request)
+    assert stored.wait(timeout=10)
+    with app.app_context():
+        assert db.session.execute(select(GenerationCache.key)).scalars().all() == [key]
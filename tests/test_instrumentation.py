@@ -0,0 +1,43 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def _fresh_stats(app):
+    # One Instrumentation is shared by every app
+    app.extensions['instrumentation'].reset()
+
+
+def _exceptions_line(client, endpoint):
+    body = client.get("/metrics").get_data(as_text=True)
+    prefix = f'studymate_request_exceptions_total{{endpoint="{endpoint}"}} '
+    return next(line for line in body.splitlines() if line.startswith(prefix))
+
+
+def _boom():
+    raise RuntimeError("boom")
+
+
+@pytest.mark.parametrize("propagate", [False, True])
+def test_unhandled_exception_is_recorded(make_app, propagate):
+    app = make_app(PROPAGATE_EXCEPTIONS=propagate)
+    app.add_url_rule("/boom", "boom", _boom)
+    client = app.test_client()
+
+    if propagate:
+        with pytest.raises(RuntimeError):
+            client.get("/boom")
+    else:
+        assert client.get("/boom").status_code == 500
+
+    stats = app.extensions['instrumentation'].snapshot()['boom']
+    assert stats.duration.count == 1 and stats.exceptions == 1
+    assert _exceptions_line(client, "boom").endswith(" 1")
+
+
+def test_successful_request_is_recorded(app):
+    client = app.test_client()
+    response = client.get("/auth/login")
+    assert response.status_code == 200
+    stats = app.extensions['instrumentation'].snapshot()['auth.login']
+    assert stats.duration.count == 1 and stats.exceptions == 0
+    assert stats.response_size.quantile(1) == pytest.approx(response.content_length, rel=0.05)
@@ -0,0 +1,155 @@
+import asyncio
+import ipaddress
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import httpcore
+import pytest
+from sqlalchemy import func, select
+from app import links
+from app.extensions import db
+from app.models import LinkMetadata, Resource
+from .helpers import add_topic, add_user, login
+
+SETTINGS = links.FetchSettings(concurrency=4, per_host=2, timeout=5, max_bytes=65536,
+                               allow_private=False, user_agent="test")
+LOCAL = SETTINGS._replace(allow_private=True)
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+
+@pytest.fixture
+def server():
+    """A stand-in site on 127.0.0.1: ETag revalidation, /redirect/<n> chains and /to?url= redirects"""
+    requests = {'full': 0, 'not_modified': 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status, headers=(), body=b""):
+            self.send_response(status)
+            for name, value in headers:
+                self.send_header(name, value)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path.startswith("/redirect/"):
+                hops = int(self.path.rsplit("/", 1)[1])
+                location = f"/redirect/{hops - 1}" if hops > 1 else "/page"
+                return self._send(302, [("Location", location)])
+            if self.path.startswith("/to?url="):
+                return self._send(302, [("Location", self.path[len("/to?url="):])])
+            etag = '"v1"'
+            if self.headers.get("If-None-Match") == etag:
+                requests['not_modified'] += 1
+                return self._send(304, [("ETag", etag)])
+            requests['full'] += 1
+            body = (b'<html><head><title> Stand-in   page </title>'
+                    b'<meta name="description" content="About the page">'
+                    b'<link rel="icon" href="/icon.png"></head><body>...</body></html>')
+            self._send(200, [("Content-Type", "text/html; charset=utf-8"), ("ETag", etag)], body)
+
+    httpd = _Server(("127.0.0.1", 0), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    httpd.base_url = f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.requests = requests
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def _fetch(url, settings=SETTINGS, etag=None):
+    return asyncio.run(links.fetch_all([("hash", url, etag, None)], settings))[0]
+
+
+def test_normalize_url():
+    assert links.normalize_url("HTTP://Example.COM:80/a?b=2&utm_source=x&a=1#frag") == "http://example.com/a?a=1&b=2"
+    assert links.normalize_url("https://user:pw@example.com:8443") == "https://example.com:8443/"
+    assert links.normalize_url("https://bücher.example/") == "https://xn--bcher-kva.example/"
+    assert links.normalize_url("https://[::1]:443/x") == "https://[::1]/x"
+    for url in ("ftp://example.com/", "javascript:alert(1)", "http://", "http://example.com:99999/", None):
+        assert links.normalize_url(url) is None, url
+    assert links.url_key("https://example.com/?fbclid=1") == links.url_key("https://EXAMPLE.com")
+
+
+def test_fetch_reads_the_head_and_revalidates(server):
+    result = _fetch(server.base_url + "/page", LOCAL)
+    assert (result.status_code, result.title, result.description) == (200, "Stand-in page", "About the page")
+    assert result.favicon_url == server.base_url + "/icon.png"
+    assert result.content_type == "text/html" and result.etag == '"v1"'
+
+    again = _fetch(result.final_url, LOCAL, etag=result.etag)
+    assert again.not_modified and again.status_code == 304
+    assert server.requests == {'full': 1, 'not_modified': 1}
+
+
+def test_redirects_are_followed_to_a_limit(server):
+    result = _fetch(f"{server.base_url}/redirect/{links.MAX_REDIRECTS}", LOCAL)
+    assert result.final_url == server.base_url + "/page" and result.title == "Stand-in page"
+    result = _fetch(f"{server.base_url}/redirect/{links.MAX_REDIRECTS + 1}", LOCAL)
+    assert result.error == "too many redirects"
+
+
+def test_redirect_to_a_private_address_is_blocked(server, monkeypatch):
+    # Treat the stand-in's 127.0.0.1 as public; 127.0.0.2 stays private
+    is_global = ipaddress.IPv4Address.is_global
+    monkeypatch.setattr(ipaddress.IPv4Address, "is_global",
+                        property(lambda address: str(address) == "127.0.0.1" or is_global.fget(address)))
+    port = server.server_address[1]
+    assert _fetch(server.base_url + "/page").title == "Stand-in page"
+    result = _fetch(f"{server.base_url}/to?url=http://127.0.0.2:{port}/page")
+    assert result.error.startswith("BlockedURL") and server.requests['full'] == 1
+
+
+def test_connection_goes_to_the_vetted_address(monkeypatch):
+    # The first lookup is public, any later one rebinds to loopback
+    answers = ["93.184.216.34", "127.0.0.1"]
+    lookups, connects = [], []
+
+    def getaddrinfo(host, *args, **kwargs):
+        lookups.append(host)
+        address = answers[min(len(lookups), len(answers)) - 1]
+        return [(socket.AF_INET, socket.SOCK_STREAM, 6, "", (address, 80))]
+
+    async def connect_tcp(self, host, port, *args, **kwargs):
+        connects.append(host)
+        raise httpcore.ConnectError("not connecting in tests")
+
+    monkeypatch.setattr(socket, "getaddrinfo", getaddrinfo)
+    monkeypatch.setattr(httpcore.AnyIOBackend, "connect_tcp", connect_tcp)
+    result = _fetch("http://rebind.test/")
+    assert result.error.startswith("ConnectError")
+    assert (lookups, connects) == (["rebind.test"], ["93.184.216.34"])
+
+
+def test_private_addresses_are_blocked():
+    for url in ("http://127.0.0.1:9/", "http://localhost/", "http://[::1]/", "http://10.0.0.1/"):
+        assert _fetch(url).error.startswith("BlockedURL"), url
+
+
+def test_a_url_shared_by_users_is_fetched_once(make_app, server):
+    app = make_app(LINK_FETCH_ALLOW_PRIVATE=True)
+    for n in range(3):
+        email = f"user{n}@example.com"
+        user_id = add_user(app, email)
+        client = app.test_client()
+        login(client, email)
+        # Everyone pastes the page with their own tracking parameters
+        response = client.post(f"/resource/{add_topic(app, user_id)}/create", data={
+            'title': "Link", 'resource_type': "link", 'url': f"{server.base_url}/page?utm_source=user{n}",
+        })
+        assert response.status_code == 302
+
+    assert server.requests['full'] == 1
+    with app.app_context():
+        assert db.session.execute(select(func.count()).select_from(LinkMetadata)).scalar() == 1
+        hashes = set(db.session.execute(select(Resource.url_hash)).scalars())
+        assert hashes == {links.url_key(server.base_url + "/page")}
+        assert db.session.execute(select(LinkMetadata.title)).scalar() == "Stand-in page"
@@ -0,0 +1,139 @@
+import sqlite3
+from datetime import datetime
+import pytest
+from click.testing import CliRunner
+from sqlalchemy import func, inspect, select
+import manage
+from app import migrations
+from app.extensions import db
+from app.models import Flashcard, LinkMetadata, StorageUsage, Topic, TopicClosure
+
+# The schema as it stood before the first migration
+BASELINE_SCHEMA = """
+CREATE TABLE user_table (
+    id INTEGER NOT NULL PRIMARY KEY,
+    username VARCHAR(120) NOT NULL,
+    email VARCHAR(120) NOT NULL UNIQUE,
+    password VARCHAR(200) NOT NULL
+);
+CREATE TABLE topic (
+    id INTEGER NOT NULL PRIMARY KEY,
+    name VARCHAR(120) NOT NULL,
+    description TEXT,
+    created_at DATETIME,
+    updated_at DATETIME,
+    user_id INTEGER NOT NULL REFERENCES user_table (id),
+    parent_topic_id INTEGER REFERENCES topic (id)
+);
+CREATE TABLE resource (
+    id INTEGER NOT NULL PRIMARY KEY,
+    title VARCHAR(200) NOT NULL,
+    resource_type VARCHAR(50) NOT NULL,
+    url TEXT,
+    file_path TEXT,
+    file_size INTEGER,
+    original_filename VARCHAR(255),
+    status VARCHAR(20) NOT NULL,
+    created_at DATETIME NOT NULL,
+    updated_at DATETIME NOT NULL,
+    user_id INTEGER NOT NULL REFERENCES user_table (id),
+    topic_id INTEGER NOT NULL REFERENCES topic (id)
+);
+CREATE INDEX ix_resource_topic_id ON resource (topic_id);
+CREATE INDEX ix_resource_user_id ON resource (user_id);
+CREATE TABLE note (
+    id INTEGER NOT NULL PRIMARY KEY,
+    title VARCHAR(200) NOT NULL,
+    content TEXT NOT NULL,
+    is_ai_generated BOOLEAN NOT NULL,
+    created_at DATETIME NOT NULL,
+    updated_at DATETIME NOT NULL,
+    user_id INTEGER NOT NULL REFERENCES user_table (id),
+    topic_id INTEGER NOT NULL REFERENCES topic (id)
+);
+CREATE INDEX ix_note_topic_id ON note (topic_id);
+CREATE INDEX ix_note_user_id ON note (user_id);
+CREATE TABLE flashcard (
+    id INTEGER NOT NULL PRIMARY KEY,
+    question TEXT NOT NULL,
+    answer TEXT NOT NULL,
+    difficulty INTEGER NOT NULL,
+    last_reviewed_at DATETIME,
+    next_review_at DATETIME,
+    created_at DATETIME NOT NULL,
+    user_id INTEGER NOT NULL REFERENCES user_table (id),
+    topic_id INTEGER NOT NULL REFERENCES topic (id)
+);
+CREATE INDEX ix_flashcard_topic_id ON flashcard (topic_id);
+CREATE INDEX ix_flashcard_user_id ON flashcard (user_id);
+
+INSERT INTO user_table VALUES (1, 'alice', 'alice@example.com', 'x');
+INSERT INTO topic VALUES (1, 'Root', NULL, NULL, NULL, 1, NULL);
+INSERT INTO topic VALUES (2, 'Child', NULL, '2024-01-01 00:00:00', '2024-01-01 00:00:00', 1, 1);
+INSERT INTO resource VALUES (1, 'Link', 'link', 'https://Example.com/page', NULL, NULL, NULL, 'active',
+                             '2024-01-01 00:00:00', '2024-01-01 00:00:00', 1, 2);
+INSERT INTO resource VALUES (2, 'File', 'pdf', NULL, 'old.pdf', 1234, 'old.pdf', 'active',
+                             '2024-01-01 00:00:00', '2024-01-01 00:00:00', 1, 2);
+INSERT INTO note VALUES (1, 'Note', 'Text', 0, '2024-01-01 00:00:00', '2024-01-01 00:00:00', 1, 2);
+INSERT INTO flashcard VALUES (1, 'Q', 'A', 1, NULL, NULL, '2024-01-01 00:00:00', 1, 2);
+"""
+
+
+@pytest.fixture
+def migrated(make_app, tmp_path):
+    path = tmp_path / "baseline.db"
+    with sqlite3.connect(path) as connection:
+        connection.executescript(BASELINE_SCHEMA)
+    app = make_app(SQLALCHEMY_DATABASE_URI=f"sqlite:///{path}")
+    with app.app_context():
+        ran = migrations.upgrade(db.engine)
+    return app, ran
+
+
+def test_migrations_bring_a_baseline_database_up_to_date(migrated):
+    app, ran = migrated
+    assert [m.version for m in ran] == [m.version for m in migrations.MIGRATIONS]
+    with app.app_context():
+        schema = inspect(db.engine)
+        columns = {table: {c['name'] for c in schema.get_columns(table)}
+                   for table in ("user_table", "resource", "note", "flashcard")}
+        assert "auth_version" in columns["user_table"]
+        assert {"content_hash", "page_count", "thumbnail_path", "url_hash"} <= columns["resource"]
+        assert {"revision", "content_hash", "rendered_html"} <= columns["note"]
+        assert {"ease_factor", "interval_days", "repetitions"} <= columns["flashcard"]
+
+        indexes = {index['name'] for table in ("topic", "resource", "note", "flashcard")
+                   for index in schema.get_indexes(table)}
+        assert {"ix_resource_content_hash", "ix_flashcard_user_next_review", "ix_topic_parent_topic_id",
+                "ix_topic_user_parent_created", "ix_resource_topic_created", "ix_note_topic_created",
+                "ix_flashcard_topic_created", "ix_resource_url_hash"} <= indexes
+        # Superseded by ix_topic_user_parent_created
+        assert "ix_topic_user_parent" not in indexes
+
+        # Backfills
+        assert db.session.execute(select(Flashcard.next_review_at)).scalar() is not None
+        assert db.session.execute(select(func.min(Topic.created_at))).scalar() == datetime(1970, 1, 1)
+        assert db.session.execute(select(func.count()).select_from(TopicClosure)).scalar() == 3
+        assert db.session.execute(select(LinkMetadata.url)).scalars().all() == ["https://example.com/page"]
+        usage = db.session.execute(select(StorageUsage.bytes_used, StorageUsage.file_count)).one()
+        assert tuple(usage) == (1234, 1)
+
+
+def test_migrations_run_once(migrated):
+    app, _ = migrated
+    with app.app_context():
+        assert migrations.pending(db.engine) == []
+        assert migrations.upgrade(db.engine) == []
+
+
+def test_check_plans_passes_on_the_migrated_baseline(migrated, monkeypatch):
+    app, _ = migrated
+    monkeypatch.setattr(manage, "app", app)
+    result = CliRunner().invoke(manage.cli, ["check-plans"])
+    assert result.exit_code == 0, result.output
+    assert "FAIL" not in result.output
+
+
+def test_check_plans_passes_on_a_scratch_database():
+    result = CliRunner().invoke(manage.cli, ["check-plans", "--scratch"])
+    assert result.exit_code == 0, result.output
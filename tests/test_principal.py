@@ -0,0 +1,41 @@
+import pytest
+from app.extensions import db
+from app.models import User
+from .helpers import login
+
+
+def _bump_auth_version(app, user_id):
+    with app.app_context():
+        db.session.get(User, user_id).auth_version += 1
+        db.session.commit()
+
+
+def _signed_in_as(client, session_id):
+    with client.session_transaction() as session:
+        session['_user_id'] = session_id
+        session['_fresh'] = True
+    return client.get("/dashboard").status_code == 200
+
+
+def test_changed_auth_version_signs_out(app, client, user_id):
+    assert client.get("/dashboard").status_code == 200
+    _bump_auth_version(app, user_id)
+    assert client.get("/dashboard").status_code == 302
+
+
+def test_bare_id_from_older_sessions_is_upgraded(app, user_id):
+    client = app.test_client()
+    assert _signed_in_as(client, str(user_id))
+    with client.session_transaction() as session:
+        assert session['_user_id'] == f"{user_id}.1"
+
+
+@pytest.mark.parametrize("cached", [False, True])
+def test_bare_id_is_stale_after_auth_version_changed(app, user_id, cached):
+    if cached:
+        login(app.test_client())
+    _bump_auth_version(app, user_id)
+    if cached:
+        # Re-cache the principal at the new version
+        login(app.test_client())
+    assert not _signed_in_as(app.test_client(), str(user_id))
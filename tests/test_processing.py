@@ -0,0 +1,32 @@
+import io
+import pytest
+from app.extensions import db
+from app.models import Resource
+from .helpers import add_topic, pdf_bytes, upload_pdf
+
+
+def _replace_file(client, resource_id, data):
+    response = client.post(f"/resource/{resource_id}/update", data={
+        'title': "Notes", 'file': (io.BytesIO(data), "notes.pdf"),
+    }, content_type="multipart/form-data")
+    assert response.status_code == 302, response.data[:300]
+
+
+def _state(app, resource_id):
+    with app.app_context():
+        resource = db.session.get(Resource, resource_id)
+        return resource.status, resource.page_count
+
+
+def test_upload_is_processed(app, client, user_id):
+    resource_id = upload_pdf(client, add_topic(app, user_id), pdf_bytes(pages=3))
+    assert _state(app, resource_id) == ('active', 3)
+
+
+@pytest.mark.parametrize("versions", [("a", "a"), ("a", "b", "a")])
+def test_reuploading_earlier_content_is_processed_again(app, client, user_id, versions):
+    files = {"a": pdf_bytes(pages=3, title="A"), "b": pdf_bytes(pages=4, title="B")}
+    resource_id = upload_pdf(client, add_topic(app, user_id), files[versions[0]])
+    for version in versions[1:]:
+        _replace_file(client, resource_id, files[version])
+    assert _state(app, resource_id) == ('active', 3)
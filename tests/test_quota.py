@@ -0,0 +1,51 @@
+from sqlalchemy import delete, select
+from app import quota
+from app.extensions import db
+from app.models import Resource, StorageUsage
+from .helpers import add_topic
+
+
+def _usage(app, user_id):
+    with app.app_context():
+        return db.session.execute(
+            select(StorageUsage.bytes_used, StorageUsage.file_count).where(StorageUsage.user_id == user_id)
+        ).one()
+
+
+def _resource(user_id, topic_id, size):
+    return Resource(title="R", resource_type="pdf", file_path=f"blobs/{size}", file_size=size,
+                    user_id=user_id, topic_id=topic_id)
+
+
+def test_first_files_in_one_flush_are_counted_once(app, user_id):
+    topic_id = add_topic(app, user_id)
+    with app.app_context():
+        db.session.add_all([_resource(user_id, topic_id, 100), _resource(user_id, topic_id, 200)])
+        db.session.commit()
+    assert _usage(app, user_id) == (300, 2)
+
+
+def test_row_created_concurrently_is_charged(app, user_id, monkeypatch):
+    topic_id = add_topic(app, user_id)
+
+    def racing_used(connection, user_id):
+        # Another request's first upload creates the row once this one has found it missing
+        connection.execute(quota._usage.insert().values(user_id=user_id, bytes_used=1000, file_count=1))
+        return None
+
+    monkeypatch.setattr(quota, "_used", racing_used)
+    with app.app_context():
+        db.session.add(_resource(user_id, topic_id, 50))
+        db.session.commit()
+    assert _usage(app, user_id) == (1050, 2)
+
+
+def test_deleting_a_topic_counts_a_missing_row_once(app, user_id, client):
+    kept, doomed = add_topic(app, user_id, "Kept"), add_topic(app, user_id, "Doomed")
+    with app.app_context():
+        db.session.add_all([_resource(user_id, kept, 100), _resource(user_id, doomed, 200)])
+        db.session.commit()
+        db.session.execute(delete(StorageUsage))
+        db.session.commit()
+    assert client.post(f"/topic/{doomed}/delete").status_code == 302
+    assert _usage(app, user_id) == (100, 1)
@@ -0,0 +1,78 @@
+import pytest
+from sqlalchemy import update
+from app.extensions import db
+from app.models import Note
+from app.rendering import note_preview, render_markdown
+from .helpers import add_topic
+
+
+@pytest.mark.parametrize("source, forbidden", [
+    ("<script>alert(1)</script>", "<script"),
+    ("<img src=x onerror=alert(1)>", "<img"),
+    ('Text <a href="#" onclick="alert(1)">x</a>', "<a href"),
+    ("[click](javascript:alert(1))", "href="),
+    ("[click](JaVaScRiPt:alert(1))", "href="),
+    ("[click](data:text/html;base64,PHNjcmlwdD4=)", "href="),
+    ("![img](javascript:alert(1))", "src="),
+    ("<javascript:alert(1)>", "href="),
+])
+def test_unsafe_markdown_is_escaped(app, source, forbidden):
+    with app.app_context():
+        html = str(render_markdown(source))
+    assert forbidden not in html
+
+
+def test_raw_html_is_shown_as_text(app):
+    with app.app_context():
+        assert str(render_markdown("<script>alert(1)</script>")) == "<p>&lt;script&gt;alert(1)&lt;/script&gt;</p>\n"
+
+
+def test_safe_markdown_still_renders(app):
+    with app.app_context():
+        html = str(render_markdown("**bold** [site](https://example.com)\n\n| a |\n|---|\n| b |"))
+    assert "<strong>bold</strong>" in html
+    assert '<a href="https://example.com">site</a>' in html
+    assert "<table>" in html
+
+
+def test_preview_is_plain_text(app):
+    with app.app_context():
+        # Left to the template's autoescaping, like any other text
+        assert note_preview("# Title\n\nSome **bold** text <b>x</b>", length=100) == "Title Some bold text <b>x</b>"
+
+
+def _note_html(client, note_id):
+    return client.get(f"/note/{note_id}/html").json['html']
+
+
+def test_stored_html_follows_the_content(app, client, user_id):
+    topic_id = add_topic(app, user_id)
+    note_id = client.post(f"/note/{topic_id}/note", json={'title': "T", 'content': "# One"}).json['note_id']
+    with app.app_context():
+        assert db.session.get(Note, note_id).rendered_html == "<h1>One</h1>\n"
+    assert _note_html(client, note_id) == "<h1>One</h1>\n"
+
+    client.post(f"/note/{note_id}/update", json={'title': "T", 'content': "*Two* <script>", 'revision': 1})
+    with app.app_context():
+        stored = db.session.get(Note, note_id).rendered_html
+    assert stored == "<p><em>Two</em> &lt;script&gt;</p>\n"
+    assert _note_html(client, note_id) == stored
+    assert stored in client.get(f"/note/notes/{note_id}").get_data(as_text=True)
+
+
+def test_stale_stored_html_is_not_served(app, client, user_id):
+    topic_id = add_topic(app, user_id)
+    note_id = client.post(f"/note/{topic_id}/note", json={'title': "T", 'content': "# One"}).json['note_id']
+    with app.app_context():
+        # Bulk statements skip the event that refreshes the stored copy
+        db.session.execute(update(Note).where(Note.id == note_id).values(content="# Two"))
+        db.session.commit()
+    assert _note_html(client, note_id) == "<h1>Two</h1>\n"
+
+
+def test_topic_page_escapes_previews(app, client, user_id):
+    topic_id = add_topic(app, user_id)
+    client.post(f"/note/{topic_id}/note", json={'title': "T", 'content': "Some <b>x</b> text"})
+    page = client.get(f"/topic/{topic_id}").get_data(as_text=True)
+    assert "Some &lt;b&gt;x&lt;/b&gt; text" in page
+    assert "<b>x</b>" not in page
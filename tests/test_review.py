@@ -0,0 +1,66 @@
+import pytest
+from app.extensions import db
+from app.models import Flashcard
+from app.review import MIN_EASE, next_state
+from .helpers import add_topic
+
+
+def test_first_two_intervals():
+    ease, interval, repetitions = next_state(2.5, 0.0, 0, 4)
+    assert (interval, repetitions) == (1.0, 1)
+    ease, interval, repetitions = next_state(ease, interval, repetitions, 4)
+    assert (interval, repetitions) == (6.0, 2)
+
+
+def test_later_intervals_grow_by_the_ease_factor():
+    assert next_state(2.5, 6.0, 2, 5) == (2.6, 15.0, 3)
+    # Grade 4 leaves the ease factor where it was
+    assert next_state(2.5, 6.0, 2, 4) == (2.5, 15.0, 3)
+
+
+def test_lapse_restarts_the_card():
+    ease, interval, repetitions = next_state(2.5, 15.0, 3, 2)
+    assert (interval, repetitions) == (1.0, 0)
+    assert ease == pytest.approx(2.18)
+
+
+def test_ease_factor_never_drops_below_the_floor():
+    ease = 1.4
+    for _ in range(3):
+        ease, _, _ = next_state(ease, 1.0, 0, 0)
+    assert ease == MIN_EASE
+
+
+@pytest.fixture
+def card_id(app, user_id):
+    with app.app_context():
+        card = Flashcard(question="Q", answer="A", user_id=user_id, topic_id=add_topic(app, user_id))
+        db.session.add(card)
+        db.session.commit()
+        return card.id
+
+
+def test_grade_schedules_the_card(client, card_id):
+    response = client.post("/review/grade", json={'grades': [{'card_id': card_id, 'grade': 4}, {'card_id': 999, 'grade': 4}]})
+    assert response.status_code == 200
+    assert [card['id'] for card in response.json['cards']] == [card_id]
+    assert response.json['not_found'] == [999]
+
+
+@pytest.mark.parametrize("body", [
+    {},
+    {'grades': []},
+    {'grades': [{'card_id': 1, 'grade': 4}] * 101},
+    {'grades': ["4"]},
+    {'grades': [{'card_id': 1}]},
+    {'grades': [{'card_id': 1, 'grade': 6}]},
+    {'grades': [{'card_id': 1, 'grade': -1}]},
+    {'grades': [{'card_id': 1, 'grade': 4.5}]},
+    {'grades': [{'card_id': 1, 'grade': True}]},
+    {'grades': [{'card_id': True, 'grade': 4}]},
+    {'grades': [{'card_id': "1", 'grade': 4}]},
+])
+def test_grade_rejects_bad_batches(client, card_id, body):
+    response = client.post("/review/grade", json=body)
+    assert response.status_code == 400
+    assert response.json['success'] is False
@@ -0,0 +1,93 @@
+from app import revisions
+from app.extensions import db
+from app.models import Note, NoteRevision
+from .helpers import add_topic, add_user, login
+
+
+def _new_note(app, client, user_id, content="one"):
+    topic_id = add_topic(app, user_id)
+    response = client.post(f"/note/{topic_id}/note", json={'title': "T", 'content': content})
+    return response.json['note_id']
+
+
+def _update(client, note_id, **data):
+    return client.post(f"/note/{note_id}/update", json={'title': "T", **data})
+
+
+def _history(app, note_id):
+    with app.app_context():
+        return [(r.revision, r.kind) for r in revisions.list_revisions(note_id)][::-1]
+
+
+def test_unchanged_save_is_not_a_revision(app, client, user_id):
+    note_id = _new_note(app, client, user_id)
+    assert _update(client, note_id, content="one", revision=1).json['revision'] == 1
+    assert _update(client, note_id, content="two", revision=1).json['revision'] == 2
+    assert _history(app, note_id) == [(1, 'snapshot'), (2, 'snapshot')]
+
+
+def test_other_column_updates_keep_the_revision(app, client, user_id):
+    note_id = _new_note(app, client, user_id)
+    client.post(f"/note/{note_id}/patch", json={'revision': 1, 'ops': [{'pos': 3, 'ins': "!"}]})
+    with app.app_context():
+        note = db.session.get(Note, note_id)
+        note.topic_id = add_topic(app, user_id, name="Other")
+        note.rendered_html = None
+        db.session.commit()
+        assert note.revision == 2
+        assert revisions.note_at_revision(note_id, 2) == ("T", "one!")
+
+
+def test_stale_update_is_a_conflict(app, client, user_id):
+    note_id = _new_note(app, client, user_id)
+    _update(client, note_id, content="two", revision=1)
+    response = _update(client, note_id, content="three", revision=1)
+    assert response.status_code == 409 and response.json['content'] == "two"
+
+
+def test_history_keeps_the_newest_snapshots(make_app):
+    app = make_app(NOTE_HISTORY_SNAPSHOTS=3)
+    user_id = add_user(app)
+    client = app.test_client()
+    login(client)
+    note_id = _new_note(app, client, user_id, content="v1")
+    for n in range(2, 7):
+        _update(client, note_id, content=f"v{n}")
+    assert _history(app, note_id) == [(4, 'snapshot'), (5, 'snapshot'), (6, 'snapshot')]
+    with app.app_context():
+        assert revisions.note_at_revision(note_id, 5) == ("T", "v5")
+        assert revisions.note_at_revision(note_id, 3) is None
+        assert db.session.query(NoteRevision).count() == 3
+
+
+def _patch(client, note_id, **data):
+    return client.post(f"/note/{note_id}/patch", json=data)
+
+
+def test_empty_patch_keeps_the_revision(app, client, user_id):
+    note_id = _new_note(app, client, user_id)
+    _patch(client, note_id, revision=1, ops=[{'pos': 3, 'ins': "!"}])
+    response = _patch(client, note_id, revision=2, ops=[])
+    assert response.status_code == 200
+    assert response.json == {'success': True, 'revision': 2}
+    assert _history(app, note_id) == [(1, 'snapshot'), (2, 'patch')]
+
+
+def test_patch_that_changes_nothing_keeps_the_revision(app, client, user_id):
+    note_id = _new_note(app, client, user_id)
+    # Deletes a character and types it back, and "changes" the title to itself
+    ops = [{'pos': 2, 'del': 1}, {'pos': 2, 'ins': "e"}]
+    response = _patch(client, note_id, revision=1, ops=ops, title="T")
+    assert response.json == {'success': True, 'revision': 1}
+    assert _history(app, note_id) == [(1, 'snapshot')]
+    # A real edit afterwards still gets the next revision
+    assert _patch(client, note_id, revision=1, ops=[], title="New").json['revision'] == 2
+    with app.app_context():
+        assert revisions.note_at_revision(note_id, 2) == ("New", "one")
+
+
+def test_patch_title_must_be_a_string(app, client, user_id):
+    note_id = _new_note(app, client, user_id)
+    response = _patch(client, note_id, revision=1, ops=[], title=["T"])
+    assert response.status_code == 400
+    assert response.json['error'] == "title must be a string"
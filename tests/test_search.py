@@ -0,0 +1,113 @@
+import pytest
+from app.extensions import db
+from app.models import Note, Resource
+from .helpers import add_topic, add_user, login
+
+
+def _add(app, model, **values):
+    with app.app_context():
+        row = model(**values)
+        db.session.add(row)
+        db.session.commit()
+        return row.id
+
+
+def _note(app, user_id, topic_id, title, content):
+    return _add(app, Note, title=title, content=content, user_id=user_id, topic_id=topic_id)
+
+
+def _link(app, user_id, topic_id, title, url):
+    return _add(app, Resource, title=title, resource_type="link", url=url, user_id=user_id, topic_id=topic_id)
+
+
+def _found(client, query):
+    return [(result['type'], result['id']) for result in client.get("/search", query_string={'q': query}).json['results']]
+
+
+@pytest.fixture(params=["fts", "like"])
+def engine_app(request, make_app):
+    return make_app(SEARCH_ENGINE="like" if request.param == "like" else "auto")
+
+
+@pytest.fixture
+def signed_in(engine_app):
+    user_id = add_user(engine_app)
+    client = engine_app.test_client()
+    login(client)
+    return engine_app, client, user_id
+
+
+def test_notes_are_indexed_as_they_change(signed_in):
+    app, client, user_id = signed_in
+    note_id = _note(app, user_id, add_topic(app, user_id), "Cells", "Mitochondria make energy.")
+    assert _found(client, "mitochondria") == [("note", note_id)]
+
+    with app.app_context():
+        db.session.get(Note, note_id).content = "Ribosomes make proteins."
+        db.session.commit()
+    assert _found(client, "mitochondria") == []
+    assert _found(client, "ribosomes") == [("note", note_id)]
+
+    assert client.post(f"/note/notes/{note_id}/delete").status_code == 302
+    assert _found(client, "ribosomes") == []
+
+
+def test_resources_are_indexed_as_they_change(signed_in):
+    app, client, user_id = signed_in
+    resource_id = _link(app, user_id, add_topic(app, user_id), "Photosynthesis primer", "https://example.com/leaf")
+    assert _found(client, "photosynthesis") == [("resource", resource_id)]
+
+    with app.app_context():
+        db.session.get(Resource, resource_id).title = "Respiration primer"
+        db.session.commit()
+    assert _found(client, "photosynthesis") == []
+    assert _found(client, "respiration") == [("resource", resource_id)]
+
+    assert client.post(f"/resource/{resource_id}/delete").status_code == 302
+    assert _found(client, "respiration") == []
+
+
+def test_deleting_a_topic_removes_its_rows(signed_in):
+    app, client, user_id = signed_in
+    topic_id = add_topic(app, user_id)
+    _note(app, user_id, topic_id, "Cells", "Mitochondria make energy.")
+    _link(app, user_id, topic_id, "Mitochondria video", "https://example.com/video")
+    assert len(_found(client, "mitochondria")) == 2
+
+    assert client.post(f"/topic/{topic_id}/delete").status_code == 302
+    assert _found(client, "mitochondria") == []
+
+
+def test_results_are_the_users_own(signed_in):
+    app, client, user_id = signed_in
+    other_id = add_user(app, "bob@example.com")
+    mine = _note(app, user_id, add_topic(app, user_id), "Mine", "Shared word osmosis.")
+    _note(app, other_id, add_topic(app, other_id), "Theirs", "Shared word osmosis.")
+    _link(app, other_id, add_topic(app, other_id), "Osmosis", "https://example.com/osmosis")
+    assert _found(client, "osmosis") == [("note", mine)]
+
+
+def test_fts_ranks_title_matches_first_and_marks_snippets(app, client, user_id):
+    topic_id = add_topic(app, user_id)
+    in_body = _note(app, user_id, topic_id, "Biology", "The <b>enzyme</b> speeds up the reaction.")
+    in_title = _note(app, user_id, topic_id, "Enzyme kinetics", "Rates of reaction.")
+
+    results = client.get("/search", query_string={'q': "enzyme"}).json['results']
+    assert [result['id'] for result in results] == [in_title, in_body]
+    assert "<mark>enzyme</mark>" in results[1]['snippet']
+    # Note content is escaped; only the match markers become tags
+    assert "&lt;b&gt;" in results[1]['snippet']
+
+
+def test_like_fallback_matches_underscores_literally(make_app):
+    app = make_app(SEARCH_ENGINE="like")
+    user_id = add_user(app)
+    client = app.test_client()
+    login(client)
+    topic_id = add_topic(app, user_id)
+    literal = _note(app, user_id, topic_id, "Python", "Names use snake_case here.")
+    _note(app, user_id, topic_id, "Other", "Names use snakeXcase here.")
+
+    results = client.get("/search", query_string={'q': "snake_case"}).json['results']
+    assert [result['id'] for result in results] == [literal]
+    assert "<mark>snake_case</mark>" in results[0]['snippet']
@@ -0,0 +1,100 @@
+"""The contract every storage driver honours, checked against the local driver and S3 (a moto server)"""
+import io
+import os
+import time
+import uuid
+import httpx
+import pytest
+from app import storage
+
+BUCKET = "studymate-test"
+
+
+@pytest.fixture(scope="module")
+def s3_endpoint():
+    boto3 = pytest.importorskip("boto3")
+    moto_server = pytest.importorskip("moto.server")
+    server = moto_server.ThreadedMotoServer(port=0, verbose=False)
+    server.start()
+    host, port = server.get_host_and_port()
+    endpoint = f"http://{host}:{port}"
+    boto3.client("s3", endpoint_url=endpoint, region_name="us-east-1",
+                 aws_access_key_id="test", aws_secret_access_key="test").create_bucket(Bucket=BUCKET)
+    yield endpoint
+    server.stop()
+
+
+@pytest.fixture(params=["local", "s3"])
+def driver(request, make_app):
+    """A driver of each kind, used inside its app's context"""
+    if request.param == "local":
+        app = make_app()
+    else:
+        app = make_app(
+            STORAGE_BACKEND="s3", S3_BUCKET=BUCKET, S3_ENDPOINT_URL=request.getfixturevalue("s3_endpoint"),
+            S3_REGION="us-east-1", S3_ADDRESSING_STYLE="path", S3_PREFIX=uuid.uuid4().hex[:8],
+            S3_ACCESS_KEY_ID="test", S3_SECRET_ACCESS_KEY="test",
+        )
+    with app.app_context():
+        yield storage.get_storage()
+
+
+@pytest.fixture
+def payload():
+    return os.urandom(300 * 1024)
+
+
+@pytest.fixture
+def key(driver, payload):
+    key = f"blobs/test/{uuid.uuid4().hex}"
+    driver.save_stream(key, io.BytesIO(payload))
+    return key
+
+
+def test_stored_file_reads_back(driver, key, payload):
+    assert driver.exists(key)
+    assert driver.size(key) == len(payload)
+    assert abs(driver.mtime(key) - time.time()) < 300
+    with driver.open(key) as body:
+        assert body.read() == payload
+    with driver.local_copy(key) as path:
+        with open(path, "rb") as f:
+            assert f.read() == payload
+    assert key in {listed for listed, _ in driver.keys()}
+
+
+def test_url(driver, key, payload):
+    url = driver.url(key, mimetype="application/pdf", download_name="notes é.pdf")
+    if driver.local_path(key) is not None:
+        # Local files are served by the app
+        assert url is None
+        return
+    response = httpx.get(url)
+    assert response.content == payload
+    assert response.headers["content-type"] == "application/pdf"
+    assert "notes%20%C3%A9.pdf" in response.headers["content-disposition"]
+
+
+def test_save_file_stores_and_consumes_the_staged_file(driver, payload):
+    key = f"blobs/test/{uuid.uuid4().hex}.png"
+    staged = os.path.join(storage.staging_dir(), f"{uuid.uuid4().hex}.part")
+    with open(staged, "wb") as f:
+        f.write(payload[:1000])
+    driver.save_file(key, staged)
+    assert driver.size(key) == 1000
+    assert not os.path.exists(staged)
+
+
+def test_delete(driver, key):
+    driver.delete(key)
+    assert not driver.exists(key)
+    # Deleting twice is not an error
+    driver.delete(key)
+    with pytest.raises(FileNotFoundError):
+        driver.open(key)
+    with pytest.raises(FileNotFoundError):
+        driver.size(key)
+
+
+def test_missing_key(driver):
+    assert not driver.exists(f"blobs/test/{uuid.uuid4().hex}")
@@ -0,0 +1,37 @@
+import pytest
+from app.extensions import db
+from app.models import Note, Resource, Topic
+from .helpers import StatementCounter, add_topic, add_user, login
+
+
+def _fill(app, user_id, topic_id, n):
+    with app.app_context():
+        for i in range(n):
+            db.session.add(Note(title=f"Note {i}", content="x" * 200, user_id=user_id, topic_id=topic_id))
+            db.session.add(Resource(title=f"Link {i}", resource_type="link", url=f"https://example.com/{i}",
+                                    user_id=user_id, topic_id=topic_id))
+            db.session.add(Topic(name=f"Sub {i}", user_id=user_id, parent_topic_id=topic_id))
+        db.session.commit()
+
+
+def _statements_for_topic_page(app, client, user_id, n):
+    topic_id = add_topic(app, user_id)
+    _fill(app, user_id, topic_id, n)
+    counter = StatementCounter(app)
+    response = client.get(f"/topic/{topic_id}")
+    assert response.status_code == 200
+    assert b"Sub 0" in response.data and b"Note 0" in response.data
+    return counter.count
+
+
+@pytest.mark.parametrize("many", [10, 50])
+def test_topic_page_statement_count_does_not_grow_with_its_contents(make_app, many):
+    counts = []
+    for n in (1, many):
+        # A fresh app each time, so no cache is warm for either render
+        app = make_app(FRAGMENT_CACHE_ENABLED=False)
+        user_id = add_user(app, f"user{n}@example.com")
+        client = app.test_client()
+        login(client, f"user{n}@example.com")
+        counts.append(_statements_for_topic_page(app, client, user_id, n))
+    assert counts[0] == counts[1], counts
@@ -0,0 +1,39 @@
+import pytest
+from sqlalchemy import delete
+from app import topic_stats
+from app.extensions import db
+from app.models import Note, Topic, TopicStats
+from .helpers import add_topic
+
+
+def _drop_rows(*topic_ids):
+    db.session.execute(delete(TopicStats).where(TopicStats.topic_id.in_(topic_ids)))
+    db.session.commit()
+
+
+@pytest.mark.parametrize("missing_row", [False, True])
+def test_batched_inserts_are_counted_once(app, user_id, missing_row):
+    topic_id = add_topic(app, user_id)
+    with app.app_context():
+        if missing_row:
+            _drop_rows(topic_id)
+        db.session.add_all([Note(title=f"N{n}", content="", user_id=user_id, topic_id=topic_id) for n in range(3)])
+        db.session.add_all([Topic(name=f"Sub {n}", user_id=user_id, parent_topic_id=topic_id) for n in range(2)])
+        db.session.commit()
+        counts = topic_stats.for_topic(user_id, topic_id)
+        assert (counts.notes, counts.subtopics) == (3, 2)
+        assert topic_stats.check(db.session.connection()) == []
+
+
+def test_moves_between_topics_without_rows(app, user_id):
+    source, target = add_topic(app, user_id, name="Source"), add_topic(app, user_id, name="Target")
+    with app.app_context():
+        notes = [Note(title=f"N{n}", content="", user_id=user_id, topic_id=source) for n in range(3)]
+        db.session.add_all(notes)
+        db.session.commit()
+        _drop_rows(source, target)
+        for note in notes[:2]:
+            db.session.refresh(note)
+            note.topic_id = target
+        db.session.commit()
+        assert topic_stats.check(db.session.connection()) == []
@@ -0,0 +1,79 @@
+from sqlalchemy import select
+from app.extensions import db
+from app.models import Topic, TopicClosure
+from app.topic_tree import _cache, _key, get_topic_tree
+from .helpers import add_topic
+
+
+def _closure(app):
+    with app.app_context():
+        return set(db.session.execute(
+            select(TopicClosure.ancestor_id, TopicClosure.descendant_id, TopicClosure.depth)
+        ).all())
+
+
+def _expected_closure(app):
+    """Every (ancestor, descendant, depth) pair, walked from parent_topic_id"""
+    with app.app_context():
+        parents = dict(db.session.execute(select(Topic.id, Topic.parent_topic_id)).all())
+    pairs = set()
+    for topic_id in parents:
+        ancestor, depth = topic_id, 0
+        while ancestor is not None:
+            pairs.add((ancestor, topic_id, depth))
+            ancestor, depth = parents[ancestor], depth + 1
+    return pairs
+
+
+def _tree(app, user_id):
+    """The cached tree as nested (name, children) tuples"""
+    def shape(nodes):
+        return sorted((node.name, shape(node.subtopics)) for node in nodes)
+
+    with app.app_context():
+        return shape(get_topic_tree(user_id))
+
+
+def test_create_move_and_delete_keep_the_closure_and_tree_current(app, client, user_id):
+    root = add_topic(app, user_id, "Root")
+    assert _tree(app, user_id) == [("Root", [])]
+
+    assert client.post(f"/topic/create?parent_id={root}", data={'name': "Child"}).status_code == 302
+    with app.app_context():
+        child = db.session.execute(select(Topic.id).where(Topic.name == "Child")).scalar()
+    grandchild = add_topic(app, user_id, "Grandchild", child)
+    other = add_topic(app, user_id, "Other")
+    assert _closure(app) == _expected_closure(app)
+    assert _tree(app, user_id) == [("Other", []), ("Root", [("Child", [("Grandchild", [])])])]
+
+    assert client.post(f"/topic/{child}/move", data={'parent_id': other}).status_code == 302
+    assert _closure(app) == _expected_closure(app)
+    assert (other, grandchild, 2) in _closure(app)
+    assert _tree(app, user_id) == [("Other", [("Child", [("Grandchild", [])])]), ("Root", [])]
+
+    assert client.post(f"/topic/{child}/delete").status_code == 302
+    assert _closure(app) == _expected_closure(app)
+    assert _tree(app, user_id) == [("Other", []), ("Root", [])]
+
+
+def test_move_into_own_subtree_is_refused(app, client, user_id):
+    root = add_topic(app, user_id, "Root")
+    child = add_topic(app, user_id, "Child", root)
+    client.post(f"/topic/{root}/move", data={'parent_id': child})
+    with app.app_context():
+        assert db.session.get(Topic, root).parent_topic_id is None
+    assert _closure(app) == _expected_closure(app)
+
+
+def test_savepoint_does_not_use_up_the_invalidation_after_commit(app, user_id):
+    topic_id = add_topic(app, user_id, "Old")
+    with app.app_context():
+        stale = get_topic_tree(user_id)
+        db.session.get(Topic, topic_id).name = "New"
+        db.session.flush()
+        with db.session.begin_nested():
+            pass
+        # A concurrent request caches the tree it can still see
+        _cache().set(_key(user_id), stale)
+        db.session.commit()
+    assert _tree(app, user_id) == [("New", [])]
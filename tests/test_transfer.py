@@ -0,0 +1,60 @@
+import json
+from sqlalchemy import func, select
+from app.extensions import db
+from app.models import Note, Topic
+from .helpers import add_user, login
+
+
+def _signed_in(make_app, batch_size):
+    app = make_app(IMPORT_BATCH_SIZE=batch_size)
+    add_user(app)
+    client = app.test_client()
+    login(client)
+    return app, client
+
+
+def _import(client, records, tail=""):
+    body = "\n".join(json.dumps(record) for record in records) + "\n" + tail
+    return client.post("/api/import", data=body, content_type="application/x-ndjson")
+
+
+def _count(app, model):
+    with app.app_context():
+        return db.session.execute(select(func.count()).select_from(model)).scalar()
+
+
+def test_import_keeps_record_order(make_app):
+    app, client = _signed_in(make_app, 50)
+    records = [{'type': "topic", 'id': 1, 'name': "T"}]
+    records += [{'type': "note", 'topic_id': 1, 'title': f"Note {n}"} for n in range(120)]
+    assert _import(client, records).json['notes'] == 120
+    with app.app_context():
+        titles = db.session.execute(select(Note.title).order_by(Note.id)).scalars().all()
+    assert titles == [f"Note {n}" for n in range(120)]
+
+
+def test_failed_import_rolls_back_the_batch_in_progress(make_app):
+    app, client = _signed_in(make_app, 2)
+    records = [{'type': "topic", 'id': 1, 'name': "T"}]
+    records += [{'type': "note", 'topic_id': 1, 'title': f"Note {n}"} for n in range(3)]
+    records.append({'type': "topic", 'id': 2, 'name': "Later"})
+
+    response = _import(client, records, tail="not json\n")
+    assert response.status_code == 400
+    assert response.json['error'] == "line 6: invalid JSON"
+    # The first batch of two notes was committed; the third note and the later topic were not
+    assert (response.json['topics'], response.json['notes']) == (1, 2)
+    assert (_count(app, Topic), _count(app, Note)) == (1, 2)
+
+
+def test_import_rejects_topics_nested_too_deep(make_app):
+    app, client = _signed_in(make_app, 50)
+    app.config['TOPIC_MAX_DEPTH'] = 3
+    records = [{'type': "topic", 'id': n, 'parent_topic_id': n - 1 if n else None, 'name': f"T{n}"}
+               for n in range(5)]
+
+    assert _import(client, records[:4]).json['topics'] == 4
+    response = _import(client, records)
+    assert response.status_code == 400
+    assert response.json['error'] == "line 5: topic 4 is nested more than 3 levels deep"
+    assert _count(app, Topic) == 4